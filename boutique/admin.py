@@ -1,10 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html  # ✅ Import correct
 from .models import (
     Categorie, Produit, Panier, LignePanier,
     Commande, LigneCommande, Paiement, Avis,
-    AdresseLivraison
+    AdresseLivraison, EvenementPaiement, ReservationStock, VenteJour
 )
+from .commandes import enregistrer_paiement
+from .ventes import tableau
 
 # Catégorie
 @admin.register(Categorie)
@@ -15,7 +23,7 @@ class CategorieAdmin(admin.ModelAdmin):
 # Produit
 @admin.register(Produit)
 class ProduitAdmin(admin.ModelAdmin):
-    list_display = ('image_preview', 'nom', 'categorie', 'prix', 'stock', 'date_ajout')
+    list_display = ('image_preview', 'nom', 'categorie', 'prix', 'stock', 'stock_reserve', 'note_moyenne', 'avis_nombre', 'date_ajout')
     list_filter = ('categorie',)
     search_fields = ('nom', 'description')
     readonly_fields = ['image_preview']
@@ -55,10 +63,30 @@ class LigneCommandeInline(admin.TabularInline):
 
 @admin.register(Commande)
 class CommandeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'utilisateur', 'date_commande', 'est_payee', 'statut')
+    # Totaux stockés sur la commande : la liste n'agrège pas les lignes
+    list_display = ('id', 'utilisateur', 'date_commande', 'sous_total', 'devise', 'nombre_articles', 'est_payee', 'statut')
     list_filter = ('statut', 'est_payee')
+    list_select_related = ('utilisateur',)
     search_fields = ('utilisateur__username', 'id')
+    readonly_fields = ('sous_total', 'nombre_articles', 'devise')
     inlines = [LigneCommandeInline]
+    actions = ['confirmer_orange_money']
+
+    # Orange Money via WhatsApp : aucun webhook, l'équipe confirme après réception
+    @admin.action(description="Confirmer le paiement Orange Money (WhatsApp)")
+    def confirmer_orange_money(self, request, queryset):
+        confirmes = 0
+        for commande in queryset.filter(est_payee=False):
+            _, cree = enregistrer_paiement(commande, commande.sous_total, "whatsapp")
+            confirmes += cree
+        self.message_user(request, f"{confirmes} paiement(s) Orange Money enregistré(s).")
+
+# Réservations de stock
+@admin.register(ReservationStock)
+class ReservationStockAdmin(admin.ModelAdmin):
+    list_display = ('commande', 'produit', 'quantite', 'statut', 'expire_le')
+    list_filter = ('statut',)
+    search_fields = ('commande__id', 'produit__nom')
 
 # Paiement
 @admin.register(Paiement)
@@ -67,9 +95,52 @@ class PaiementAdmin(admin.ModelAdmin):
     list_filter = ('methode', 'statut')
     search_fields = ('commande__id',)
 
+# Notifications de paiement
+@admin.register(EvenementPaiement)
+class EvenementPaiementAdmin(admin.ModelAdmin):
+    list_display = ('fournisseur', 'evenement_id', 'type', 'commande', 'statut', 'recu_le', 'traite_le')
+    list_filter = ('fournisseur', 'statut')
+    search_fields = ('evenement_id', 'commande__id')
+
 # Avis
 @admin.register(Avis)
 class AvisAdmin(admin.ModelAdmin):
     list_display = ('utilisateur', 'produit', 'note', 'date')
     list_filter = ('note',)
     search_fields = ('produit__nom', 'utilisateur__username')
+
+# Tableau de bord des ventes : lit les seuls agrégats (ventes.py), jamais les commandes
+@admin.register(VenteJour)
+class TableauVentesAdmin(admin.ModelAdmin):
+    PERIODES = (7, 30, 90, 365)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            jours = int(request.GET.get("jours", 30))
+        except ValueError:
+            jours = 30
+        if jours not in self.PERIODES:
+            jours = 30
+        fin = timezone.localdate()
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Tableau de bord des ventes",
+            "periodes": self.PERIODES,
+            "jours": jours,
+            "devise": settings.DEVISE,
+            **tableau(fin - timedelta(days=jours - 1), fin),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, "admin/boutique/tableau_ventes.html", context)
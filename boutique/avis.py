@@ -0,0 +1,207 @@
+# boutique/avis.py
+"""
+Avis clients : statistiques dénormalisées et pagination.
+
+Produit porte le nombre d'avis, la somme des notes, l'histogramme (avis_1 à
+avis_5) et la note moyenne. Ils sont mis à jour dans la même transaction que
+l'INSERT de l'avis, par un UPDATE relatif (avis_nombre = avis_nombre + 1...) :
+pas de lecture préalable, donc pas de perte de mise à jour entre deux avis
+simultanés. La page produit et le tri "mieux notés" de l'accueil n'ont ainsi
+jamais besoin d'agréger la table Avis.
+
+Si les compteurs dérivent (avis modifiés à la main, import...), la commande
+recalculer_avis les reconstruit en masse.
+"""
+import math
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils.dateparse import parse_datetime
+
+from .cache_catalogue import invalider
+from .models import Avis, Produit
+from .pagination import filtre_apres
+
+NOTES = (1, 2, 3, 4, 5)
+
+CHAMPS_STATISTIQUES = ('avis_nombre', 'avis_somme', *[f'avis_{note}' for note in NOTES], 'note_moyenne')
+
+ORDRE_AVIS = ('-date', '-id')
+
+CURSEUR_SALT = "boutique.avis.curseur"
+
+
+class NoteInvalide(ValueError):
+    pass
+
+
+def lire_note(valeur):
+    try:
+        note = int(valeur)
+    except (TypeError, ValueError):
+        raise NoteInvalide(valeur)
+    if note not in NOTES:
+        raise NoteInvalide(valeur)
+    return note
+
+
+def invalider_notes(produit):
+    # La carte affiche la note, et les pages triées par note peuvent changer
+    invalider(("produit", produit.id), ("categorie", produit.categorie_id), ("catalogue", None))
+
+
+# ---------------------------------------------------------------------------
+# Mise à jour incrémentale
+# ---------------------------------------------------------------------------
+
+def moyenne(somme, nombre):
+    """Expression SQL somme / nombre (0 sans avis), évaluée sur les valeurs avant UPDATE."""
+    return Case(
+        When(avis_nombre__gt=-nombre, then=Cast(F('avis_somme') + somme, FloatField()) / (F('avis_nombre') + nombre)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def appliquer_note(produit_id, note, sens):
+    """Ajoute (sens=1) ou retire (sens=-1) une note aux statistiques du produit, en un UPDATE."""
+    Produit.objects.filter(id=produit_id).update(
+        avis_nombre=F('avis_nombre') + sens,
+        avis_somme=F('avis_somme') + sens * note,
+        note_moyenne=moyenne(sens * note, sens),
+        **{f'avis_{note}': F(f'avis_{note}') + sens},
+    )
+
+
+def ajouter_avis(utilisateur, produit, note, commentaire):
+    """Crée l'avis et met à jour les statistiques du produit, atomiquement."""
+    with transaction.atomic():
+        avis = Avis.objects.create(utilisateur=utilisateur, produit=produit, note=note, commentaire=commentaire)
+        appliquer_note(produit.id, note, 1)
+        invalider_notes(produit)
+    return avis
+
+
+def retirer_avis(avis):
+    """Avis supprimé (admin, utilisateur supprimé...) : sa note sort des statistiques."""
+    if avis.note in NOTES:
+        appliquer_note(avis.produit_id, avis.note, -1)
+
+
+def statistiques(produit):
+    """Note moyenne, nombre d'avis et histogramme [(note, nombre, pourcentage)], de 5 à 1."""
+    nombre = produit.avis_nombre
+    return {
+        'nombre': nombre,
+        'moyenne': round(produit.note_moyenne, 1),
+        'histogramme': [
+            (note, getattr(produit, f'avis_{note}'), round(100 * getattr(produit, f'avis_{note}') / nombre) if nombre else 0)
+            for note in reversed(NOTES)
+        ],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Reconstruction en masse
+# ---------------------------------------------------------------------------
+
+def statistiques_par_produit(avis):
+    """{produit_id: {champ: valeur}} calculé en une requête GROUP BY sur le queryset `avis`."""
+    lignes = avis.values('produit_id').order_by('produit_id').annotate(
+        avis_nombre=Count('id'),
+        avis_somme=Sum('note'),
+        **{f'avis_{note}': Count('id', filter=Q(note=note)) for note in NOTES},
+    )
+    resultat = {}
+    for ligne in lignes:
+        produit_id = ligne.pop('produit_id')
+        ligne['note_moyenne'] = ligne['avis_somme'] / ligne['avis_nombre']
+        resultat[produit_id] = ligne
+    return resultat
+
+
+def derive(produit, attendues):
+    """Vrai si les statistiques stockées diffèrent de celles recalculées."""
+    return any(
+        not math.isclose(getattr(produit, champ), attendues[champ], abs_tol=1e-9)
+        if champ == 'note_moyenne' else getattr(produit, champ) != attendues[champ]
+        for champ in CHAMPS_STATISTIQUES
+    )
+
+
+def recalculer_statistiques(taille_lot=1000):
+    """
+    Recalcule les statistiques de tout le catalogue, par lots d'ids produits.
+    Seuls les produits dont les compteurs ont dérivé sont réécrits (bulk_update).
+    Retourne le nombre de produits corrigés.
+    """
+    vides = dict.fromkeys(CHAMPS_STATISTIQUES, 0)
+    corriges = 0
+    dernier_id = 0
+    while True:
+        produits = list(
+            Produit.objects.filter(id__gt=dernier_id).order_by('id').only('id', 'categorie_id', *CHAMPS_STATISTIQUES)[:taille_lot]
+        )
+        if not produits:
+            return corriges
+        dernier_id = produits[-1].id
+
+        calculees = statistiques_par_produit(Avis.objects.filter(produit_id__in=[p.id for p in produits]))
+        a_corriger = []
+        for produit in produits:
+            attendues = calculees.get(produit.id, vides)
+            if derive(produit, attendues):
+                for champ in CHAMPS_STATISTIQUES:
+                    setattr(produit, champ, attendues[champ])
+                a_corriger.append(produit)
+
+        if a_corriger:
+            with transaction.atomic():
+                Produit.objects.bulk_update(a_corriger, CHAMPS_STATISTIQUES)
+                for produit in a_corriger:
+                    invalider_notes(produit)
+            corriges += len(a_corriger)
+
+
+# ---------------------------------------------------------------------------
+# Pagination par curseur
+# ---------------------------------------------------------------------------
+
+def taille_page_avis():
+    return getattr(settings, "AVIS_PAGE_SIZE", 5)
+
+
+def requete_avis(produit_id, curseur, taille):
+    avis = Avis.objects.filter(produit_id=produit_id).select_related('utilisateur').order_by(*ORDRE_AVIS)
+    if curseur:
+        try:
+            date, avis_id = signing.loads(curseur, salt=CURSEUR_SALT)
+            avis = avis.filter(filtre_apres(ORDRE_AVIS, [parse_datetime(date), avis_id]))
+        except (signing.BadSignature, TypeError, ValueError):
+            pass  # curseur invalide : première page
+    return avis[:taille + 1]
+
+
+def paginer_avis(produit_id, curseur=None, taille=None):
+    """
+    Retourne (avis, curseur_suivant) : avis du plus récent au plus ancien,
+    WHERE (date, id) < (:date, :id) via l'index avis_produit_date_idx.
+    """
+    taille = taille or taille_page_avis()
+    return terminer_page_avis(list(requete_avis(produit_id, curseur, taille)), taille)
+
+
+async def apaginer_avis(produit_id, curseur=None, taille=None):
+    taille = taille or taille_page_avis()
+    return terminer_page_avis([a async for a in requete_avis(produit_id, curseur, taille)], taille)
+
+
+def terminer_page_avis(page, taille):
+    curseur_suivant = None
+    if len(page) > taille:
+        page = page[:taille]
+        curseur_suivant = signing.dumps([page[-1].date.isoformat(), page[-1].id], salt=CURSEUR_SALT)
+    return page, curseur_suivant
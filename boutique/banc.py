@@ -0,0 +1,573 @@
+# boutique/banc.py
+"""
+Banc d'essai du parcours d'achat (commandes peupler_banc, banc_essai, comparer_banc).
+
+    peupler()             données synthétiques à l'échelle voulue : catégories,
+                          produits, clients (adresse, panier), commandes payées
+                          et avis historiques. Tout est marqué (PREFIXE_*) et
+                          retiré par vider()
+    parcours_achat()      scénario d'un client connecté pour charge.parcourir() :
+                          accueil (filtres, tris), fiche produit, ajout AJAX,
+                          panier, passer_commande, confirmer_commande, paiement
+                          et retour du fournisseur
+    ServeurFournisseurs   Stripe et CinetPay locaux, avec une latence réglable
+    requetes_sql()        requêtes SQL par vue, lues sur /metriques/
+    comparer()            régressions d'une mesure par rapport à une référence
+
+Une mesure (fichier JSON) contient le résumé global et par étape de
+charge.resumer(), plus "requetes_sql" : requêtes SQL moyennes par requête HTTP.
+"""
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Q
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from .avis import NOTES
+from .cache_catalogue import invalider
+from .models import (
+    AdresseLivraison, Avis, Categorie, Commande, EvenementPaiement, LigneCommande, LignePanier, Paiement, Panier,
+    Produit, ProduitRecherche, ReservationStock,
+)
+from .pagination import ORDRES
+from .webhooks import token_cinetpay
+
+PREFIXE_CLIENT = "banc-"
+PREFIXE_CATEGORIE = "Banc "
+MOT_DE_PASSE = "banc-essai"
+
+ARTICLES = (
+    "chemise", "robe", "pagne", "boubou", "sac", "sandale", "montre", "lampe", "tapis", "panier",
+    "bol", "collier", "bracelet", "chapeau", "savon", "foulard", "ceinture", "coussin", "calebasse", "masque",
+)
+QUALIFICATIFS = (
+    "bleu", "rouge", "wax", "cuir", "bois", "brodé", "tressé", "artisanal", "coton", "bogolan",
+    "indigo", "doré", "perlé", "tissé", "kente",
+)
+VILLES = ("Dakar", "Abidjan", "Bamako", "Lomé", "Cotonou", "Ouagadougou", "Niamey", "Conakry")
+POIDS_NOTES = (5, 8, 15, 35, 37)
+COMMENTAIRES = (
+    "Très bonne qualité.", "Conforme à la description.", "Livraison rapide.", "Un peu cher.",
+    "Déçu par la finition.", "Je recommande !", "Couleurs magnifiques.", "Taille un peu petite.",
+)
+
+# Étape du parcours -> vue mesurée par le middleware de métriques (nom d'URL)
+ETAPES = {
+    "accueil": "accueil",
+    "detail_produit": "detail_produit",
+    "ajouter_au_panier_ajax": "ajouter_au_panier_ajax",
+    "panier": "panier",
+    "passer_commande": "passer_commande",
+    "confirmer_commande": "confirmer_commande",
+    "paiement": "paiement",
+    "paiement_fournisseur": "paiement",  # POST : appel au fournisseur
+    "paiement_success": "paiement_success",
+}
+METHODES = ("carte", "cinetpay")
+
+
+# ---------------------------------------------------------------------------
+# Données synthétiques
+# ---------------------------------------------------------------------------
+
+def donnees_presentes():
+    return User.objects.filter(username__startswith=PREFIXE_CLIENT).exists() or \
+        Categorie.objects.filter(nom__startswith=PREFIXE_CATEGORIE).exists()
+
+
+def vider():
+    """
+    Retire tout ce que peupler() a créé. DELETE directs, des dépendances vers
+    les parents : un delete() de l'ORM déclencherait les signaux (statistiques
+    d'avis, index, cache) ligne par ligne, soit des heures à 100 000 produits.
+    """
+    clients = User.objects.filter(username__startswith=PREFIXE_CLIENT)
+    categories = Categorie.objects.filter(nom__startswith=PREFIXE_CATEGORIE)
+    produits = Produit.objects.filter(categorie__in=categories)
+    commandes = Commande.objects.filter(utilisateur__in=clients)
+    with transaction.atomic():
+        # Commandes d'autres clients : la ligne reste, sans produit (SET_NULL)
+        LigneCommande.objects.filter(produit__in=produits).exclude(commande__in=commandes).update(produit=None)
+        EvenementPaiement.objects.filter(commande__in=commandes).update(commande=None)
+        for queryset in (
+            Avis.objects.filter(Q(utilisateur__in=clients) | Q(produit__in=produits)),
+            LignePanier.objects.filter(Q(panier__utilisateur__in=clients) | Q(produit__in=produits)),
+            Panier.objects.filter(utilisateur__in=clients),
+            ReservationStock.objects.filter(Q(commande__in=commandes) | Q(produit__in=produits)),
+            Paiement.objects.filter(commande__in=commandes),
+            LigneCommande.objects.filter(commande__in=commandes),
+            commandes,
+            AdresseLivraison.objects.filter(utilisateur__in=clients),
+            ProduitRecherche.objects.filter(produit__in=produits),
+            produits,
+            categories,
+            clients,
+        ):
+            queryset._raw_delete(queryset.db)
+    invalider(("catalogue", None), ("recherche", None))
+
+
+def par_lots(elements, taille):
+    for debut in range(0, len(elements), taille):
+        yield elements[debut:debut + taille]
+
+
+@contextmanager
+def dates_historiques(*champs):
+    """Suspend auto_now_add sur ces champs : bulk_create garde les dates fournies."""
+    for champ in champs:
+        champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ in champs:
+            champ.auto_now_add = True
+
+
+def peupler(categories=20, produits=100_000, clients=500, commandes=20_000, avis=50_000, graine=1, taille_lot=5000,
+            journal=None):
+    """
+    Crée le jeu de données du banc et retourne le nombre d'objets créés par modèle.
+    Les signaux ne sont pas déclenchés (bulk_create) : les notes sont tirées
+    d'avance pour créer les produits avec leurs statistiques d'avis, l'index de
+    recherche et les versions du cache sont mis à jour à la fin.
+    """
+    hasard = random.Random(graine)
+    maintenant = timezone.now()
+    journal = journal or (lambda message: None)
+    crees = {}
+
+    objets = Categorie.objects.bulk_create(
+        [Categorie(nom=f"{PREFIXE_CATEGORIE}{i}", description="Catégorie du banc d'essai") for i in range(categories)]
+    )
+    categorie_ids = [categorie.id for categorie in objets]
+    crees["categories"] = len(objets)
+
+    # (rang du produit, note) de chaque avis, et histogramme des notes par produit
+    notes = [(hasard.randrange(produits), hasard.choices(NOTES, POIDS_NOTES)[0]) for _ in range(avis)] if produits else []
+    histogrammes = {}
+    for rang, note in notes:
+        histogrammes.setdefault(rang, [0] * len(NOTES))[note - 1] += 1
+
+    for lot in par_lots(range(produits), taille_lot):
+        Produit.objects.bulk_create([nouveau_produit(hasard, i, categorie_ids, histogrammes.get(i)) for i in lot])
+        journal(f"produits : {lot[-1] + 1}/{produits}")
+    catalogue = list(
+        Produit.objects.filter(categorie_id__in=categorie_ids).order_by("id").values_list("id", "prix")
+    )
+    crees["produits"] = len(catalogue)
+
+    # Un mot de passe commun, haché une seule fois
+    mot_de_passe = make_password(MOT_DE_PASSE)
+    User.objects.bulk_create(
+        [User(username=f"{PREFIXE_CLIENT}{i}", email=f"{PREFIXE_CLIENT}{i}@example.com", password=mot_de_passe)
+         for i in range(clients)],
+        batch_size=taille_lot,
+    )
+    client_ids = list(User.objects.filter(username__startswith=PREFIXE_CLIENT).order_by("id").values_list("id", flat=True))
+    AdresseLivraison.objects.bulk_create(
+        [AdresseLivraison(
+            utilisateur_id=uid, nom_complet=f"Client {uid}", telephone="770000000",
+            adresse=f"{hasard.randint(1, 300)} rue du Banc", ville=hasard.choice(VILLES),
+            code_postal="00000", pays="Sénégal",
+        ) for uid in client_ids],
+        batch_size=taille_lot,
+    )
+    adresses = dict(AdresseLivraison.objects.filter(utilisateur_id__in=client_ids).values_list("utilisateur_id", "id"))
+    paniers = Panier.objects.bulk_create([Panier(utilisateur_id=uid) for uid in client_ids], batch_size=taille_lot)
+    # Un client sur deux a déjà quelques articles dans son panier
+    LignePanier.objects.bulk_create(
+        [LignePanier(panier=panier, produit_id=produit_id, quantite=hasard.randint(1, 3))
+         for panier in paniers[::2]
+         for produit_id in {hasard.choice(catalogue)[0] for _ in range(hasard.randint(1, 3))}],
+        batch_size=taille_lot,
+    )
+    crees["clients"] = len(client_ids)
+
+    champs_dates = (
+        Commande._meta.get_field("date_commande"), Paiement._meta.get_field("date_paiement"), Avis._meta.get_field("date"),
+    )
+    with dates_historiques(*champs_dates):
+        crees["commandes"] = 0
+        for lot in par_lots(range(commandes), taille_lot):
+            crees["commandes"] += creer_commandes(hasard, len(lot), client_ids, adresses, catalogue, maintenant, taille_lot)
+            journal(f"commandes : {lot[-1] + 1}/{commandes}")
+
+        crees["avis"] = 0
+        for lot in par_lots(notes, taille_lot):
+            crees["avis"] += creer_avis(hasard, lot, client_ids, catalogue, maintenant, taille_lot)
+            journal(f"avis : {crees['avis']}/{len(notes)}")
+
+    journal("index de recherche")
+    call_command("reindexer_recherche", batch=taille_lot, stdout=StringIO())
+    invalider(("catalogue", None), *[("categorie", categorie_id) for categorie_id in categorie_ids])
+    return crees
+
+
+def nouveau_produit(hasard, i, categorie_ids, histogramme=None):
+    article, qualificatif = hasard.choice(ARTICLES), hasard.choice(QUALIFICATIFS)
+    prix = hasard.randrange(500, 200_000, 100)
+    histogramme = histogramme or [0] * len(NOTES)
+    nombre, somme = sum(histogramme), sum(note * compte for note, compte in zip(NOTES, histogramme))
+    return Produit(
+        nom=f"{article.capitalize()} {qualificatif} {i}",
+        description=f"{article.capitalize()} {qualificatif} fabriqué à {hasard.choice(VILLES)}, "
+                    f"{hasard.choice(QUALIFICATIFS)} et {hasard.choice(QUALIFICATIFS)}.",
+        prix=prix,
+        prix_promo=prix * 8 // 10 if hasard.random() < 0.1 else None,
+        stock=0 if hasard.random() < 0.05 else hasard.randint(500, 5000),
+        image="produits/banc.jpg",
+        categorie_id=hasard.choice(categorie_ids),
+        avis_nombre=nombre,
+        avis_somme=somme,
+        note_moyenne=somme / nombre if nombre else 0,
+        **{f"avis_{note}": compte for note, compte in zip(NOTES, histogramme)},
+    )
+
+
+def creer_commandes(hasard, nombre, client_ids, adresses, catalogue, maintenant, taille_lot):
+    """Commandes payées réparties sur l'année écoulée, avec leurs totaux, leurs lignes et leur paiement."""
+    commandes, contenus = [], []
+    for uid in (hasard.choice(client_ids) for _ in range(nombre)):
+        contenu = [
+            (produit_id, prix, hasard.randint(1, 3)) for produit_id, prix in hasard.sample(catalogue, hasard.randint(1, 4))
+        ]
+        commandes.append(Commande(
+            utilisateur_id=uid, adresse_livraison_id=adresses[uid], est_payee=True,
+            statut=hasard.choices(("livree", "expediee", "en_attente"), (70, 20, 10))[0],
+            date_commande=maintenant - timedelta(seconds=hasard.randint(3600, 365 * 86400)),
+            sous_total=sum(prix * quantite for _, prix, quantite in contenu),
+            nombre_articles=sum(quantite for *_, quantite in contenu),
+        ))
+        contenus.append(contenu)
+    Commande.objects.bulk_create(commandes)
+    LigneCommande.objects.bulk_create([
+        LigneCommande(commande=commande, produit_id=produit_id, quantite=quantite, prix_unitaire=prix)
+        for commande, contenu in zip(commandes, contenus)
+        for produit_id, prix, quantite in contenu
+    ], batch_size=taille_lot)
+    Paiement.objects.bulk_create([
+        Paiement(
+            commande=commande, montant=commande.sous_total, methode=hasard.choice(("carte", "cinetpay", "whatsapp")),
+            date_paiement=commande.date_commande + timedelta(minutes=hasard.randint(1, 30)),
+        )
+        for commande in commandes
+    ])
+    return len(commandes)
+
+
+def creer_avis(hasard, notes, client_ids, catalogue, maintenant, taille_lot):
+    avis = Avis.objects.bulk_create([
+        Avis(utilisateur_id=hasard.choice(client_ids), produit_id=catalogue[rang][0], note=note,
+             commentaire=hasard.choice(COMMENTAIRES), date=maintenant - timedelta(seconds=hasard.randint(60, 365 * 86400)))
+        for rang, note in notes
+    ], batch_size=taille_lot)
+    return len(avis)
+
+
+# ---------------------------------------------------------------------------
+# Parcours d'achat
+# ---------------------------------------------------------------------------
+
+class DonneesParcours:
+    """Ce que le scénario tire au hasard : produits en stock, catégories, mots, clients."""
+
+    def __init__(self, produits, categories, clients, graine=1):
+        self.produits = produits
+        self.categories = categories
+        self.clients = clients  # [(nom d'utilisateur, id de l'adresse)]
+        self.graine = graine
+
+
+def donnees_parcours(nombre_clients, echantillon=5000, graine=1):
+    hasard = random.Random(graine)
+    categories = list(Categorie.objects.filter(nom__startswith=PREFIXE_CATEGORIE).values_list("id", flat=True))
+    produits = list(Produit.objects.filter(categorie_id__in=categories, stock__gt=100).values_list("id", flat=True))
+    clients = list(
+        AdresseLivraison.objects.filter(utilisateur__username__startswith=PREFIXE_CLIENT)
+        .order_by("utilisateur_id").values_list("utilisateur__username", "id")[:nombre_clients]
+    )
+    return DonneesParcours(hasard.sample(produits, min(echantillon, len(produits))), categories, clients, graine)
+
+
+def parametres_accueil(hasard, donnees):
+    """Filtres et tri d'une visite de l'accueil."""
+    parametres = {}
+    if hasard.random() < 0.5:
+        parametres["categorie"] = hasard.choice(donnees.categories)
+    if hasard.random() < 0.2:
+        parametres["q"] = hasard.choice(ARTICLES)
+    if hasard.random() < 0.1:
+        parametres["note_min"] = hasard.choice((3, 4))
+    sort = hasard.choice(list(ORDRES))
+    if sort:
+        parametres["sort"] = sort
+    return parametres
+
+
+def commande_creee(reponse):
+    """Id de la commande d'après la redirection de confirmer_commande (vers paiement), sinon None."""
+    if reponse is None or "location" not in reponse.headers:
+        return None
+    try:
+        match = resolve(urlsplit(reponse.headers["location"]).path)
+    except Resolver404:
+        return None
+    return match.kwargs["commande_id"] if match.url_name == "paiement" else None
+
+
+def parcours_achat(donnees):
+    """(preparer, scenario) pour charge.parcourir : un client du banc par visiteur."""
+
+    async def preparer(visiteur):
+        username, visiteur.adresse_id = donnees.clients[visiteur.rang]
+        visiteur.hasard = random.Random(donnees.graine + visiteur.rang)
+        await visiteur.client.get(reverse("login"))  # cookie CSRF
+        reponse = await visiteur.client.post(
+            reverse("login"), data={"username": username, "password": MOT_DE_PASSE},
+            headers={"X-CSRFToken": visiteur.csrf()},
+        )
+        if reponse.status_code != 302:
+            raise RuntimeError(f"connexion de {username} impossible (HTTP {reponse.status_code})")
+
+    async def scenario(visiteur):
+        hasard = visiteur.hasard
+        entetes = {"X-CSRFToken": visiteur.csrf(), "X-Requested-With": "XMLHttpRequest"}
+
+        await visiteur.requete("accueil", "GET", reverse("accueil"), params=parametres_accueil(hasard, donnees))
+        produit_id = hasard.choice(donnees.produits)
+        await visiteur.requete("detail_produit", "GET", reverse("detail_produit", args=[produit_id]))
+        await visiteur.requete(
+            "ajouter_au_panier_ajax", "POST", reverse("ajouter_au_panier_ajax", args=[produit_id]), headers=entetes,
+        )
+        await visiteur.requete("panier", "GET", reverse("panier"))
+        await visiteur.requete("passer_commande", "GET", reverse("passer_commande"))
+
+        reponse = await visiteur.requete(
+            "confirmer_commande", "GET", reverse("confirmer_commande", args=[visiteur.adresse_id]),
+        )
+        commande_id = commande_creee(reponse)
+        if commande_id is None:
+            visiteur.erreur("confirmer_commande")
+            return
+        chemin = reverse("paiement", args=[commande_id])
+        await visiteur.requete("paiement", "GET", chemin)
+        # Le fournisseur factice renvoie directement l'URL de succès comme page de paiement
+        reponse = await visiteur.requete(
+            "paiement_fournisseur", "POST", chemin, attendu=(302, 303),
+            data={"methode": hasard.choice(METHODES)}, headers={"X-CSRFToken": visiteur.csrf()},
+        )
+        if reponse is not None and "location" in reponse.headers:
+            await visiteur.requete("paiement_success", "GET", reponse.headers["location"], attendu=(302,))
+
+    return preparer, scenario
+
+
+# ---------------------------------------------------------------------------
+# Fournisseurs de paiement factices
+# ---------------------------------------------------------------------------
+
+class ServeurFournisseurs:
+    """
+    Serveur HTTP local qui répond comme l'API Stripe (POST /v1/checkout/sessions)
+    et CinetPay (POST /v2/payment/check pour la vérification d'une transaction,
+    tout autre POST pour l'initialisation) après `latence` secondes. La page de paiement
+    renvoyée est l'URL de succès de la boutique : le paiement « réussit » aussitôt,
+    et le fournisseur le notifie à la boutique par un webhook signé, comme en
+    production (le retour navigateur n'enregistre rien).
+    """
+
+    SECRET_STRIPE = "whsec_banc"
+    SECRET_CINETPAY = "banc-secret"
+
+    def __init__(self, hote="127.0.0.1", port=0, latence=0.05):
+        fournisseur = self
+        self.latence = latence
+        self.sessions = 0
+        self.transactions = {}  # transaction CinetPay -> (montant, devise)
+        self.notifications = httpx.Client(timeout=30)
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            def do_POST(self):
+                corps = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                time.sleep(fournisseur.latence)
+                notification = None
+                if self.path.startswith("/v2/payment/check"):
+                    montant, devise = fournisseur.transactions.get(json.loads(corps)["transaction_id"], (0, ""))
+                    reponse = {"code": "00", "data": {
+                        "status": "ACCEPTED" if devise else "REFUSED", "amount": str(montant), "currency": devise,
+                    }}
+                elif self.path.startswith("/v1/checkout/sessions"):
+                    fournisseur.sessions += 1
+                    champs = parse_qs(corps.decode())
+                    succes = champs["success_url"][0]
+                    reponse = {"id": f"cs_banc_{fournisseur.sessions}", "object": "checkout.session", "url": succes}
+                    notification = fournisseur.notification_stripe(reponse["id"], champs)
+                else:
+                    fournisseur.sessions += 1
+                    champs = json.loads(corps)
+                    reponse = {"code": "201", "payment_url": champs["return_url"]}
+                    notification = fournisseur.notification_cinetpay(champs)
+                if notification:
+                    threading.Thread(target=fournisseur.notifier, args=notification, daemon=True).start()
+                contenu = json.dumps(reponse).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(contenu)))
+                self.end_headers()
+                self.wfile.write(contenu)
+
+            def log_message(self, *args):
+                pass
+
+        self.serveur = ThreadingHTTPServer((hote, port), Gestionnaire)
+        self.serveur.daemon_threads = True
+        self.url = f"http://{hote}:{self.serveur.server_address[1]}"
+
+    def notification_stripe(self, session_id, champs):
+        """(url, corps, en-têtes) du webhook checkout.session.completed, signé comme Stripe."""
+        succes = urlsplit(champs["success_url"][0])
+        corps = json.dumps({
+            "id": f"evt_{session_id}",
+            "type": "checkout.session.completed",
+            "data": {"object": {
+                "id": session_id,
+                "payment_status": "paid",
+                "amount_total": int(champs["line_items[0][price_data][unit_amount]"][0]),
+                "currency": champs["line_items[0][price_data][currency]"][0],
+                "metadata": {"commande_id": champs["metadata[commande_id]"][0]},
+            }},
+        })
+        horodatage = int(time.time())
+        signature = hmac.new(self.SECRET_STRIPE.encode(), f"{horodatage}.{corps}".encode(), hashlib.sha256).hexdigest()
+        entetes = {"Content-Type": "application/json", "Stripe-Signature": f"t={horodatage},v1={signature}"}
+        return f"{succes.scheme}://{succes.netloc}{reverse('stripe_webhook')}", corps, entetes
+
+    def notification_cinetpay(self, champs):
+        self.transactions[champs["transaction_id"]] = (champs["amount"], champs["currency"])
+        donnees = {
+            "cpm_trans_id": champs["transaction_id"], "cpm_amount": str(champs["amount"]),
+            "cpm_currency": champs["currency"], "cpm_result": "00",
+        }
+        return champs["notify_url"], donnees, {"x-token": token_cinetpay(donnees, self.SECRET_CINETPAY)}
+
+    def notifier(self, url, corps, entetes):
+        time.sleep(self.latence)
+        envoi = {"content": corps} if isinstance(corps, str) else {"data": corps}
+        try:
+            self.notifications.post(url, headers=entetes, **envoi)
+        except httpx.HTTPError:
+            pass  # la commande reste impayée, comme un webhook perdu
+
+    def env(self):
+        """Variables d'environnement qui dirigent la boutique vers ce serveur (clés factices)."""
+        return {
+            "STRIPE_API_BASE": self.url,
+            "STRIPE_SECRET_KEY": "sk_test_banc",
+            "STRIPE_WEBHOOK_SECRET": self.SECRET_STRIPE,
+            "CINETPAY_API_URL": f"{self.url}/v1/payment",
+            "CINETPAY_CHECK_URL": f"{self.url}/v2/payment/check",
+            "CINETPAY_API_KEY": "banc",
+            "CINETPAY_SITE_ID": "banc",
+            "CINETPAY_SECRET_KEY": self.SECRET_CINETPAY,
+        }
+
+    def __enter__(self):
+        threading.Thread(target=self.serveur.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+        self.notifications.close()
+
+
+# ---------------------------------------------------------------------------
+# Requêtes SQL par vue et comparaison
+# ---------------------------------------------------------------------------
+
+SERIE_VUE = re.compile(r'^(boutique_requetes_total|boutique_sql_requetes_total)\{vue="((?:[^"\\]|\\.)*)"\} (\S+)$')
+
+
+def lire_metriques(texte):
+    """{vue: {"requetes": n, "sql": n}} d'après le texte Prometheus de la vue metriques."""
+    vues = {}
+    for ligne in texte.splitlines():
+        match = SERIE_VUE.match(ligne)
+        if match:
+            serie, vue, valeur = match.groups()
+            cle = "requetes" if serie == "boutique_requetes_total" else "sql"
+            vues.setdefault(vue, {"requetes": 0, "sql": 0})[cle] = float(valeur)
+    return vues
+
+
+async def aspirer_metriques(url_base, jeton):
+    # Relevé pris juste après la charge : les dernières requêtes peuvent encore être en cours
+    async with httpx.AsyncClient(base_url=url_base, timeout=60) as client:
+        reponse = await client.get(reverse("metriques"), headers={"Authorization": f"Bearer {jeton}"})
+        reponse.raise_for_status()
+    return lire_metriques(reponse.text)
+
+
+def requetes_sql(avant, apres):
+    """Requêtes SQL moyennes par requête HTTP entre deux relevés, par étape et sur le parcours."""
+    vides = {"requetes": 0, "sql": 0}
+    par_vue = {}
+    for vue in set(ETAPES.values()):
+        debut, fin = avant.get(vue, vides), apres.get(vue, vides)
+        par_vue[vue] = (fin["requetes"] - debut["requetes"], fin["sql"] - debut["sql"])
+
+    def moyenne(requetes, sql):
+        return round(sql / requetes, 2) if requetes else None
+
+    par_etape = {etape: moyenne(*par_vue[vue]) for etape, vue in ETAPES.items()}
+    total = moyenne(sum(requetes for requetes, _ in par_vue.values()), sum(sql for _, sql in par_vue.values()))
+    return total, par_etape
+
+
+def taux_erreur(resume):
+    return resume["erreurs"] / resume["requetes"] if resume["requetes"] else 0
+
+
+def comparer(reference, mesure, debit=0.10, latence=0.20, requetes=0.5, marge_ms=2.0, erreurs=0.01):
+    """
+    Lignes (étape, indicateur, référence, mesure, régression) du global et de
+    chaque étape de la référence. Régression : débit en baisse de plus de
+    `debit`, p95 / p99 en hausse de plus de `latence` (et de `marge_ms`),
+    requêtes SQL en hausse de plus de `requetes`, taux d'erreur en hausse de
+    plus de `erreurs`.
+    """
+    lignes = []
+    blocs = [("global", reference["global"], mesure.get("global"))]
+    blocs += [(etape, resume, mesure.get("etapes", {}).get(etape)) for etape, resume in reference.get("etapes", {}).items()]
+    for etape, avant, apres in blocs:
+        if apres is None:
+            lignes.append((etape, "absente", None, None, True))
+            continue
+        if etape == "global":
+            lignes.append((etape, "rps", avant["rps"], apres["rps"], apres["rps"] < avant["rps"] * (1 - debit)))
+        for indicateur in ("p95_ms", "p99_ms"):
+            lignes.append((etape, indicateur, avant[indicateur], apres[indicateur],
+                           apres[indicateur] > avant[indicateur] * (1 + latence) + marge_ms))
+        if avant.get("requetes_sql") is not None and apres.get("requetes_sql") is not None:
+            lignes.append((etape, "requetes_sql", avant["requetes_sql"], apres["requetes_sql"],
+                           apres["requetes_sql"] > avant["requetes_sql"] + requetes))
+        lignes.append((etape, "erreurs_%", round(taux_erreur(avant) * 100, 2), round(taux_erreur(apres) * 100, 2),
+                       taux_erreur(apres) > taux_erreur(avant) + erreurs))
+    return lignes
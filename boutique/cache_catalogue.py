@@ -0,0 +1,275 @@
+# boutique/cache_catalogue.py
+"""
+Cache versionné du catalogue : cartes produits, pages du listing et menu des catégories.
+
+Chaque objet a un compteur de version dans le cache (produit:<id>,
+categorie:<id>, et "catalogue" pour l'ensemble). Les clés des fragments
+contiennent la version : incrémenter le compteur (signaux de Produit /
+Categorie) rend l'ancien fragment inaccessible, sans suppression explicite.
+Une page d'accueil "chaude" ne fait donc aucune requête sur le catalogue.
+
+Une version est l'horodatage (µs) de la dernière modification : elle sert
+aussi de Last-Modified aux pages du catalogue (voir cache_http). Les compteurs
+expirent (CATALOGUE_VERSION_TIMEOUT) : un compteur disparu repart d'une valeur
+neuve, ce qui périme seulement les fragments qu'il couvrait.
+
+Les lectures ont une variante async (alire_versions, acartes_produits...)
+pour les vues async : cache.aget_many et ORM async, même logique.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .images import srcset, url_derive
+from .metriques import compter_cache
+
+PREFIXE = "boutique"
+
+
+def timeout():
+    return getattr(settings, "CATALOGUE_CACHE_TIMEOUT", 3600)
+
+
+def timeout_version():
+    return getattr(settings, "CATALOGUE_VERSION_TIMEOUT", 7 * 24 * 3600)
+
+
+def cle_version(nom, identifiant=None):
+    if identifiant is None:
+        return f"{PREFIXE}:v:{nom}"
+    return f"{PREFIXE}:v:{nom}:{identifiant}"
+
+
+def version_initiale():
+    # Si un compteur est évincé du cache, il repart d'une valeur jamais utilisée
+    return time.time_ns() // 1000
+
+
+def lire_versions(cles):
+    """{clé: version} pour plusieurs compteurs en un aller-retour."""
+    versions = cache.get_many(cles)
+    manquantes = {cle: version_initiale() for cle in cles if cle not in versions}
+    if manquantes:
+        cache.set_many(manquantes, timeout=timeout_version())
+        versions.update(manquantes)
+    return versions
+
+
+async def alire_versions(cles):
+    versions = await cache.aget_many(cles)
+    manquantes = {cle: version_initiale() for cle in cles if cle not in versions}
+    if manquantes:
+        await cache.aset_many(manquantes, timeout=timeout_version())
+        versions.update(manquantes)
+    return versions
+
+
+def version(nom, identifiant=None):
+    cle = cle_version(nom, identifiant)
+    return lire_versions([cle])[cle]
+
+
+async def aversion(nom, identifiant=None):
+    cle = cle_version(nom, identifiant)
+    return (await alire_versions([cle]))[cle]
+
+
+def incrementer_version(nom, identifiant=None):
+    # Horodatage strictement croissant : la nouvelle version n'a jamais servi
+    cle = cle_version(nom, identifiant)
+    cache.set(cle, max(version_initiale(), (cache.get(cle) or 0) + 1), timeout=timeout_version())
+
+
+def invalider(*versions):
+    """
+    Incrémente les compteurs [(nom, identifiant), ...] tout de suite, puis une
+    seconde fois au COMMIT si on est dans une transaction : un lecteur qui
+    aurait remis en cache l'ancienne valeur entre-temps est ainsi écarté.
+    """
+    def incrementer():
+        for nom, identifiant in versions:
+            incrementer_version(nom, identifiant)
+
+    incrementer()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(incrementer)
+
+
+def incrementer_versions_produits(produit_ids):
+    """Après un UPDATE en masse (stock...), les cartes concernées sont périmées."""
+    invalider(*[("produit", produit_id) for produit_id in produit_ids])
+
+
+# ---------------------------------------------------------------------------
+# Cartes produits (objet + fragment HTML)
+# ---------------------------------------------------------------------------
+
+def donnees_produit(produit):
+    return {
+        'id': produit.id,
+        'nom': produit.nom,
+        'prix': str(produit.prix),
+        'prix_promo': str(produit.prix_promo) if produit.prix_promo else None,
+        'stock': produit.stock,
+        'image': url_derive(produit, 'carte') or None,
+        'srcset_webp': srcset(produit, 'webp'),
+        'srcset_jpeg': srcset(produit, 'jpeg'),
+        'note_moyenne': round(produit.note_moyenne, 1),
+        'avis_nombre': produit.avis_nombre,
+        'url': reverse('detail_produit', args=[produit.id]),
+    }
+
+
+def cles_cartes(produit_ids, versions):
+    return {pid: f"{PREFIXE}:carte:{pid}:{versions[cle_version('produit', pid)]}" for pid in produit_ids}
+
+
+def rendre_cartes(cles, charges):
+    """{clé: {'donnees', 'html'}} pour les produits {id: Produit} chargés."""
+    nouvelles = {}
+    for pid, produit in charges.items():
+        donnees = donnees_produit(produit)
+        html = render_to_string('boutique/_produit_card.html', {'produit': donnees})
+        nouvelles[cles[pid]] = {'donnees': donnees, 'html': html}
+    return nouvelles
+
+
+def cartes_produits(produit_ids, produits=None):
+    """
+    Retourne, dans l'ordre de `produit_ids`, une entrée {'donnees', 'html'} par produit.
+    Seuls les produits absents du cache sont lus en base (un seul in_bulk).
+    `produits` : objets déjà chargés par l'appelant, utilisés en priorité.
+    """
+    from .models import Produit
+
+    cles = cles_cartes(produit_ids, lire_versions([cle_version("produit", pid) for pid in produit_ids]))
+    entrees = cache.get_many(list(cles.values()))
+
+    manquants = [pid for pid in produit_ids if cles[pid] not in entrees]
+    compter_cache(len(produit_ids) - len(manquants), len(manquants))
+    if manquants:
+        charges = {p.id: p for p in (produits or []) if p.id in manquants}
+        reste = [pid for pid in manquants if pid not in charges]
+        if reste:
+            charges.update(Produit.objects.in_bulk(reste))
+        nouvelles = rendre_cartes(cles, charges)
+        cache.set_many(nouvelles, timeout=timeout())
+        entrees.update(nouvelles)
+
+    return [entrees[cles[pid]] for pid in produit_ids if cles[pid] in entrees]
+
+
+async def acartes_produits(produit_ids, produits=None):
+    from .models import Produit
+
+    cles = cles_cartes(produit_ids, await alire_versions([cle_version("produit", pid) for pid in produit_ids]))
+    entrees = await cache.aget_many(list(cles.values()))
+
+    manquants = [pid for pid in produit_ids if cles[pid] not in entrees]
+    compter_cache(len(produit_ids) - len(manquants), len(manquants))
+    if manquants:
+        charges = {p.id: p for p in (produits or []) if p.id in manquants}
+        reste = [pid for pid in manquants if pid not in charges]
+        if reste:
+            charges.update(await Produit.objects.ain_bulk(reste))
+        nouvelles = rendre_cartes(cles, charges)
+        await cache.aset_many(nouvelles, timeout=timeout())
+        entrees.update(nouvelles)
+
+    return [entrees[cles[pid]] for pid in produit_ids if cles[pid] in entrees]
+
+
+# ---------------------------------------------------------------------------
+# Pages du listing
+# ---------------------------------------------------------------------------
+
+def lire_categorie(valeur):
+    """Identifiant de ?categorie=, None s'il est absent ou invalide (filtre ignoré)."""
+    try:
+        categorie_id = int(valeur)
+    except (TypeError, ValueError):
+        return None
+    return categorie_id if categorie_id > 0 else None
+
+
+def page_catalogue(params, calculer):
+    """
+    Retourne (ids, curseur_suivant, produits) d'une page du listing, mise en cache
+    par paramètres ; produits vaut None si la page vient du cache.
+    La clé dépend de la version de la catégorie filtrée (ou du catalogue entier) :
+    un produit modifié n'invalide que les pages qui peuvent le contenir.
+    `calculer()` retourne (produits, curseur_suivant) en cas d'absence.
+    """
+    categorie_id = lire_categorie(params.get('categorie'))
+    if categorie_id:
+        generation = version("categorie", categorie_id)
+    else:
+        generation = version("catalogue")
+    cle = cle_page(dict(params, categorie=categorie_id), generation)
+
+    page = cache.get(cle)
+    compter_cache(page is not None, page is None)
+    if page is not None:
+        return page[0], page[1], None
+    produits, curseur_suivant = calculer()
+    ids = [produit.id for produit in produits]
+    cache.set(cle, (ids, curseur_suivant), timeout=timeout())
+    return ids, curseur_suivant, produits
+
+
+async def apage_catalogue(params, calculer):
+    """Comme page_catalogue ; `calculer` est ici une coroutine."""
+    categorie_id = lire_categorie(params.get('categorie'))
+    if categorie_id:
+        generation = await aversion("categorie", categorie_id)
+    else:
+        generation = await aversion("catalogue")
+    cle = cle_page(dict(params, categorie=categorie_id), generation)
+
+    page = await cache.aget(cle)
+    compter_cache(page is not None, page is None)
+    if page is not None:
+        return page[0], page[1], None
+    produits, curseur_suivant = await calculer()
+    ids = [produit.id for produit in produits]
+    await cache.aset(cle, (ids, curseur_suivant), timeout=timeout())
+    return ids, curseur_suivant, produits
+
+
+def cle_page(params, generation):
+    empreinte = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+    return f"{PREFIXE}:page:{generation}:{empreinte}"
+
+
+# ---------------------------------------------------------------------------
+# Menu des catégories
+# ---------------------------------------------------------------------------
+
+def menu_categories():
+    """Catégories (id, nom) du menu, en cache : sa taille ne dépend pas du nombre de produits."""
+    from .models import Categorie
+
+    cle = f"{PREFIXE}:menu:{version('catalogue')}"
+    menu = cache.get(cle)
+    compter_cache(menu is not None, menu is None)
+    if menu is None:
+        menu = list(Categorie.objects.order_by('id').values('id', 'nom'))
+        cache.set(cle, menu, timeout=timeout())
+    return menu
+
+
+async def amenu_categories():
+    from .models import Categorie
+
+    cle = f"{PREFIXE}:menu:{await aversion('catalogue')}"
+    menu = await cache.aget(cle)
+    compter_cache(menu is not None, menu is None)
+    if menu is None:
+        menu = [categorie async for categorie in Categorie.objects.order_by('id').values('id', 'nom')]
+        await cache.aset(cle, menu, timeout=timeout())
+    return menu
@@ -0,0 +1,65 @@
+# boutique/cache_http.py
+"""
+Cache HTTP des pages du catalogue (accueil, fiche produit).
+
+Les validateurs sont calculés avant tout rendu, à partir des compteurs de
+version de cache_catalogue (horodatages de la dernière modification) :
+    ETag          = empreinte des versions lues, de l'utilisateur et du déploiement
+    Last-Modified = la plus récente de ces versions
+Une page inchangée est donc confirmée par un 304 après un seul get_many sur
+le cache, sans template ni requête sur le catalogue.
+
+Le HTML est le même pour tous les visiteurs anonymes : le badge du panier,
+les messages et le jeton CSRF n'y figurent pas (panier_badge les fournit
+après le chargement). La page peut alors être servie en cache public
+(navigateur, proxy, CDN), avec Vary: Cookie pour qu'un utilisateur connecté
+n'en reçoive jamais la version anonyme. Connecté, la page (menu à son nom,
+formulaire d'avis) reste privée mais garde ses 304.
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache_catalogue import alire_versions, cle_version
+
+
+def duree_publique():
+    return getattr(settings, "CATALOGUE_HTTP_MAX_AGE", 60)
+
+
+async def avalidateurs(user, versions, *details):
+    """
+    (etag, last_modified) d'une page qui dépend des compteurs [(nom, identifiant), ...].
+    `details` : autres éléments du rendu (ids de la page, curseur...).
+    """
+    cles = [cle_version(nom, identifiant) for nom, identifiant in versions]
+    lues = await alire_versions(cles)
+    return validateurs(user, [lues[cle] for cle in cles], details)
+
+
+def validateurs(user, versions, details=()):
+    identite = (user.pk, user.get_username()) if user.is_authenticated else None
+    empreinte = hashlib.sha1(
+        repr((getattr(settings, "VERSION_DEPLOIEMENT", ""), identite, versions, details)).encode()
+    ).hexdigest()[:24]
+    return f'"{empreinte}"', max(versions) // 1_000_000
+
+
+def non_modifiee(request, etag, last_modified):
+    """Réponse 304 si le client a déjà cette version de la page, sinon None."""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def mettre_en_cache(response, user, etag, last_modified):
+    """En-têtes de cache d'une page du catalogue (réponse complète ou 304)."""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # Le navigateur revalide à chaque fois (304), le cache partagé garde la page un moment
+        patch_cache_control(response, public=True, max_age=0, s_maxage=duree_publique())
+    patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,209 @@
+# boutique/cache_redis.py
+"""
+Backend de cache Redis du site (cache par défaut, sessions cached_db).
+
+Par rapport à django.core.cache.backends.redis.RedisCache :
+- un pool de connexions par processus et par serveur, partagé par tous les
+  threads et toutes les requêtes. Django crée une instance de cache (donc un
+  pool) par thread et par contexte async : sous ASGI, c'était une connexion
+  TCP neuve par requête ;
+- sérialisation msgpack, plus compacte et plus rapide que pickle pour les
+  dicts, listes et chaînes du catalogue. Les entiers restent bruts (incr), un
+  type inconnu de msgpack (Decimal, datetime...) est emballé en pickle, et un
+  tuple revient sous forme de liste ;
+- repli sur un cache mémoire local si Redis ne répond pas : le site reste
+  servi, avec un cache par processus, au lieu de renvoyer des erreurs. Redis
+  n'est retenté qu'après REDIS_REPLI_SECONDES. À son retour, les clés écrites
+  pendant la panne y sont supprimées : une invalidation faite entre-temps
+  (compteur de version, session fermée) n'est pas perdue.
+"""
+import logging
+import pickle
+import threading
+import time
+
+import msgpack
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+logger = logging.getLogger(__name__)
+
+EXT_PICKLE = 1
+
+# Pendant une panne, une entrée locale ne vit pas plus longtemps que ça (s) :
+# les autres processus ne voient pas ses invalidations
+TIMEOUT_REPLI = 30
+
+# Au-delà, les clés écrites pendant la panne ne sont plus mémorisées
+MAX_CLES_A_PURGER = 50000
+
+
+def emballer(objet):
+    return msgpack.ExtType(EXT_PICKLE, pickle.dumps(objet, pickle.HIGHEST_PROTOCOL))
+
+
+def deballer(code, donnees):
+    if code == EXT_PICKLE:
+        return pickle.loads(donnees)
+    return msgpack.ExtType(code, donnees)
+
+
+class SerialiseurMsgpack:
+    def dumps(self, objet):
+        # Entiers bruts, comme RedisSerializer : incr() reste atomique côté Redis
+        if type(objet) is int:
+            return objet
+        return msgpack.packb(objet, default=emballer, use_bin_type=True)
+
+    def loads(self, donnees):
+        try:
+            return int(donnees)
+        except ValueError:
+            return msgpack.unpackb(donnees, ext_hook=deballer, raw=False, strict_map_key=False)
+
+
+# ---------------------------------------------------------------------------
+# État du serveur (partagé par le processus)
+# ---------------------------------------------------------------------------
+
+class EtatServeur:
+    def __init__(self, serveur):
+        self.serveur = serveur
+        self.verrou = threading.Lock()
+        self.pools = {}
+        self.indisponible_jusqua = 0
+        self.cles_a_purger = set()
+        self.repli = LocMemCache(f"boutique-repli:{serveur}", {"OPTIONS": {"MAX_ENTRIES": 10000}})
+
+    def disponible(self):
+        return time.monotonic() >= self.indisponible_jusqua
+
+    def panne(self, erreur):
+        delai = getattr(settings, "REDIS_REPLI_SECONDES", 10)
+        with self.verrou:
+            if self.disponible():
+                logger.warning("Redis indisponible (%s) : cache mémoire local pendant %s s", erreur, delai)
+            self.indisponible_jusqua = time.monotonic() + delai
+
+    def ecrites(self, cles):
+        if len(self.cles_a_purger) < MAX_CLES_A_PURGER:
+            self.cles_a_purger.update(cles)
+        elif cles:
+            logger.error("Trop de clés écrites pendant la panne Redis : certaines ne seront pas purgées")
+
+
+_etats = {}
+_etats_verrou = threading.Lock()
+
+
+def etat_serveur(serveur):
+    etat = _etats.get(serveur)
+    if etat is None:
+        with _etats_verrou:
+            etat = _etats.setdefault(serveur, EtatServeur(serveur))
+    return etat
+
+
+# ---------------------------------------------------------------------------
+# Client et backend
+# ---------------------------------------------------------------------------
+
+def plafonner_timeout(timeout):
+    return TIMEOUT_REPLI if timeout is None else min(timeout, TIMEOUT_REPLI)
+
+
+# Opération -> (appel sur le cache local, clés écrites)
+REPLIS = {
+    "add": (lambda local, key, value, timeout: local.add(key, value, plafonner_timeout(timeout)), lambda key, *_: [key]),
+    "get": (lambda local, key, default: local.get(key, default), None),
+    "set": (lambda local, key, value, timeout: local.set(key, value, plafonner_timeout(timeout)), lambda key, *_: [key]),
+    "touch": (lambda local, key, timeout: local.touch(key, plafonner_timeout(timeout)), lambda key, *_: [key]),
+    "delete": (lambda local, key: local.delete(key), lambda key: [key]),
+    "get_many": (lambda local, keys: local.get_many(keys), None),
+    "has_key": (lambda local, key: local.has_key(key), None),
+    "incr": (lambda local, key, delta: local.incr(key, delta), lambda key, delta: [key]),
+    "set_many": (lambda local, data, timeout: local.set_many(data, plafonner_timeout(timeout)), lambda data, timeout: list(data)),
+    "delete_many": (lambda local, keys: local.delete_many(keys), lambda keys: list(keys)),
+    "clear": (lambda local: local.clear(), None),
+}
+
+
+class ClientRedis(RedisCacheClient):
+    """Client de RedisCache avec pools partagés et repli local (voir le module)."""
+
+    def __init__(self, servers, **options):
+        super().__init__(servers, **options)
+        self._etat = etat_serveur(servers[0])
+        self._erreurs = (self._lib.exceptions.ConnectionError, self._lib.exceptions.TimeoutError)
+
+    def _get_connection_pool(self, write):
+        index = self._get_connection_pool_index(write)
+        pools = self._etat.pools
+        if index not in pools:
+            with self._etat.verrou:
+                if index not in pools:
+                    pools[index] = self._pool_class.from_url(self._servers[index], **self._pool_options)
+        return pools[index]
+
+    def _purger(self):
+        """Premier appel après une panne : les clés écrites localement sont retirées de Redis."""
+        cles = list(self._etat.cles_a_purger)
+        if cles:
+            super().delete_many(cles)
+            self._etat.cles_a_purger.difference_update(cles)
+        self._etat.repli.clear()
+        logger.info("Redis rétabli : %s clé(s) écrite(s) pendant la panne purgée(s)", len(cles))
+
+    def _executer(self, nom, *args):
+        etat = self._etat
+        if etat.disponible():
+            try:
+                if etat.cles_a_purger:
+                    self._purger()
+                return getattr(super(), nom)(*args)
+            except self._erreurs as erreur:
+                etat.panne(erreur)
+        local, ecrites = REPLIS[nom]
+        if ecrites:
+            etat.ecrites(ecrites(*args))
+        return local(etat.repli, *args)
+
+    def add(self, key, value, timeout):
+        return self._executer("add", key, value, timeout)
+
+    def get(self, key, default):
+        return self._executer("get", key, default)
+
+    def set(self, key, value, timeout):
+        return self._executer("set", key, value, timeout)
+
+    def touch(self, key, timeout):
+        return self._executer("touch", key, timeout)
+
+    def delete(self, key):
+        return self._executer("delete", key)
+
+    def get_many(self, keys):
+        return self._executer("get_many", keys)
+
+    def has_key(self, key):
+        return self._executer("has_key", key)
+
+    def incr(self, key, delta):
+        return self._executer("incr", key, delta)
+
+    def set_many(self, data, timeout):
+        return self._executer("set_many", data, timeout)
+
+    def delete_many(self, keys):
+        return self._executer("delete_many", keys)
+
+    def clear(self):
+        return self._executer("clear")
+
+
+class CacheRedis(RedisCache):
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = ClientRedis
@@ -0,0 +1,209 @@
+# boutique/charge.py
+"""
+Générateur de charge HTTP : `concurrence` clients virtuels (httpx async, une
+connexion keep-alive chacun) rejouent une liste de chemins pendant `duree`
+secondes. Retourne le débit et les latences (p50, p95, p99).
+
+parcourir() fait de même avec un scénario (parcours d'achat, voir banc.py) :
+chaque visiteur a ses propres cookies, et les mesures sont ventilées par étape.
+serveur_lance() démarre le serveur mesuré dans un sous-processus.
+
+Le générateur tourne dans un seul processus : au-delà de quelques milliers
+de requêtes par seconde, c'est lui qui sature, pas le serveur mesuré.
+"""
+import asyncio
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+from django.conf import settings
+from django.urls import reverse
+
+
+def percentile(triees, p):
+    if not triees:
+        return 0.0
+    return triees[min(len(triees) - 1, int(len(triees) * p / 100))]
+
+
+def resumer(latences, erreurs, duree):
+    triees = sorted(latences)
+    return {
+        "requetes": len(triees),
+        "erreurs": erreurs,
+        "rps": len(triees) / duree if duree else 0.0,
+        "p50_ms": percentile(triees, 50) * 1000,
+        "p95_ms": percentile(triees, 95) * 1000,
+        "p99_ms": percentile(triees, 99) * 1000,
+        "max_ms": (triees[-1] if triees else 0.0) * 1000,
+    }
+
+
+async def tirer(url_base, chemins, concurrence=50, duree=10.0, timeout=10.0):
+    """Lance la charge sur `url_base` et retourne le résumé (voir resumer)."""
+    latences = []
+    erreurs = 0
+    limites = httpx.Limits(max_connections=concurrence, max_keepalive_connections=concurrence)
+
+    async with httpx.AsyncClient(base_url=url_base, timeout=timeout, limits=limites) as client:
+        fin = time.perf_counter() + duree
+
+        async def client_virtuel(rang):
+            nonlocal erreurs
+            n = rang
+            while time.perf_counter() < fin:
+                chemin = chemins[n % len(chemins)]
+                n += 1
+                debut = time.perf_counter()
+                try:
+                    reponse = await client.get(chemin)
+                    succes = reponse.status_code < 400
+                except httpx.HTTPError:
+                    succes = False
+                latences.append(time.perf_counter() - debut)
+                erreurs += 0 if succes else 1
+
+        debut = time.perf_counter()
+        await asyncio.gather(*(client_virtuel(rang) for rang in range(concurrence)))
+        return resumer(latences, erreurs, time.perf_counter() - debut)
+
+
+class Visiteur:
+    """Client virtuel d'un scénario : cookies propres, latences ventilées par étape."""
+
+    def __init__(self, client, rang):
+        self.client = client
+        self.rang = rang
+        self.mesures = None  # None pendant la préparation (connexion...) : rien n'est compté
+
+    def csrf(self):
+        return self.client.cookies.get("csrftoken", "")
+
+    def mesure(self, etape):
+        return self.mesures.setdefault(etape, {"latences": [], "erreurs": 0})
+
+    async def requete(self, etape, methode, chemin, attendu=None, **kwargs):
+        """
+        Réponse httpx, ou None si la requête a échoué (réseau, délai).
+        `attendu` : codes HTTP acceptés (par défaut, tout code < 400).
+        """
+        debut = time.perf_counter()
+        try:
+            reponse = await self.client.request(methode, chemin, **kwargs)
+            succes = reponse.status_code in attendu if attendu else reponse.status_code < 400
+        except httpx.HTTPError:
+            reponse, succes = None, False
+        if self.mesures is not None:
+            mesure = self.mesure(etape)
+            mesure["latences"].append(time.perf_counter() - debut)
+            mesure["erreurs"] += 0 if succes else 1
+        return reponse
+
+    def erreur(self, etape):
+        """Réponse HTTP correcte mais résultat inattendu (commande non créée...)."""
+        if self.mesures is not None:
+            self.mesure(etape)["erreurs"] += 1
+
+
+async def parcourir(url_base, scenario, concurrence=10, duree=10.0, timeout=10.0, preparer=None):
+    """
+    `concurrence` visiteurs exécutent `await scenario(visiteur)` en boucle pendant
+    `duree` secondes, après `await preparer(visiteur)` (non mesuré).
+    Retourne {"global": résumé, "etapes": {étape: résumé}} (voir resumer).
+    """
+    mesures = {}
+    prets = 0
+    depart = asyncio.Event()
+    bornes = {}
+
+    async def visiteur_virtuel(rang):
+        nonlocal prets
+        async with httpx.AsyncClient(base_url=url_base, timeout=timeout) as client:
+            visiteur = Visiteur(client, rang)
+            if preparer is not None:
+                await preparer(visiteur)
+            prets += 1
+            if prets == concurrence:
+                bornes["debut"] = time.perf_counter()
+                bornes["fin"] = bornes["debut"] + duree
+                depart.set()
+            await depart.wait()
+            visiteur.mesures = mesures
+            while time.perf_counter() < bornes["fin"]:
+                await scenario(visiteur)
+
+    await asyncio.gather(*(visiteur_virtuel(rang) for rang in range(concurrence)))
+    ecoule = time.perf_counter() - bornes["debut"]
+    return {
+        "global": resumer(
+            [latence for mesure in mesures.values() for latence in mesure["latences"]],
+            sum(mesure["erreurs"] for mesure in mesures.values()),
+            ecoule,
+        ),
+        "etapes": {etape: resumer(mesure["latences"], mesure["erreurs"], ecoule) for etape, mesure in mesures.items()},
+    }
+
+
+async def attendre_serveur(url_base, delai=30.0):
+    """Attend que le serveur réponde (démarrage des workers). Faux si le délai est dépassé."""
+    fin = time.perf_counter() + delai
+    async with httpx.AsyncClient(base_url=url_base, timeout=2) as client:
+        while time.perf_counter() < fin:
+            try:
+                # Page la plus légère : l'accueil peut dépasser le délai sur un gros catalogue
+                await client.get(reverse("panier_badge"))
+                return True
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    return False
+
+
+def commande_serveur(serveur, hote, port, workers, env=None):
+    """(commande, environnement) du serveur : "asgi" (uvicorn) ou "wsgi" (gunicorn, workers synchrones)."""
+    module = {"asgi": "uvicorn", "wsgi": "gunicorn"}[serveur]
+    if importlib.util.find_spec(module) is None:
+        raise RuntimeError(f"{module} n'est pas installé (voir requirements.txt)")
+
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE),
+        **(env or {}),
+    }
+    if serveur == "asgi":
+        env.update(UVICORN_HOST=hote, PORT=str(port), UVICORN_WORKERS=str(workers))
+        return [sys.executable, "-m", "ecommerce.serveur"], env
+    return [
+        sys.executable, "-m", "gunicorn", settings.WSGI_APPLICATION.replace(".application", ":application"),
+        "--bind", f"{hote}:{port}", "--workers", str(workers), "--worker-class", "sync",
+    ], env
+
+
+@contextmanager
+def serveur_lance(commande, env, url_base):
+    """Démarre le serveur mesuré, attend qu'il réponde, puis l'arrête à la sortie du bloc."""
+    journal = tempfile.TemporaryFile()
+    processus = subprocess.Popen(commande, env=env, stdout=subprocess.DEVNULL, stderr=journal)
+    try:
+        if not asyncio.run(attendre_serveur(url_base)):
+            raise RuntimeError(f"le serveur n'a pas démarré : {sortie_erreur(processus, journal)}")
+        yield processus
+    finally:
+        processus.send_signal(signal.SIGTERM)
+        try:
+            processus.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            processus.kill()
+        journal.close()
+
+
+def sortie_erreur(processus, journal):
+    if processus.poll() is None:
+        return "délai dépassé"
+    journal.seek(0)
+    return journal.read().decode(errors="replace")[-2000:]
@@ -0,0 +1,321 @@
+# boutique/commandes.py
+"""
+Création de commande : une seule transaction courte.
+
+1. réservation du stock de tous les produits en un UPDATE conditionnel
+   (stock = stock - qté WHERE stock >= qté) : pas de SELECT ... FOR UPDATE,
+   chaque ligne n'est verrouillée que le temps de cet UPDATE + COMMIT ;
+2. création de la commande, de ses lignes et des réservations (bulk_create).
+Si un produit manque, tout est annulé et StockInsuffisant est levée.
+
+Les réservations ont une durée de vie (RESERVATION_TTL_MINUTES) : payées,
+elles sont confirmées ; expirées, le balayeur (commande expirer_reservations)
+rend le stock et annule la commande. Une session de paiement qui expire
+elle-même (Stripe) est calée sur les réservations (prolonger_reservations) ;
+un paiement confirmé à la main (WhatsApp) les prolonge de
+PAIEMENT_MANUEL_RESERVATION_HEURES, le temps que l'équipe le valide.
+Un paiement reçu malgré tout après l'expiration reprend le stock s'il est
+encore disponible ; sinon il est enregistré « à rembourser » et la commande
+reste annulée.
+
+Produit.stock est le stock disponible ; Produit.stock_reserve est le total
+courant des réservations actives, tenu à jour dans les mêmes UPDATE.
+
+Commande porte son sous-total, son nombre d'articles et sa devise, calculés
+une fois dans la transaction de création et vérifiés contre les lignes
+insérées : paiement, confirmation et admin les lisent sans agréger les
+lignes. La commande calculer_totaux_commandes complète les commandes
+antérieures et répare une éventuelle dérive.
+
+L'enregistrement d'un paiement alimente aussi, dans la même transaction, les
+agrégats de ventes par jour (ventes.py).
+"""
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache_catalogue import incrementer_versions_produits
+from .temps_reel import diffuser_produits
+from .models import Commande, LigneCommande, Paiement, Produit, ReservationStock
+from .utils import charger_lignes_panier, vider_panier
+from .ventes import cumuler_paiement
+
+logger = logging.getLogger(__name__)
+
+
+class StockInsuffisant(Exception):
+    def __init__(self, produit=None):
+        self.produit = produit
+        if produit is None:
+            # Produit supprimé entre-temps
+            message = "Un produit de votre panier n'est plus disponible"
+        else:
+            message = f"Stock insuffisant pour {produit.nom} ({produit.stock} disponible(s))"
+        super().__init__(message)
+
+
+class PanierVide(Exception):
+    pass
+
+
+class TotauxIncoherents(Exception):
+    pass
+
+
+def quantite_par_produit(quantites):
+    """CASE id WHEN ... THEN qté END, pour traiter tous les produits en un seul UPDATE."""
+    return Case(
+        *[When(id=produit_id, then=Value(quantite)) for produit_id, quantite in quantites.items()],
+        output_field=IntegerField(),
+    )
+
+
+def reserver_stock(quantites):
+    """
+    Décrémente le stock de chaque produit {produit_id: quantité} en une requête.
+    Doit être appelée dans une transaction : lève StockInsuffisant sur le
+    premier produit (par id) qui n'a pas assez de stock.
+    """
+    demande = quantite_par_produit(quantites)
+    # Point de sauvegarde : en cas d'échec, l'UPDATE partiel est annulé avant de
+    # chercher le produit manquant, sinon les produits déjà décrémentés
+    # pourraient passer pour manquants.
+    sid = transaction.savepoint()
+    modifies = (
+        Produit.objects
+        .filter(id__in=quantites, stock__gte=demande)
+        .update(stock=F('stock') - demande, stock_reserve=F('stock_reserve') + demande)
+    )
+    if modifies != len(quantites):
+        transaction.savepoint_rollback(sid)
+        manquant = (
+            Produit.objects
+            .filter(id__in=quantites, stock__lt=demande)
+            .order_by('id')
+            .first()
+        )
+        raise StockInsuffisant(manquant)
+    transaction.savepoint_commit(sid)
+    incrementer_versions_produits(quantites)
+    diffuser_produits(quantites)
+
+
+def creer_commande(utilisateur, adresse):
+    """Crée la commande à partir du panier et réserve le stock, de façon atomique."""
+    lignes = list(charger_lignes_panier(utilisateur))
+    if not lignes:
+        raise PanierVide()
+
+    quantites = {}
+    for ligne in lignes:
+        quantites[ligne.produit_id] = quantites.get(ligne.produit_id, 0) + ligne.quantite
+
+    with transaction.atomic():
+        reserver_stock(quantites)
+        commande = Commande.objects.create(
+            utilisateur=utilisateur,
+            adresse_livraison=adresse,
+            sous_total=sum(ligne.quantite * ligne.prix_unitaire for ligne in lignes),
+            nombre_articles=sum(quantites.values()),
+            devise=getattr(settings, "DEVISE", "XOF"),
+        )
+        LigneCommande.objects.bulk_create([
+            LigneCommande(
+                commande=commande,
+                produit_id=ligne.produit_id,
+                quantite=ligne.quantite,
+                prix_unitaire=ligne.prix_unitaire,
+            )
+            for ligne in lignes
+        ])
+        expire_le = timezone.now() + duree_reservation()
+        ReservationStock.objects.bulk_create([
+            ReservationStock(commande=commande, produit_id=produit_id, quantite=quantite, expire_le=expire_le)
+            for produit_id, quantite in quantites.items()
+        ])
+        # Les totaux stockés doivent être ceux des lignes réellement insérées
+        # (arrondi de prix_unitaire...) : sinon rien n'est créé
+        if incoherentes(Commande.objects.filter(pk=commande.pk)).exists():
+            raise TotauxIncoherents(f"Commande {commande.pk} : totaux différents de ceux des lignes")
+    return commande
+
+
+# ---------------------------------------------------------------------------
+# Totaux dénormalisés
+# ---------------------------------------------------------------------------
+
+def totaux_lignes():
+    """Expressions (sous-total, nombre d'articles) d'une commande, en sous-requêtes sur ses lignes."""
+    lignes = LigneCommande.objects.filter(commande=OuterRef('pk')).order_by().values('commande')
+    sous_total = lignes.annotate(valeur=Sum(F('quantite') * F('prix_unitaire'))).values('valeur')
+    articles = lignes.annotate(valeur=Sum('quantite')).values('valeur')
+    montant = DecimalField(max_digits=12, decimal_places=2)
+    return (
+        Coalesce(Subquery(sous_total, output_field=montant), Value(0), output_field=montant),
+        Coalesce(Subquery(articles), Value(0), output_field=IntegerField()),
+    )
+
+
+def incoherentes(commandes):
+    """Les commandes du queryset dont les totaux stockés diffèrent de leurs lignes."""
+    sous_total, articles = totaux_lignes()
+    return commandes.annotate(calcule_sous_total=sous_total, calcule_articles=articles).exclude(
+        sous_total=F('calcule_sous_total'), nombre_articles=F('calcule_articles'),
+    )
+
+
+def calculer_totaux(commandes):
+    """Recalcule les totaux des commandes du queryset en un seul UPDATE. Retourne leur nombre."""
+    sous_total, articles = totaux_lignes()
+    return commandes.update(sous_total=sous_total, nombre_articles=articles)
+
+
+def assurer_totaux(commande):
+    """Commande antérieure aux totaux (pas encore complétée) : calculés à la première lecture."""
+    if commande.nombre_articles == 0:
+        calculer_totaux(Commande.objects.filter(pk=commande.pk))
+        commande.refresh_from_db(fields=["sous_total", "nombre_articles"])
+    return commande
+
+
+async def aassurer_totaux(commande):
+    if commande.nombre_articles == 0:
+        await sync_to_async(assurer_totaux)(commande)
+    return commande
+
+
+def duree_reservation():
+    return timedelta(minutes=getattr(settings, "RESERVATION_TTL_MINUTES", 30))
+
+
+def confirmer_reservations(commande):
+    """Paiement reçu : le stock réservé est définitivement vendu."""
+    with transaction.atomic():
+        reservations = dict(
+            ReservationStock.objects
+            .select_for_update()
+            .filter(commande=commande, statut="active")
+            .values_list("produit_id", "quantite")
+        )
+        if not reservations:
+            return
+        demande = quantite_par_produit(reservations)
+        Produit.objects.filter(id__in=reservations).update(stock_reserve=F('stock_reserve') - demande)
+        ReservationStock.objects.filter(commande=commande, statut="active").update(statut="confirmee")
+
+
+def prolonger_reservations(commande, minimum):
+    """
+    Échéance des réservations actives de la commande, repoussée à `minimum`
+    si elle tombe avant (durée minimale d'une session chez le fournisseur) :
+    la session de paiement ne survit pas au stock qu'elle vend. None si la
+    commande ne tient plus de stock.
+    """
+    with transaction.atomic():
+        echeances = list(
+            ReservationStock.objects
+            .select_for_update()
+            .filter(commande=commande, statut="active")
+            .values_list("expire_le", flat=True)
+        )
+        if not echeances:
+            return None
+        echeance = max(min(echeances), minimum)
+        ReservationStock.objects.filter(commande=commande, statut="active").update(expire_le=echeance)
+    return echeance
+
+
+def reprendre_stock(commande):
+    """
+    Paiement reçu après l'expiration : le stock rendu par le balayeur est repris
+    en un UPDATE conditionnel, pour tous les produits ou aucun. Retourne False
+    s'il n'est plus disponible.
+    """
+    expirees = dict(
+        ReservationStock.objects
+        .filter(commande=commande, statut="expiree")
+        .values_list("produit_id", "quantite")
+    )
+    if expirees:
+        demande = quantite_par_produit(expirees)
+        sid = transaction.savepoint()
+        modifies = Produit.objects.filter(id__in=expirees, stock__gte=demande).update(stock=F('stock') - demande)
+        if modifies != len(expirees):
+            transaction.savepoint_rollback(sid)
+            return False
+        transaction.savepoint_commit(sid)
+        ReservationStock.objects.filter(commande=commande, statut="expiree").update(statut="confirmee")
+        incrementer_versions_produits(expirees)
+        diffuser_produits(expirees)
+    return True
+
+
+def commande_expiree(commande):
+    """Vrai si la commande a été annulée faute de paiement dans le délai."""
+    return commande.statut == "annulee" and not commande.est_payee
+
+
+def expirer_reservations(limite=500, maintenant=None):
+    """
+    Traite un lot d'au plus `limite` réservations expirées : stock rendu,
+    réservations marquées expirées, commandes non payées annulées.
+    Retourne le nombre de réservations traitées (0 quand il n'y a plus rien).
+    Chaque lot est une transaction courte pour ne pas bloquer les produits.
+    """
+    maintenant = maintenant or timezone.now()
+    with transaction.atomic():
+        expirees = ReservationStock.objects.filter(statut="active", expire_le__lte=maintenant).order_by("expire_le", "id")
+        if transaction.get_connection().features.has_select_for_update_skip_locked:
+            # Plusieurs balayeurs peuvent tourner sans se gêner
+            expirees = expirees.select_for_update(skip_locked=True)
+        lot = list(expirees.values_list("id", "produit_id", "quantite", "commande_id")[:limite])
+        if not lot:
+            return 0
+
+        rendues = {}
+        for _, produit_id, quantite, _ in lot:
+            rendues[produit_id] = rendues.get(produit_id, 0) + quantite
+        demande = quantite_par_produit(rendues)
+        Produit.objects.filter(id__in=rendues).update(
+            stock=F('stock') + demande,
+            stock_reserve=F('stock_reserve') - demande,
+        )
+        ReservationStock.objects.filter(id__in=[r[0] for r in lot]).update(statut="expiree")
+        Commande.objects.filter(id__in={r[3] for r in lot}, est_payee=False).update(statut="annulee")
+        incrementer_versions_produits(rendues)
+        diffuser_produits(rendues)
+    return len(lot)
+
+
+def enregistrer_paiement(commande, montant, methode):
+    """
+    Enregistre le paiement d'une commande, une seule fois : webhook en double
+    ou rejoué n'a aucun effet supplémentaire. Retourne (paiement, créé).
+    Commande expirée entre-temps : le stock est repris, ou, s'il est vendu, le
+    paiement est enregistré « a_rembourser » et la commande reste annulée.
+    """
+    with transaction.atomic():
+        commande = Commande.objects.select_for_update().get(pk=commande.pk)
+        paiement, cree = Paiement.objects.get_or_create(
+            commande=commande,
+            defaults={"montant": montant, "methode": methode},
+        )
+        if cree and commande_expiree(commande) and not reprendre_stock(commande):
+            paiement.statut = "a_rembourser"
+            paiement.save(update_fields=["statut"])
+            logger.warning("Paiement %s de la commande %s reçu après expiration, stock épuisé : à rembourser",
+                           methode, commande.pk)
+        elif cree:
+            confirmer_reservations(commande)
+            commande.est_payee = True
+            commande.statut = "en_attente"
+            commande.save(update_fields=["est_payee", "statut"])
+            vider_panier(commande.utilisateur_id)
+            cumuler_paiement(paiement)
+    return paiement, cree
@@ -0,0 +1,56 @@
+# boutique/consumers.py
+"""
+WebSocket /ws/boutique/ : badge du panier et stock / prix en direct.
+
+Le client envoie {"suivre": [ids]} pour les produits affichés (cumulatif,
+le scroll infini en ajoute) et reçoit :
+    {"type": "panier", "total_items": 3}
+    {"type": "produit", "id": 12, "stock": 0, "prix": "1000.00", "prix_promo": null}
+
+Aucune tâche ni requête par connexion une fois établie : une connexion
+inactive ne coûte que sa socket et ses abonnements de groupe.
+"""
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .temps_reel import groupe_panier, groupe_produit
+
+# Abonnements produits par connexion (borne la mémoire et le travail de la couche)
+MAX_PRODUITS_SUIVIS = 200
+
+
+class BoutiqueConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        self.groupes = set()
+        await self.accept()
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            await self.rejoindre(groupe_panier(user.pk))
+
+    async def disconnect(self, code):
+        for groupe in self.groupes:
+            await self.channel_layer.group_discard(groupe, self.channel_name)
+
+    async def rejoindre(self, groupe):
+        if groupe not in self.groupes:
+            self.groupes.add(groupe)
+            await self.channel_layer.group_add(groupe, self.channel_name)
+
+    async def receive_json(self, contenu, **kwargs):
+        ids = contenu.get("suivre") if isinstance(contenu, dict) else None
+        if not isinstance(ids, list):
+            return
+        for produit_id in ids:
+            if len(self.groupes) >= MAX_PRODUITS_SUIVIS:
+                break
+            if isinstance(produit_id, int) and produit_id > 0:
+                await self.rejoindre(groupe_produit(produit_id))
+
+    async def panier_maj(self, message):
+        await self.send_json({"type": "panier", "total_items": message["total_items"]})
+
+    async def produit_maj(self, message):
+        await self.send_json({
+            "type": "produit",
+            **{cle: message[cle] for cle in ("id", "stock", "prix", "prix_promo")},
+        })
@@ -1,21 +1,36 @@
 # context_processors.py
-from .models import Categorie,Panier
+# Valeurs paresseuses : la base (ou le cache) n'est interrogée que si le
+# template lit réellement `categories` ou `panier_count`.
+# Une vue async appelle d'abord aprecharger(request) : ces valeurs sont alors
+# déjà sur la requête, et le rendu (synchrone) ne lit plus rien en base.
+from django.utils.functional import SimpleLazyObject
 
-def categories_processor(request):
-    return {'categories': Categorie.objects.all()}
+from .cache_catalogue import amenu_categories, menu_categories
+from .utils import anombre_articles_panier, nombre_articles_panier
 
+def categories_processor(request):
+    if hasattr(request, '_menu_categories'):
+        return {'categories': request._menu_categories}
+    return {'categories': SimpleLazyObject(menu_categories)}
 
 
 
-from .models import Panier
 
 def panier_info(request):
-    if request.user.is_authenticated:
-        panier, created = Panier.objects.get_or_create(utilisateur=request.user)
-        total_items = panier.get_item_count()
-    else:
-        total_items = 0
-
     return {
-        'panier_count': total_items
+        'panier_count': SimpleLazyObject(lambda: nombre_articles_panier(request))
     }
+
+
+async def aprecharger(request, badge=True):
+    """
+    Début d'une vue async : utilisateur, menu et compteur du panier sont lus
+    en async et mémorisés sur la requête pour les context processors.
+    `badge=False` : la page charge le badge elle-même (pages en cache public).
+    """
+    # request.user est un objet paresseux synchrone : on le remplace par l'utilisateur chargé
+    request.user = await request.auser()
+    request._menu_categories = await amenu_categories()
+    if badge:
+        await anombre_articles_panier(request)
+    return request.user
@@ -0,0 +1,157 @@
+# boutique/images.py
+"""
+Déclinaisons responsives de Produit.image.
+
+Pour chaque image : trois largeurs (miniature, carte, détail) en WebP et JPEG,
+rangées sous un nom dérivé du contenu (produits/derives/<sha256>/<taille>.<ext>) :
+une même image n'est jamais recalculée, et les URLs peuvent être mises en
+cache indéfiniment. Les chemins sont mémorisés dans Produit.images_derivees.
+
+La génération se fait hors requête (file "thread" par défaut, comme les
+webhooks) ; la commande generer_images_derivees rattrape le catalogue
+existant en parallèle sur tous les cœurs.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Largeur maximale (px) de chaque déclinaison
+TAILLES = {
+    "miniature": 160,
+    "carte": 480,
+    "detail": 1000,
+}
+
+FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def empreinte(contenu):
+    return hashlib.sha256(contenu).hexdigest()[:24]
+
+
+def chemin_derive(source, taille, extension):
+    return f"produits/derives/{source}/{taille}.{extension}"
+
+
+def encoder(image, largeur, extension):
+    copie = image.copy()
+    copie.thumbnail((largeur, largeur * 4), Image.LANCZOS)
+    if extension == "jpeg" and copie.mode not in ("RGB", "L"):
+        copie = copie.convert("RGB")
+    tampon = BytesIO()
+    copie.save(tampon, **FORMATS[extension])
+    return tampon.getvalue()
+
+
+def generer_derives(produit_id):
+    """Calcule les déclinaisons manquantes d'un produit et les enregistre. Retourne le dict des chemins."""
+    from .cache_catalogue import incrementer_versions_produits
+    from .models import Produit
+
+    produit = Produit.objects.filter(id=produit_id).only("id", "image", "images_derivees").first()
+    if produit is None or not produit.image:
+        return {}
+
+    with produit.image.open("rb") as fichier:
+        contenu = fichier.read()
+    source = empreinte(contenu)
+    if produit.images_derivees.get("source") == source:
+        return produit.images_derivees
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(contenu)))
+    derives = {"source": source}
+    for taille, largeur in TAILLES.items():
+        for extension in FORMATS:
+            chemin = chemin_derive(source, taille, extension)
+            if not default_storage.exists(chemin):
+                default_storage.save(chemin, ContentFile(encoder(image, largeur, extension)))
+            derives[f"{taille}_{extension}"] = chemin
+
+    # update() : pas de post_save, donc pas de nouvelle génération en boucle
+    Produit.objects.filter(id=produit_id).update(images_derivees=derives)
+    incrementer_versions_produits([produit_id])
+    return derives
+
+
+# ---------------------------------------------------------------------------
+# URLs pour les templates
+# ---------------------------------------------------------------------------
+
+def url_derive(produit, taille, extension="jpeg"):
+    """URL d'une déclinaison, ou de l'image d'origine si elle n'est pas encore prête."""
+    chemin = (produit.images_derivees or {}).get(f"{taille}_{extension}")
+    if chemin:
+        return default_storage.url(chemin)
+    return produit.image.url if produit.image else ""
+
+
+def srcset(produit, extension="jpeg"):
+    """Valeur de l'attribut srcset ("url 160w, url 480w, ..."), vide si pas de déclinaisons."""
+    derives = produit.images_derivees or {}
+    return ", ".join(
+        f"{default_storage.url(derives[cle])} {largeur}w"
+        for taille, largeur in TAILLES.items()
+        if (cle := f"{taille}_{extension}") in derives
+    )
+
+
+# ---------------------------------------------------------------------------
+# File d'attente
+# ---------------------------------------------------------------------------
+
+class FileImages:
+    """Confie la génération selon IMAGES_DERIVEES_FILE ("thread", "worker", "synchrone")."""
+
+    def __init__(self):
+        self.executor = None
+
+    def soumettre(self, produit_id):
+        mode = getattr(settings, "IMAGES_DERIVEES_FILE", "thread")
+        if mode == "synchrone":
+            generer_derives(produit_id)
+        elif mode == "thread":
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="images")
+            self.executor.submit(self.generer_en_arriere_plan, produit_id)
+        # mode "worker" : generer_images_derivees --boucle s'en charge
+
+    def generer_en_arriere_plan(self, produit_id):
+        try:
+            generer_derives(produit_id)
+        except Exception:
+            logger.exception("Échec de la génération des images du produit %s", produit_id)
+        finally:
+            close_old_connections()
+
+
+file_images = FileImages()
+
+
+def planifier_derives(produit_id):
+    """
+    Après un nouvel upload : les anciennes déclinaisons sont oubliées tout de
+    suite (l'image d'origine est servie en attendant), puis la génération est
+    lancée une fois la transaction validée.
+    """
+    from .models import Produit
+
+    Produit.objects.filter(id=produit_id).update(images_derivees={})
+    transaction.on_commit(lambda: file_images.soumettre(produit_id))
+
+
+def produits_sans_derives():
+    from .models import Produit
+
+    return Produit.objects.exclude(image='').filter(images_derivees={})
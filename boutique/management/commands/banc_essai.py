@@ -0,0 +1,120 @@
+import asyncio
+import json
+import secrets
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from boutique.banc import (
+    ETAPES, ServeurFournisseurs, aspirer_metriques, donnees_parcours, parcours_achat, requetes_sql,
+)
+from boutique.charge import commande_serveur, parcourir, serveur_lance
+from boutique.models import Produit
+
+COLONNES = ("requetes", "erreurs", "rps", "p50_ms", "p95_ms", "p99_ms", "requetes_sql")
+
+
+class Command(BaseCommand):
+    help = (
+        "Banc d'essai du parcours d'achat sur les données de peupler_banc : lance le serveur "
+        "avec des fournisseurs de paiement factices, puis mesure débit, latences (p50, p95, p99) "
+        "et requêtes SQL par requête, au global et par étape. --json écrit la mesure, "
+        "à comparer ensuite à une référence avec comparer_banc."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrence", type=int, default=20, help="Clients connectés simultanés")
+        parser.add_argument("--duree", type=float, default=30, help="Secondes de mesure")
+        parser.add_argument("--echauffement", type=float, default=5, help="Secondes de charge non comptées")
+        parser.add_argument("--timeout", type=float, default=60, help="Délai d'une requête (s)")
+        parser.add_argument("--serveur", choices=("asgi", "wsgi"), default="asgi")
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Processus serveur (les requêtes SQL sont lues sur un seul : exactes avec 1)",
+        )
+        parser.add_argument("--hote", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--url", help="Serveur déjà lancé (il doit utiliser le fournisseur factice)")
+        parser.add_argument("--jeton", default="", help="METRIQUES_JETON du serveur --url (requêtes SQL)")
+        parser.add_argument("--latence-fournisseur", type=float, default=50, help="Réponse des fournisseurs factices (ms)")
+        parser.add_argument("--port-fournisseur", type=int, default=0)
+        parser.add_argument("--graine", type=int, default=1)
+        parser.add_argument("--json", help="Écrit la mesure dans ce fichier")
+
+    def handle(self, *args, **options):
+        donnees = donnees_parcours(options["concurrence"], graine=options["graine"])
+        if len(donnees.clients) < options["concurrence"] or not donnees.produits:
+            raise CommandError(
+                f"Il faut {options['concurrence']} clients du banc et des produits en stock : lancez peupler_banc"
+            )
+
+        parametres = {
+            "concurrence": options["concurrence"],
+            "duree": options["duree"],
+            "serveur": "url" if options["url"] else options["serveur"],
+            "workers": None if options["url"] else options["workers"],
+            "latence_fournisseur_ms": options["latence_fournisseur"],
+            "produits": Produit.objects.count(),
+        }
+        try:
+            fournisseurs = ServeurFournisseurs(
+                options["hote"], options["port_fournisseur"], options["latence_fournisseur"] / 1000,
+            )
+            with fournisseurs as fournisseur:
+                if options["url"]:
+                    self.stdout.write(f"Fournisseur factice : {fournisseur.url} ({fournisseur.env()})")
+                    resultats = self.mesurer(options["url"].rstrip("/"), options["jeton"], donnees, options)
+                else:
+                    jeton = secrets.token_urlsafe(16)
+                    url_base = f"http://{options['hote']}:{options['port']}"
+                    commande, env = commande_serveur(
+                        options["serveur"], options["hote"], options["port"], options["workers"],
+                        env={**fournisseur.env(), "METRIQUES_JETON": jeton},
+                    )
+                    self.stdout.write(f"{options['serveur']} : {' '.join(commande)}")
+                    with serveur_lance(commande, env, url_base):
+                        resultats = self.mesurer(url_base, jeton, donnees, options)
+        except RuntimeError as erreur:
+            raise CommandError(str(erreur))
+
+        mesure = {"date": timezone.now().isoformat(), "parametres": parametres, **resultats}
+        self.afficher(mesure)
+        if options["json"]:
+            with open(options["json"], "w") as fichier:
+                json.dump(mesure, fichier, indent=2)
+
+    def mesurer(self, url_base, jeton, donnees, options):
+        preparer, scenario = parcours_achat(donnees)
+        if options["echauffement"]:
+            asyncio.run(parcourir(
+                url_base, scenario, options["concurrence"], options["echauffement"], options["timeout"], preparer,
+            ))
+
+        avant = asyncio.run(aspirer_metriques(url_base, jeton)) if jeton else None
+        resultats = asyncio.run(parcourir(
+            url_base, scenario, options["concurrence"], options["duree"], options["timeout"], preparer,
+        ))
+        if avant is None:
+            self.stdout.write(self.style.WARNING("Sans --jeton, les requêtes SQL ne sont pas mesurées"))
+            return resultats
+
+        total, par_etape = requetes_sql(avant, asyncio.run(aspirer_metriques(url_base, jeton)))
+        resultats["global"]["requetes_sql"] = total
+        for etape, resume in resultats["etapes"].items():
+            resume["requetes_sql"] = par_etape.get(etape)
+        return resultats
+
+    def afficher(self, mesure):
+        self.stdout.write("")
+        self.stdout.write(f"{'étape':<24}" + "".join(f"{colonne:>14}" for colonne in COLONNES))
+        lignes = [("global", mesure["global"])]
+        lignes += [(etape, mesure["etapes"][etape]) for etape in ETAPES if etape in mesure["etapes"]]
+        for etape, resume in lignes:
+            self.stdout.write(f"{etape:<24}" + "".join(self.cellule(resume.get(colonne)) for colonne in COLONNES))
+        if mesure["global"]["erreurs"]:
+            self.stdout.write(self.style.WARNING(f"{mesure['global']['erreurs']} requête(s) en erreur"))
+
+    def cellule(self, valeur):
+        if valeur is None:
+            return f"{'-':>14}"
+        return f"{valeur:>14.1f}" if isinstance(valeur, float) else f"{valeur:>14}"
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from boutique.commandes import calculer_totaux, incoherentes
+from boutique.models import Commande
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule le sous-total et le nombre d'articles des commandes qui ne les ont pas encore "
+        "(commandes antérieures à ces champs), par lots d'ids. --verifier contrôle toutes les "
+        "commandes et corrige celles dont les totaux diffèrent de leurs lignes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1000, help="Commandes par lot")
+        parser.add_argument("--verifier", action="store_true", help="Contrôle et corrige toutes les commandes")
+
+    def handle(self, *args, **options):
+        commandes = Commande.objects.all() if options["verifier"] else Commande.objects.filter(nombre_articles=0)
+        total = 0
+        dernier_id = 0
+        while True:
+            ids = list(commandes.filter(id__gt=dernier_id).order_by("id").values_list("id", flat=True)[:options["batch"]])
+            if not ids:
+                break
+            lot = Commande.objects.filter(id__in=ids)
+            # Un UPDATE par lot, transaction courte
+            with transaction.atomic():
+                total += calculer_totaux(incoherentes(lot) if options["verifier"] else lot)
+            dernier_id = ids[-1]
+        if options["verifier"]:
+            self.stdout.write(self.style.SUCCESS(f"{total} commande(s) corrigée(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{total} commande(s) complétée(s)."))
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from boutique.banc import comparer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare une mesure de banc_essai à une référence (fichiers JSON) ; "
+        "échoue si le débit, les latences p95 / p99, les requêtes SQL ou les erreurs régressent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("reference")
+        parser.add_argument("mesure")
+        parser.add_argument("--debit", type=float, default=10, help="Baisse de débit tolérée (%%)")
+        parser.add_argument("--latence", type=float, default=20, help="Hausse de p95 / p99 tolérée (%%)")
+        parser.add_argument("--marge-ms", type=float, default=2, help="Hausse de latence toujours tolérée (ms)")
+        parser.add_argument("--requetes", type=float, default=0.5, help="Requêtes SQL par requête HTTP en plus tolérées")
+        parser.add_argument("--erreurs", type=float, default=1, help="Hausse du taux d'erreur tolérée (points de %%)")
+
+    def handle(self, *args, **options):
+        reference, mesure = self.lire(options["reference"]), self.lire(options["mesure"])
+        if reference.get("parametres") != mesure.get("parametres"):
+            self.stdout.write(self.style.WARNING(
+                f"Paramètres différents : {reference.get('parametres')} / {mesure.get('parametres')}"
+            ))
+
+        lignes = comparer(
+            reference, mesure, debit=options["debit"] / 100, latence=options["latence"] / 100,
+            requetes=options["requetes"], marge_ms=options["marge_ms"], erreurs=options["erreurs"] / 100,
+        )
+        self.stdout.write(f"{'étape':<24}{'indicateur':<14}{'référence':>12}{'mesure':>12}")
+        for etape, indicateur, avant, apres, regression in lignes:
+            ligne = f"{etape:<24}{indicateur:<14}{self.valeur(avant):>12}{self.valeur(apres):>12}"
+            self.stdout.write(self.style.ERROR(f"{ligne}  RÉGRESSION") if regression else ligne)
+
+        regressions = sum(1 for *_, regression in lignes if regression)
+        if regressions:
+            raise CommandError(f"{regressions} régression(s) par rapport à {options['reference']}")
+        self.stdout.write(self.style.SUCCESS("Aucune régression."))
+
+    def lire(self, chemin):
+        try:
+            with open(chemin) as fichier:
+                return json.load(fichier)
+        except (OSError, ValueError) as erreur:
+            raise CommandError(f"{chemin} : {erreur}")
+
+    def valeur(self, valeur):
+        if valeur is None:
+            return "-"
+        return f"{valeur:.2f}" if isinstance(valeur, float) else valeur
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from boutique.charge import commande_serveur, serveur_lance, tirer
+from boutique.models import Produit
+
+COLONNES = ("requetes", "erreurs", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge comparé : uvicorn (ASGI, vues async, ecommerce/serveur.py) "
+        "contre gunicorn en workers synchrones (WSGI), mêmes chemins et même concurrence."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrence", type=int, default=50, help="Clients simultanés")
+        parser.add_argument("--duree", type=float, default=15, help="Secondes de charge par serveur")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processus par serveur")
+        parser.add_argument("--hote", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--chemin", action="append", dest="chemins", help="Chemin à charger (répétable)")
+        parser.add_argument("--serveur", choices=("asgi", "wsgi"), action="append", dest="serveurs")
+        parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+
+    def handle(self, *args, **options):
+        chemins = options["chemins"] or self.chemins_par_defaut()
+        url_base = f"http://{options['hote']}:{options['port']}"
+        resultats = {}
+
+        for serveur in options["serveurs"] or ("asgi", "wsgi"):
+            try:
+                commande, env = commande_serveur(serveur, options["hote"], options["port"], options["workers"])
+                self.stdout.write(f"{serveur} : {' '.join(commande)}")
+                with serveur_lance(commande, env, url_base):
+                    # Échauffement (caches du catalogue, imports paresseux), non compté
+                    asyncio.run(tirer(url_base, chemins, options["concurrence"], min(2, options["duree"])))
+                    resultats[serveur] = asyncio.run(tirer(url_base, chemins, options["concurrence"], options["duree"]))
+            except RuntimeError as erreur:
+                raise CommandError(f"{serveur} : {erreur}")
+
+        self.afficher(resultats)
+        if options["json"]:
+            with open(options["json"], "w") as fichier:
+                json.dump({"chemins": chemins, "concurrence": options["concurrence"], "resultats": resultats}, fichier, indent=2)
+
+    def chemins_par_defaut(self):
+        produits = list(Produit.objects.order_by("id").values_list("id", flat=True)[:5])
+        if not produits:
+            raise CommandError("Catalogue vide : ajoutez des produits ou passez --chemin")
+        return [
+            reverse("accueil"),
+            reverse("catalogue_page"),
+            reverse("panier"),
+            *[reverse("detail_produit", args=[produit_id]) for produit_id in produits],
+        ]
+
+    def afficher(self, resultats):
+        self.stdout.write("")
+        self.stdout.write(f"{'serveur':<8}" + "".join(f"{colonne:>12}" for colonne in COLONNES))
+        for serveur, resume in resultats.items():
+            ligne = "".join(
+                f"{resume[colonne]:>12.1f}" if isinstance(resume[colonne], float) else f"{resume[colonne]:>12}"
+                for colonne in COLONNES
+            )
+            self.stdout.write(f"{serveur:<8}{ligne}")
+        if {"asgi", "wsgi"} <= resultats.keys() and resultats["wsgi"]["rps"]:
+            gain = resultats["asgi"]["rps"] / resultats["wsgi"]["rps"]
+            self.stdout.write(self.style.SUCCESS(f"Débit ASGI / WSGI : x{gain:.2f}"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from boutique.commandes import expirer_reservations
+
+
+class Command(BaseCommand):
+    help = "Rend le stock des réservations expirées et annule les commandes non payées."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="Réservations par transaction")
+        parser.add_argument("--boucle", action="store_true", help="Tourne en continu (worker)")
+        parser.add_argument("--intervalle", type=int, default=60, help="Secondes entre deux passes en mode --boucle")
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            # Lots successifs : chaque transaction reste courte
+            while True:
+                traitees = expirer_reservations(limite=options["batch"])
+                total += traitees
+                if traitees < options["batch"]:
+                    break
+            if total:
+                self.stdout.write(f"{total} réservation(s) expirée(s).")
+            if not options["boucle"]:
+                break
+            time.sleep(options["intervalle"])
@@ -0,0 +1,59 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from boutique.images import generer_derives, produits_sans_derives
+from boutique.models import Produit
+
+
+class Command(BaseCommand):
+    help = "Génère les déclinaisons responsives (WebP/JPEG) des images produits, en parallèle."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processus", type=int, default=os.cpu_count(), help="Processus en parallèle")
+        parser.add_argument("--tous", action="store_true", help="Vérifie tous les produits, pas seulement ceux sans déclinaisons")
+        parser.add_argument("--boucle", action="store_true", help="Tourne en continu (worker)")
+        parser.add_argument("--intervalle", type=int, default=10, help="Secondes entre deux passes en mode --boucle")
+
+    def handle(self, *args, **options):
+        if options["processus"] < 1:
+            raise CommandError("--processus doit être positif")
+        while True:
+            if options["tous"]:
+                produits = Produit.objects.exclude(image='')
+            else:
+                produits = produits_sans_derives()
+            ids = list(produits.order_by("id").values_list("id", flat=True))
+
+            if ids:
+                erreurs = 0
+                for produit_id, resultat in zip(ids, self.generer(ids, options["processus"])):
+                    if resultat is not None:
+                        erreurs += 1
+                        self.stderr.write(f"Produit {produit_id} : {resultat}")
+                self.stdout.write(self.style.SUCCESS(f"{len(ids) - erreurs} produit(s) traité(s), {erreurs} erreur(s)."))
+
+            if not options["boucle"]:
+                break
+            time.sleep(options["intervalle"])
+
+    def generer(self, ids, processus):
+        """Résultats de generer_ou_erreur dans l'ordre des ids ; un seul processus : sur place."""
+        if processus == 1:
+            yield from map(generer_ou_erreur, ids)
+            return
+        # Les processus fils ouvrent leur propre connexion
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            yield from pool.map(generer_ou_erreur, ids, chunksize=16)
+
+
+def generer_ou_erreur(produit_id):
+    try:
+        generer_derives(produit_id)
+    except Exception as e:
+        return str(e)
+    return None
@@ -0,0 +1,92 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from boutique.models import Produit
+
+# Configurations comparées : réglages surchargés (None : réglages actuels)
+CONFIGURATIONS = {
+    "sans_cache": {
+        "CACHES": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+    },
+    "sessions_db": {"SESSION_ENGINE": "django.contrib.sessions.backends.db"},
+    "actuelle": None,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Allers-retours base de données par requête (et durée moyenne) sur les pages "
+        "principales, sans cache, avec sessions en base, et avec la configuration actuelle "
+        "(cache Redis et sessions cached_db si REDIS_URL est défini)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Requêtes par chemin et par configuration")
+        parser.add_argument("--utilisateur", help="Mesure aussi les pages en étant connecté sous ce nom")
+        parser.add_argument("--chemin", action="append", dest="chemins", help="Chemin à mesurer (répétable)")
+        parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+
+    def handle(self, *args, **options):
+        chemins = options["chemins"] or self.chemins_par_defaut()
+        utilisateur = None
+        if options["utilisateur"]:
+            utilisateur = get_user_model().objects.filter(username=options["utilisateur"]).first()
+            if utilisateur is None:
+                raise CommandError(f"Utilisateur inconnu : {options['utilisateur']}")
+
+        resultats = {}
+        for nom, reglages in CONFIGURATIONS.items():
+            with override_settings(**(reglages or {})):
+                for profil in ("anonyme", "connecte") if utilisateur else ("anonyme",):
+                    client = Client()
+                    if profil == "connecte":
+                        client.force_login(utilisateur)
+                    resultats[f"{nom}/{profil}"] = {
+                        chemin: self.mesurer(client, chemin, options["iterations"]) for chemin in chemins
+                    }
+                    if profil == "connecte":
+                        client.logout()
+
+        self.afficher(resultats, chemins)
+        if options["json"]:
+            with open(options["json"], "w") as fichier:
+                json.dump({"iterations": options["iterations"], "resultats": resultats}, fichier, indent=2)
+
+    def chemins_par_defaut(self):
+        produit = Produit.objects.order_by("id").values_list("id", flat=True).first()
+        if produit is None:
+            raise CommandError("Catalogue vide : ajoutez des produits ou passez --chemin")
+        return [reverse("accueil"), reverse("detail_produit", args=[produit]), reverse("panier"), reverse("panier_badge")]
+
+    def mesurer(self, client, chemin, iterations):
+        """Requêtes SQL et durée moyennes par appel, après un appel d'échauffement (caches remplis)."""
+        client.get(chemin)
+        requetes = 0
+        debut = time.perf_counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connections["default"]) as capture:
+                reponse = client.get(chemin)
+            if reponse.status_code >= 400:
+                raise CommandError(f"{chemin} : HTTP {reponse.status_code}")
+            requetes += len(capture)
+        return {
+            "requetes": round(requetes / iterations, 2),
+            "ms": round((time.perf_counter() - debut) * 1000 / iterations, 2),
+        }
+
+    def afficher(self, resultats, chemins):
+        largeur = max(len(chemin) for chemin in chemins) + 2
+        self.stdout.write(f"{'configuration':<22}{'chemin':<{largeur}}{'requêtes':>10}{'ms':>10}")
+        for configuration, mesures in resultats.items():
+            for chemin, mesure in mesures.items():
+                self.stdout.write(
+                    f"{configuration:<22}{chemin:<{largeur}}{mesure['requetes']:>10}{mesure['ms']:>10.2f}"
+                )
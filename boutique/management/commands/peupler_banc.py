@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boutique.banc import donnees_presentes, peupler, vider
+
+
+class Command(BaseCommand):
+    help = (
+        "Jeu de données synthétique du banc d'essai : catégories, produits, clients avec "
+        "adresse et panier, commandes payées et avis historiques (voir boutique/banc.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--produits", type=int, default=100_000)
+        parser.add_argument("--clients", type=int, default=500, help="Comptes banc-<n>, mot de passe banc-essai")
+        parser.add_argument("--commandes", type=int, default=20_000, help="Commandes payées sur l'année écoulée")
+        parser.add_argument("--avis", type=int, default=50_000)
+        parser.add_argument("--graine", type=int, default=1, help="Graine du générateur (données reproductibles)")
+        parser.add_argument("--batch", type=int, default=5000, help="Objets par lot")
+        parser.add_argument("--vider", action="store_true", help="Supprime d'abord les données d'un banc précédent")
+
+    def handle(self, *args, **options):
+        if donnees_presentes():
+            if not options["vider"]:
+                raise CommandError("Données du banc déjà présentes : relancez avec --vider pour les recréer")
+            self.stdout.write("Suppression des données du banc précédent...")
+            vider()
+
+        crees = peupler(
+            categories=options["categories"], produits=options["produits"], clients=options["clients"],
+            commandes=options["commandes"], avis=options["avis"], graine=options["graine"],
+            taille_lot=options["batch"], journal=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{nombre} {modele}" for modele, nombre in crees.items())))
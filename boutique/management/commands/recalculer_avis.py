@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from boutique.avis import recalculer_statistiques
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les statistiques d'avis (nombre, somme, histogramme, moyenne) de tous les produits."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1000, help="Produits par lot")
+
+    def handle(self, *args, **options):
+        corriges = recalculer_statistiques(taille_lot=options["batch"])
+        self.stdout.write(self.style.SUCCESS(f"{corriges} produit(s) corrigé(s)."))
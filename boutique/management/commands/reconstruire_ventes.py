@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from boutique.ventes import decouper, periode_paiements, reconstruire
+
+
+def jour(valeur):
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise CommandError(f"Date invalide (AAAA-MM-JJ attendu) : {valeur}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats de ventes par jour (total, catégorie, produit, méthode de paiement) "
+        "depuis les paiements, par tranches de jours traitées en parallèle. Par défaut : du premier "
+        "paiement à la veille, le jour en cours étant tenu à jour à chaque paiement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--debut", type=jour, help="Premier jour (AAAA-MM-JJ), défaut : premier paiement")
+        parser.add_argument("--fin", type=jour, help="Dernier jour inclus (AAAA-MM-JJ), défaut : hier")
+        parser.add_argument("--jours-par-lot", type=int, default=7, help="Jours par tranche (une transaction)")
+        parser.add_argument("--processus", type=int, default=4, help="Tranches traitées en parallèle")
+
+    def handle(self, *args, **options):
+        premier, _ = periode_paiements()
+        debut = options["debut"] or premier
+        fin = options["fin"] or timezone.localdate() - timedelta(days=1)
+        if debut is None:
+            self.stdout.write("Aucun paiement : rien à reconstruire.")
+            return
+        if debut > fin:
+            if options["debut"] and options["fin"]:
+                raise CommandError(f"Période vide : {debut} > {fin}")
+            self.stdout.write(f"Rien à reconstruire avant le {fin + timedelta(days=1)}.")
+            return
+        if options["jours_par_lot"] < 1 or options["processus"] < 1:
+            raise CommandError("--jours-par-lot et --processus doivent être positifs")
+
+        tranches = list(decouper(debut, fin, options["jours_par_lot"]))
+        processus = min(options["processus"], len(tranches))
+        # SQLite n'accepte qu'un écrivain à la fois
+        if connection.vendor == "sqlite":
+            processus = 1
+
+        total = 0
+        if processus == 1:
+            for debut_tranche, fin_tranche in tranches:
+                total += self.traiter(debut_tranche, fin_tranche)
+        else:
+            # Des threads, pas des processus comme generer_images_derivees : l'agrégation
+            # se fait dans la base (INSERT ... SELECT), chaque thread attend sa connexion
+            # sans tenir le GIL ; il n'y a pas de travail Python à répartir sur les cœurs.
+            with ThreadPoolExecutor(max_workers=processus, thread_name_prefix="ventes") as executor:
+                futures = [executor.submit(self.traiter_en_parallele, *tranche) for tranche in tranches]
+                for future in as_completed(futures):
+                    total += future.result()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(tranches)} tranche(s) du {debut} au {fin} : {total} ligne(s) d'agrégats écrite(s)."
+        ))
+
+    def traiter(self, debut, fin):
+        ecrites = reconstruire(debut, fin)
+        self.stdout.write(f"{debut} → {fin} : {ecrites} ligne(s)")
+        return ecrites
+
+    def traiter_en_parallele(self, debut, fin):
+        # Chaque thread a sa connexion : elle est fermée avec la tranche
+        try:
+            return self.traiter(debut, fin)
+        finally:
+            connection.close()
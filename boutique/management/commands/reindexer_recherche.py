@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from boutique.models import Produit, ProduitRecherche
+from boutique.recherche import construire_document
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les documents de recherche de tous les produits."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1000, help="Produits par lot")
+
+    def handle(self, *args, **options):
+        batch = options["batch"]
+        total = 0
+        produits = Produit.objects.values_list("id", "nom", "description").order_by("id")
+        dernier_id = 0
+        while True:
+            lot = list(produits.filter(id__gt=dernier_id)[:batch])
+            if not lot:
+                break
+            ProduitRecherche.objects.bulk_create(
+                [ProduitRecherche(produit_id=pid, document=construire_document(nom, description))
+                 for pid, nom, description in lot],
+                update_conflicts=True,
+                unique_fields=["produit"],
+                update_fields=["document", "maj"],
+            )
+            dernier_id = lot[-1][0]
+            total += len(lot)
+        self.stdout.write(self.style.SUCCESS(f"{total} produit(s) indexé(s)."))
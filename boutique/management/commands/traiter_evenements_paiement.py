@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from boutique.webhooks import traiter_en_attente
+
+
+class Command(BaseCommand):
+    help = "Traite les notifications de paiement (webhooks) en attente."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=100, help="Événements par passe")
+        parser.add_argument("--boucle", action="store_true", help="Tourne en continu (worker)")
+        parser.add_argument("--intervalle", type=float, default=1.0, help="Secondes d'attente quand la file est vide")
+
+    def handle(self, *args, **options):
+        while True:
+            traites = traiter_en_attente(limite=options["batch"])
+            if traites:
+                self.stdout.write(f"{traites} événement(s) traité(s).")
+            if not options["boucle"]:
+                break
+            if traites < options["batch"]:
+                time.sleep(options["intervalle"])
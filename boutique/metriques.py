@@ -0,0 +1,280 @@
+# boutique/metriques.py
+"""
+Métriques par vue (nom d'URL) : requêtes et temps SQL, rendu des gabarits,
+succès / échecs du cache catalogue, temps passé chez les fournisseurs de
+paiement, durée totale (histogramme).
+
+Le middleware ouvre une Mesure pour la requête, rangée dans une ContextVar :
+elle suit la requête dans les vues async comme dans les threads de
+sync_to_async (le contexte y est copié). Les compteurs l'alimentent :
+    SQL        wrapper d'exécution installé sur chaque connexion (signal connection_created)
+    gabarits   backend DjangoTemplatesMesures (settings.TEMPLATES)
+    cache      compter_cache(), appelé par cache_catalogue et le compteur du badge
+    paiement   Passerelle.appel (paiements.py)
+
+Les totaux sont par processus, comme metriques_paiement ; la vue `metriques`
+les expose au format texte de Prometheus. Une requête qui dépasse
+METRIQUES_BUDGET_SQL requêtes SQL est signalée dans les logs.
+"""
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Bornes (s) de l'histogramme des durées de requête
+BORNES = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+COMPTEURS = ("sql_requetes", "sql_secondes", "gabarits_secondes", "cache_succes", "cache_echecs", "paiement_secondes")
+
+_mesure = ContextVar("boutique_mesure", default=None)
+
+
+class Mesure:
+    """Compteurs d'une requête en cours."""
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.valeurs = dict.fromkeys(COMPTEURS, 0)
+        self.en_rendu = False
+
+    def ajouter(self, compteur, valeur):
+        self.valeurs[compteur] += valeur
+
+
+def ajouter(compteur, valeur):
+    mesure = _mesure.get()
+    if mesure is not None:
+        mesure.ajouter(compteur, valeur)
+
+
+def compter_cache(succes, echecs):
+    mesure = _mesure.get()
+    if mesure is not None:
+        mesure.ajouter("cache_succes", succes)
+        mesure.ajouter("cache_echecs", echecs)
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+def compter_sql(execute, sql, params, many, context):
+    mesure = _mesure.get()
+    if mesure is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesure.ajouter("sql_requetes", 1)
+        mesure.ajouter("sql_secondes", time.perf_counter() - debut)
+
+
+def installer_compteur_sql(connection):
+    if compter_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, compter_sql)
+
+
+@contextmanager
+def chronometrer_gabarit():
+    mesure = _mesure.get()
+    # Un gabarit rendu pendant un autre (render_to_string dans une balise) n'est pas compté deux fois
+    if mesure is None or mesure.en_rendu:
+        yield
+        return
+    mesure.en_rendu = True
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        mesure.en_rendu = False
+        mesure.ajouter("gabarits_secondes", time.perf_counter() - debut)
+
+
+class GabaritMesure:
+    def __init__(self, gabarit):
+        self.gabarit = gabarit
+
+    def __getattr__(self, nom):
+        return getattr(self.gabarit, nom)
+
+    def render(self, context=None, request=None):
+        with chronometrer_gabarit():
+            return self.gabarit.render(context, request)
+
+
+class DjangoTemplatesMesures(DjangoTemplates):
+    """Backend DjangoTemplates dont les rendus sont chronométrés."""
+
+    def from_string(self, template_code):
+        return GabaritMesure(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return GabaritMesure(super().get_template(template_name))
+
+
+# ---------------------------------------------------------------------------
+# Agrégats par vue
+# ---------------------------------------------------------------------------
+
+class MetriquesVues:
+    """Totaux par nom d'URL depuis le démarrage du processus."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.donnees = {}
+
+    def enregistrer(self, vue, duree, valeurs, budget_depasse):
+        with self.lock:
+            stats = self.donnees.setdefault(vue, {
+                "requetes": 0, "duree_totale": 0.0, "budget_depasse": 0,
+                "histogramme": [0] * (len(BORNES) + 1),
+                **dict.fromkeys(COMPTEURS, 0),
+            })
+            stats["requetes"] += 1
+            stats["duree_totale"] += duree
+            stats["budget_depasse"] += 1 if budget_depasse else 0
+            for compteur in COMPTEURS:
+                stats[compteur] += valeurs[compteur]
+            index = next((i for i, borne in enumerate(BORNES) if duree <= borne), len(BORNES))
+            stats["histogramme"][index] += 1
+
+    def resume(self):
+        with self.lock:
+            return {vue: dict(stats, histogramme=list(stats["histogramme"])) for vue, stats in self.donnees.items()}
+
+
+metriques_vues = MetriquesVues()
+
+
+def budget_sql():
+    return getattr(settings, "METRIQUES_BUDGET_SQL", 15)
+
+
+def nom_vue(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "non_resolue"  # 404, fichiers statiques
+    return match.view_name or match._func_path
+
+
+def terminer(request, mesure):
+    duree = time.perf_counter() - mesure.debut
+    vue = nom_vue(request)
+    requetes_sql = mesure.valeurs["sql_requetes"]
+    depasse = requetes_sql > budget_sql()
+    if depasse:
+        logger.warning(
+            "%s (%s %s) : %s requêtes SQL, budget %s", vue, request.method, request.path, requetes_sql, budget_sql(),
+        )
+    metriques_vues.enregistrer(vue, duree, mesure.valeurs, depasse)
+
+
+@sync_and_async_middleware
+def metriques_middleware(get_response):
+    """Ouvre une Mesure pour chaque requête et l'ajoute aux totaux de sa vue."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            mesure = Mesure()
+            jeton = _mesure.set(mesure)
+            try:
+                return await get_response(request)
+            finally:
+                _mesure.reset(jeton)
+                terminer(request, mesure)
+
+        return middleware
+
+    def middleware(request):
+        mesure = Mesure()
+        jeton = _mesure.set(mesure)
+        try:
+            return get_response(request)
+        finally:
+            _mesure.reset(jeton)
+            terminer(request, mesure)
+
+    return middleware
+
+
+# ---------------------------------------------------------------------------
+# Export Prometheus
+# ---------------------------------------------------------------------------
+
+def acces_autorise(request):
+    """Jeton METRIQUES_JETON (Authorization: Bearer ...) ou compte staff."""
+    jeton = getattr(settings, "METRIQUES_JETON", "")
+    fourni = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if jeton and fourni and hmac.compare_digest(fourni, jeton):
+        return True
+    return request.user.is_staff
+
+
+def echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def serie(nom, etiquettes, valeur):
+    texte = ",".join(f'{cle}="{echapper(v)}"' for cle, v in etiquettes.items())
+    return f"{nom}{{{texte}}} {valeur}"
+
+
+def histogramme(nom, etiquettes, bornes, comptes, somme):
+    lignes = []
+    cumul = 0
+    for borne, compte in zip([*bornes, "+Inf"], comptes):
+        cumul += compte
+        lignes.append(serie(f"{nom}_bucket", {**etiquettes, "le": borne}, cumul))
+    lignes.append(serie(f"{nom}_sum", etiquettes, somme))
+    lignes.append(serie(f"{nom}_count", etiquettes, cumul))
+    return lignes
+
+
+# (nom de la série, clé des totaux, type, aide)
+SERIES_VUES = (
+    ("boutique_requetes_total", "requetes", "counter", "Requêtes HTTP traitées"),
+    ("boutique_sql_requetes_total", "sql_requetes", "counter", "Requêtes SQL exécutées"),
+    ("boutique_sql_secondes_total", "sql_secondes", "counter", "Temps passé en SQL"),
+    ("boutique_gabarits_secondes_total", "gabarits_secondes", "counter", "Temps de rendu des gabarits"),
+    ("boutique_cache_succes_total", "cache_succes", "counter", "Lectures du cache catalogue trouvées"),
+    ("boutique_cache_echecs_total", "cache_echecs", "counter", "Lectures du cache catalogue manquées"),
+    ("boutique_paiement_secondes_total", "paiement_secondes", "counter", "Temps d'attente des fournisseurs de paiement"),
+    ("boutique_budget_sql_depasse_total", "budget_depasse", "counter", "Requêtes au-delà du budget SQL"),
+)
+
+
+def texte_prometheus():
+    """Totaux par vue et par fournisseur de paiement, au format d'exposition texte de Prometheus."""
+    from .paiements import MetriquesPaiement, metriques_paiement
+
+    vues = metriques_vues.resume()
+    lignes = []
+    for nom, cle, type_serie, aide in SERIES_VUES:
+        lignes += [f"# HELP {nom} {aide}, par vue", f"# TYPE {nom} {type_serie}"]
+        lignes += [serie(nom, {"vue": vue}, stats[cle]) for vue, stats in sorted(vues.items())]
+
+    nom = "boutique_requete_duree_secondes"
+    lignes += [f"# HELP {nom} Durée des requêtes HTTP, par vue", f"# TYPE {nom} histogram"]
+    for vue, stats in sorted(vues.items()):
+        lignes += histogramme(nom, {"vue": vue}, BORNES, stats["histogramme"], stats["duree_totale"])
+
+    fournisseurs = metriques_paiement.resume()
+    nom = "boutique_paiement_erreurs_total"
+    lignes += [f"# HELP {nom} Appels en échec, par fournisseur", f"# TYPE {nom} counter"]
+    lignes += [serie(nom, {"fournisseur": f}, stats["erreurs"]) for f, stats in sorted(fournisseurs.items())]
+    nom = "boutique_paiement_duree_secondes"
+    lignes += [f"# HELP {nom} Durée des appels aux fournisseurs de paiement", f"# TYPE {nom} histogram"]
+    for fournisseur, stats in sorted(fournisseurs.items()):
+        lignes += histogramme(
+            nom, {"fournisseur": fournisseur}, MetriquesPaiement.BORNES, stats["histogramme"], stats["duree_totale"],
+        )
+    return "\n".join(lignes) + "\n"
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:09
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copie figée de la normalisation de boutique/recherche.py à la date de cette
+# migration : elle ne doit pas changer si le module évolue ou disparaît.
+MOTS_VIDES = frozenset("""
+a au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma
+mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se
+ses son sur ta te tes toi ton tu un une vos votre vous c d j l m n s t y
+""".split())
+
+SUFFIXES = (
+    "issements", "issement", "atrices", "ateurs", "ations", "atrice", "ateur",
+    "ation", "ements", "ement", "euses", "euse", "eux", "iques", "ique",
+    "ismes", "isme", "istes", "iste", "ables", "able", "ettes", "ette",
+    "elles", "elle", "ees", "ee", "es", "er", "e",
+)
+
+POIDS_NOM = 3
+
+MOT_RE = re.compile(r"\w+")
+
+
+def sans_accents(texte):
+    texte = unicodedata.normalize("NFKD", texte)
+    return "".join(c for c in texte if not unicodedata.combining(c))
+
+
+def raciniser(mot):
+    if len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    for suffixe in SUFFIXES:
+        if mot.endswith(suffixe) and len(mot) - len(suffixe) >= 3:
+            return mot[:-len(suffixe)]
+    return mot
+
+
+def termes(texte):
+    mots = MOT_RE.findall(sans_accents(texte or "").lower())
+    return [raciniser(mot) for mot in mots if mot not in MOTS_VIDES]
+
+
+def construire_document(nom, description):
+    return " ".join(termes(nom) * POIDS_NOM + termes(description))
+
+
+def creer_index_trigramme(apps, schema_editor):
+    # Index GIN trigramme : PostgreSQL uniquement (SQLite utilise l'index en mémoire)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS boutique_produitrecherche_document_trgm "
+        "ON boutique_produitrecherche USING gin (document gin_trgm_ops)"
+    )
+
+
+def supprimer_index_trigramme(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS boutique_produitrecherche_document_trgm")
+
+
+def indexer_catalogue(apps, schema_editor):
+    Produit = apps.get_model('boutique', 'Produit')
+    ProduitRecherche = apps.get_model('boutique', 'ProduitRecherche')
+    lot = []
+    for pid, nom, description in Produit.objects.values_list('id', 'nom', 'description').iterator():
+        lot.append(ProduitRecherche(produit_id=pid, document=construire_document(nom, description)))
+        if len(lot) >= 1000:
+            ProduitRecherche.objects.bulk_create(lot)
+            lot = []
+    ProduitRecherche.objects.bulk_create(lot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0006_alter_paiement_methode_alter_produit_prix_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduitRecherche',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recherche', serialize=False, to='boutique.produit')),
+                ('document', models.TextField()),
+                ('maj', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(creer_index_trigramme, supprimer_index_trigramme),
+        migrations.RunPython(indexer_catalogue, migrations.RunPython.noop),
+    ]
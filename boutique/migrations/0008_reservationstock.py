@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0007_produitrecherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='stock_reserve',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ReservationStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.PositiveIntegerField()),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('expire_le', models.DateTimeField()),
+                ('statut', models.CharField(choices=[('active', 'Active'), ('confirmee', 'Confirmée'), ('expiree', 'Expirée')], default='active', max_length=20)),
+                ('commande', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='boutique.commande')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='boutique.produit')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('statut', 'active')), fields=['expire_le'], name='reservation_active_expire_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0008_reservationstock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementPaiement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fournisseur', models.CharField(choices=[('stripe', 'Stripe'), ('cinetpay', 'CinetPay')], max_length=20)),
+                ('evenement_id', models.CharField(max_length=255)),
+                ('type', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('recu_le', models.DateTimeField(auto_now_add=True)),
+                ('traite_le', models.DateTimeField(blank=True, null=True)),
+                ('statut', models.CharField(choices=[('recu', 'Reçu'), ('traite', 'Traité'), ('ignore', 'Ignoré'), ('erreur', 'Erreur')], default='recu', max_length=20)),
+                ('commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='evenements_paiement', to='boutique.commande')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('statut', 'recu')), fields=['recu_le'], name='evenement_paiement_a_traiter')],
+                'constraints': [models.UniqueConstraint(fields=('fournisseur', 'evenement_id'), name='evenement_paiement_unique')],
+            },
+        ),
+    ]
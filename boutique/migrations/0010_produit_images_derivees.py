@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0009_evenementpaiement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='images_derivees',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
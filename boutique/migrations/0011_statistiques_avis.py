@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:26
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def calculer_statistiques(apps, schema_editor):
+    # Agrégation figée ici (une requête GROUP BY), indépendante de boutique/avis.py
+    Avis = apps.get_model('boutique', 'Avis')
+    Produit = apps.get_model('boutique', 'Produit')
+    lignes = Avis.objects.values('produit_id').order_by('produit_id').annotate(
+        avis_nombre=Count('id'),
+        avis_somme=Sum('note'),
+        **{f'avis_{note}': Count('id', filter=Q(note=note)) for note in range(1, 6)},
+    )
+    for ligne in lignes:
+        produit_id = ligne.pop('produit_id')
+        ligne['note_moyenne'] = ligne['avis_somme'] / ligne['avis_nombre']
+        Produit.objects.filter(id=produit_id).update(**ligne)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0010_produit_images_derivees'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='avis_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_nombre',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='avis_somme',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='note_moyenne',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='avis',
+            index=models.Index(fields=['produit', '-date', '-id'], name='avis_produit_date_idx'),
+        ),
+        migrations.RunPython(calculer_statistiques, migrations.RunPython.noop),
+    ]
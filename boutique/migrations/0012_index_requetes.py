@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionner_lignes_panier(apps, schema_editor):
+    # Avant la contrainte unique : les doublons (panier, produit) sont fusionnés
+    LignePanier = apps.get_model('boutique', 'LignePanier')
+    doublons = (
+        LignePanier.objects.values('panier_id', 'produit_id')
+        .annotate(nombre=Count('id'), premiere=Min('id'), total=Sum('quantite'))
+        .filter(nombre__gt=1)
+    )
+    for doublon in doublons:
+        LignePanier.objects.filter(id=doublon['premiere']).update(quantite=doublon['total'])
+        LignePanier.objects.filter(
+            panier_id=doublon['panier_id'], produit_id=doublon['produit_id'],
+        ).exclude(id=doublon['premiere']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0011_statistiques_avis'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['utilisateur', 'statut'], name='commande_utilisateur_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['categorie', 'prix', 'id'], name='produit_categorie_prix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['prix', 'id'], name='produit_prix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['categorie', 'id'], name='produit_en_stock_idx'),
+        ),
+        migrations.RunPython(fusionner_lignes_panier, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='lignepanier',
+            constraint=models.UniqueConstraint(fields=('panier', 'produit'), name='ligne_panier_unique'),
+        ),
+    ]
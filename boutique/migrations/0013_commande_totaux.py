@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0012_index_requetes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='devise',
+            field=models.CharField(default='XOF', editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='commande',
+            name='nombre_articles',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='commande',
+            name='sous_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+    ]
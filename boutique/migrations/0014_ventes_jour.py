@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0013_commande_totaux'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VenteJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('methode', models.CharField(max_length=50)),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unites', models.PositiveIntegerField(default=0)),
+                ('commandes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'vente du jour',
+                'verbose_name_plural': 'ventes par jour',
+            },
+        ),
+        migrations.CreateModel(
+            name='VenteJourCategorie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('methode', models.CharField(max_length=50)),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unites', models.PositiveIntegerField(default=0)),
+                ('commandes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VenteJourProduit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('categorie_id', models.IntegerField()),
+                ('methode', models.CharField(max_length=50)),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unites', models.PositiveIntegerField(default=0)),
+                ('commandes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paiement',
+            index=models.Index(fields=['date_paiement'], name='paiement_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventejour',
+            constraint=models.UniqueConstraint(fields=('jour', 'methode'), name='vente_jour_unique'),
+        ),
+        migrations.AddField(
+            model_name='ventejourcategorie',
+            name='categorie',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='boutique.categorie'),
+        ),
+        migrations.AddField(
+            model_name='ventejourproduit',
+            name='produit',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='boutique.produit'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventejourcategorie',
+            constraint=models.UniqueConstraint(fields=('jour', 'categorie', 'methode'), name='vente_jour_categorie_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='ventejourproduit',
+            constraint=models.UniqueConstraint(fields=('jour', 'produit', 'methode'), name='vente_jour_produit_unique'),
+        ),
+    ]
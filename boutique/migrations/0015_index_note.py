@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boutique', '0014_ventes_jour'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='produit',
+            name='note_moyenne',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['-note_moyenne', '-avis_nombre', '-id'], name='produit_note_idx'),
+        ),
+    ]
@@ -22,10 +22,44 @@ class Produit(models.Model):
     categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE)
     date_ajout = models.DateTimeField(auto_now_add=True)
     prix_promo = models.DecimalField(max_digits=10, decimal_places=0, null=True, blank=True)
+    # Total courant des réservations actives (stock physique = stock + stock_reserve)
+    stock_reserve = models.PositiveIntegerField(default=0)
+    # Chemins des déclinaisons responsives de l'image (voir images.py)
+    images_derivees = models.JSONField(default=dict, blank=True, editable=False)
+    # Statistiques des avis, tenues à jour à chaque avis (voir avis.py)
+    avis_nombre = models.PositiveIntegerField(default=0, editable=False)
+    avis_somme = models.PositiveIntegerField(default=0, editable=False)
+    avis_1 = models.PositiveIntegerField(default=0, editable=False)
+    avis_2 = models.PositiveIntegerField(default=0, editable=False)
+    avis_3 = models.PositiveIntegerField(default=0, editable=False)
+    avis_4 = models.PositiveIntegerField(default=0, editable=False)
+    avis_5 = models.PositiveIntegerField(default=0, editable=False)
+    note_moyenne = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Listing par catégorie trié par prix (et id, clé du curseur)
+            models.Index(fields=['categorie', 'prix', 'id'], name='produit_categorie_prix_idx'),
+            # Listing complet trié par prix
+            models.Index(fields=['prix', 'id'], name='produit_prix_idx'),
+            # Produits en stock uniquement (?sort=stock), par catégorie
+            models.Index(fields=['categorie', 'id'], condition=models.Q(stock__gt=0), name='produit_en_stock_idx'),
+            # Listing par note (?sort=note) : toute la clé du curseur, dans l'ordre de ORDRES["note"]
+            models.Index(fields=['-note_moyenne', '-avis_nombre', '-id'], name='produit_note_idx'),
+        ]
 
     def __str__(self):
         return self.nom
 
+# Document de recherche dénormalisé (voir recherche.py)
+class ProduitRecherche(models.Model):
+    produit = models.OneToOneField(Produit, on_delete=models.CASCADE, primary_key=True, related_name='recherche')
+    document = models.TextField()
+    maj = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Index de {self.produit_id}"
+
 # Adresse de livraison
 class AdresseLivraison(models.Model):
     utilisateur = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -47,10 +81,12 @@ class Panier(models.Model):
         return f"Panier de {self.utilisateur.username}"
 
     def get_total(self):
-        return sum([ligne.get_total() for ligne in self.lignes.all()])
+        from .utils import calculer_resume_panier
+        return calculer_resume_panier(self.utilisateur_id)['total']
     
     def get_item_count(self):
-        return sum([ligne.quantite for ligne in self.lignes.all()])
+        from .utils import calculer_resume_panier
+        return calculer_resume_panier(self.utilisateur_id)['nombre_articles']
 
 
 # Éléments du panier
@@ -59,10 +95,19 @@ class LignePanier(models.Model):
     produit = models.ForeignKey('Produit', on_delete=models.CASCADE)
     quantite = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Une seule ligne par produit : deux ajouts simultanés ne peuvent pas la dupliquer
+            models.UniqueConstraint(fields=['panier', 'produit'], name='ligne_panier_unique'),
+        ]
+
     def __str__(self):
         return f"{self.quantite} x {self.produit.nom}"
 
     def get_total(self):
+        # Déjà calculé en base par charger_lignes_panier()
+        if hasattr(self, 'total_ligne'):
+            return self.total_ligne
         prix_unitaire = self.produit.prix_promo if self.produit.prix_promo else self.produit.prix
         return prix_unitaire * self.quantite
 
@@ -78,10 +123,41 @@ class Commande(models.Model):
         ("livree", "Livrée"),
         ("annulee", "Annulée")
     ], default="en_attente")
+    # Totaux dénormalisés, fixés à la création (voir commandes.creer_commande)
+    sous_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    nombre_articles = models.PositiveIntegerField(default=0, editable=False)
+    devise = models.CharField(max_length=3, default="XOF", editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['utilisateur', 'statut'], name='commande_utilisateur_idx'),
+        ]
 
     def __str__(self):
         return f"Commande {self.id} - {self.utilisateur.username}"
 
+# Réservation de stock entre la commande et le paiement
+class ReservationStock(models.Model):
+    commande = models.ForeignKey(Commande, on_delete=models.CASCADE, related_name='reservations')
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='reservations')
+    quantite = models.PositiveIntegerField()
+    date_creation = models.DateTimeField(auto_now_add=True)
+    expire_le = models.DateTimeField()
+    statut = models.CharField(max_length=20, choices=[
+        ("active", "Active"),
+        ("confirmee", "Confirmée"),
+        ("expiree", "Expirée"),
+    ], default="active")
+
+    class Meta:
+        indexes = [
+            # Le balayeur ne parcourt que les réservations actives, par échéance
+            models.Index(fields=['expire_le'], condition=models.Q(statut='active'), name='reservation_active_expire_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantite} x {self.produit_id} (commande {self.commande_id}, {self.statut})"
+
 # Détail des produits commandés
 class LigneCommande(models.Model):
     commande = models.ForeignKey(Commande, on_delete=models.CASCADE, related_name='lignes')
@@ -108,11 +184,48 @@ class Paiement(models.Model):
     ])
     statut = models.CharField(max_length=50, default="réussi")
 
+    class Meta:
+        indexes = [
+            # Reconstruction des agrégats de ventes par plage de dates (ventes.py)
+            models.Index(fields=['date_paiement'], name='paiement_date_idx'),
+        ]
+
     def __str__(self):
         return f"Paiement de {self.montant} FCFA - {self.methode}"
 
 
 
+# Notifications reçues des fournisseurs de paiement (webhooks)
+class EvenementPaiement(models.Model):
+    fournisseur = models.CharField(max_length=20, choices=[
+        ("stripe", "Stripe"),
+        ("cinetpay", "CinetPay"),
+    ])
+    evenement_id = models.CharField(max_length=255)
+    type = models.CharField(max_length=100, blank=True)
+    commande = models.ForeignKey(Commande, on_delete=models.SET_NULL, null=True, blank=True, related_name='evenements_paiement')
+    payload = models.JSONField()
+    recu_le = models.DateTimeField(auto_now_add=True)
+    traite_le = models.DateTimeField(null=True, blank=True)
+    statut = models.CharField(max_length=20, choices=[
+        ("recu", "Reçu"),
+        ("traite", "Traité"),
+        ("ignore", "Ignoré"),
+        ("erreur", "Erreur"),
+    ], default="recu")
+
+    class Meta:
+        constraints = [
+            # Déduplication : un même événement n'est enregistré qu'une fois
+            models.UniqueConstraint(fields=['fournisseur', 'evenement_id'], name='evenement_paiement_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['recu_le'], condition=models.Q(statut='recu'), name='evenement_paiement_a_traiter'),
+        ]
+
+    def __str__(self):
+        return f"{self.fournisseur} {self.evenement_id} ({self.statut})"
+
 # Avis client
 class Avis(models.Model):
     utilisateur = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -121,6 +234,12 @@ class Avis(models.Model):
     commentaire = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pagination par curseur des avis d'un produit (du plus récent au plus ancien)
+            models.Index(fields=['produit', '-date', '-id'], name='avis_produit_date_idx'),
+        ]
+
     def __str__(self):
         return f"Avis de {self.utilisateur.username} sur {self.produit.nom}"
 
@@ -132,4 +251,60 @@ class MessageContact(models.Model):
     date_envoi = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.nom} - {self.sujet}"
\ No newline at end of file
+        return f"{self.nom} - {self.sujet}"
+
+
+# Agrégats de ventes par jour et par méthode de paiement (voir ventes.py).
+# Tenus à jour à chaque paiement ; le tableau de bord de l'admin ne lit qu'eux.
+# Pas de contrainte de clé étrangère : un produit ou une catégorie supprimé
+# garde son historique.
+class VenteJour(models.Model):
+    jour = models.DateField()
+    methode = models.CharField(max_length=50)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unites = models.PositiveIntegerField(default=0)
+    commandes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'methode'], name='vente_jour_unique'),
+        ]
+        verbose_name = "vente du jour"
+        verbose_name_plural = "ventes par jour"
+
+    def __str__(self):
+        return f"{self.jour} {self.methode} : {self.chiffre_affaires}"
+
+class VenteJourCategorie(models.Model):
+    jour = models.DateField()
+    categorie = models.ForeignKey(Categorie, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    methode = models.CharField(max_length=50)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unites = models.PositiveIntegerField(default=0)
+    commandes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'categorie', 'methode'], name='vente_jour_categorie_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} catégorie {self.categorie_id} {self.methode} : {self.chiffre_affaires}"
+
+class VenteJourProduit(models.Model):
+    jour = models.DateField()
+    produit = models.ForeignKey(Produit, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    # Catégorie du produit au moment du paiement
+    categorie_id = models.IntegerField()
+    methode = models.CharField(max_length=50)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unites = models.PositiveIntegerField(default=0)
+    commandes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'produit', 'methode'], name='vente_jour_produit_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} produit {self.produit_id} {self.methode} : {self.chiffre_affaires}"
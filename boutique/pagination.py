@@ -0,0 +1,145 @@
+# boutique/pagination.py
+"""
+Pagination par curseur (keyset) pour le catalogue.
+
+Au lieu d'un OFFSET (qui oblige la base à parcourir toutes les lignes
+précédentes), on filtre sur la clé de tri de la dernière ligne servie :
+    WHERE (prix, id) > (:prix, :id) ORDER BY prix, id LIMIT :n
+Le curseur transmis au client est opaque et signé.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+# Tri demandé (paramètre ?sort=) -> colonnes ORDER BY.
+# L'id termine toujours la clé pour garantir un ordre total et stable.
+ORDRES = {
+    "": ("id",),
+    "prix_asc": ("prix", "id"),
+    "prix_desc": ("-prix", "-id"),
+    "nouveaux": ("-id",),
+    "note": ("-note_moyenne", "-avis_nombre", "-id"),
+    # Produits en stock uniquement (filtre appliqué par la vue), par id
+    "stock": ("id",),
+}
+
+CURSEUR_SALT = "boutique.catalogue.curseur"
+
+
+def taille_page():
+    return getattr(settings, "CATALOGUE_PAGE_SIZE", 24)
+
+
+def get_ordre(sort):
+    """Retourne la clé de tri pour ?sort=, ou le tri par défaut si inconnu."""
+    return ORDRES.get(sort or "", ORDRES[""])
+
+
+def encoder_curseur(sort, produit, ordre):
+    valeurs = []
+    for champ in ordre:
+        valeur = getattr(produit, champ.lstrip("-"))
+        # Decimal n'est pas sérialisable en JSON : on passe par une chaîne
+        valeurs.append(str(valeur) if isinstance(valeur, Decimal) else valeur)
+    return signing.dumps({"s": sort or "", "v": valeurs}, salt=CURSEUR_SALT)
+
+
+def decoder_curseur(curseur, sort, ordre):
+    """
+    Décode un curseur. Retourne None si le curseur est absent, falsifié
+    ou émis pour un autre tri (on repart alors de la première page).
+    """
+    if not curseur:
+        return None
+    try:
+        data = signing.loads(curseur, salt=CURSEUR_SALT)
+    except signing.BadSignature:
+        return None
+    if data.get("s") != (sort or "") or len(data.get("v", [])) != len(ordre):
+        return None
+    return data["v"]
+
+
+def filtre_apres(ordre, valeurs):
+    """
+    Construit le prédicat "ligne strictement après le curseur" :
+    (a > va) OR (a = va AND b > vb) OR ...
+    """
+    condition = Q()
+    egalites = {}
+    for champ, valeur in zip(ordre, valeurs):
+        nom = champ.lstrip("-")
+        lookup = "lt" if champ.startswith("-") else "gt"
+        condition |= Q(**egalites, **{f"{nom}__{lookup}": valeur})
+        egalites[nom] = valeur
+    return condition
+
+
+def requete_page(queryset, sort, curseur, taille):
+    """Queryset de la page : tri, filtre après le curseur et une ligne de plus (page suivante ?)."""
+    ordre = get_ordre(sort)
+    queryset = queryset.order_by(*ordre)
+    valeurs = decoder_curseur(curseur, sort, ordre)
+    if valeurs is not None:
+        queryset = queryset.filter(filtre_apres(ordre, valeurs))
+    return queryset[:taille + 1]
+
+
+def terminer_page(produits, sort, taille):
+    curseur_suivant = None
+    if len(produits) > taille:
+        produits = produits[:taille]
+        curseur_suivant = encoder_curseur(sort, produits[-1], get_ordre(sort))
+    return produits, curseur_suivant
+
+
+def paginer(queryset, sort, curseur=None, taille=None):
+    """
+    Retourne (produits, curseur_suivant) pour la page suivant `curseur`.
+    curseur_suivant vaut None sur la dernière page.
+    """
+    taille = taille or taille_page()
+    return terminer_page(list(requete_page(queryset, sort, curseur, taille)), sort, taille)
+
+
+async def apaginer(queryset, sort, curseur=None, taille=None):
+    taille = taille or taille_page()
+    return terminer_page([p async for p in requete_page(queryset, sort, curseur, taille)], sort, taille)
+
+
+def page_pertinence(classement, presents, curseur, taille):
+    """Ids de la page (dans l'ordre du classement) et curseur suivant."""
+    # On ne garde que les ids qui passent les autres filtres (catégorie...)
+    classement = [pid for pid in classement if pid in presents]
+
+    debut = 0
+    valeurs = decoder_curseur(curseur, "pertinence", ("id",))
+    if valeurs is not None and valeurs[0] in classement:
+        debut = classement.index(valeurs[0]) + 1
+
+    page_ids = classement[debut:debut + taille]
+    curseur_suivant = None
+    if debut + taille < len(classement) and page_ids:
+        curseur_suivant = signing.dumps({"s": "pertinence", "v": [page_ids[-1]]}, salt=CURSEUR_SALT)
+    return page_ids, curseur_suivant
+
+
+def paginer_pertinence(queryset, classement, curseur=None, taille=None):
+    """
+    Variante pour les résultats de recherche triés par pertinence.
+    `classement` est la liste d'ids déjà classée par le moteur de recherche ;
+    le curseur porte le dernier id servi, la page est lue avec un seul id__in.
+    """
+    presents = set(queryset.filter(id__in=classement).values_list("id", flat=True))
+    page_ids, curseur_suivant = page_pertinence(classement, presents, curseur, taille or taille_page())
+    par_id = queryset.in_bulk(page_ids)
+    return [par_id[pid] for pid in page_ids], curseur_suivant
+
+
+async def apaginer_pertinence(queryset, classement, curseur=None, taille=None):
+    presents = {pid async for pid in queryset.filter(id__in=classement).values_list("id", flat=True)}
+    page_ids, curseur_suivant = page_pertinence(classement, presents, curseur, taille or taille_page())
+    par_id = await queryset.ain_bulk(page_ids)
+    return [par_id[pid] for pid in page_ids], curseur_suivant
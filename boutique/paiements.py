@@ -0,0 +1,314 @@
+# boutique/paiements.py
+"""
+Passerelles de paiement : Stripe, CinetPay et Orange Money via WhatsApp.
+
+- Des appels async (acreer_session, appelée par la vue async paiement) : un
+  worker ASGI n'est pas bloqué pendant que le fournisseur répond.
+- Un client HTTP partagé par fournisseur et par boucle d'événements (pool de
+  connexions keep-alive httpx ; une seule boucle sous ASGI), créé au premier
+  usage, au lieu d'une connexion neuve par paiement.
+- Des délais courts (PAIEMENT_TIMEOUT) : un fournisseur lent ne bloque plus
+  un worker pendant 10 secondes.
+- Un disjoncteur par fournisseur : après plusieurs échecs d'affilée, les appels
+  échouent immédiatement pendant PAIEMENT_DISJONCTEUR_DELAI secondes.
+- Des métriques de latence par fournisseur (voir metriques_paiement).
+"""
+import asyncio
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import quote
+
+import httpx
+import stripe
+from django.conf import settings
+
+from .metriques import ajouter as ajouter_metrique
+
+
+class ErreurPaiement(Exception):
+    pass
+
+
+class CircuitOuvert(ErreurPaiement):
+    def __init__(self, fournisseur):
+        super().__init__(f"{fournisseur} est momentanément indisponible, réessayez dans quelques instants")
+
+
+class Disjoncteur:
+    """Fermé -> ouvert après `seuil` échecs consécutifs -> un essai après `delai` secondes."""
+
+    def __init__(self, nom, seuil=5, delai=30):
+        self.nom = nom
+        self.seuil = seuil
+        self.delai = delai
+        self.echecs = 0
+        self.ouvert_depuis = None
+        self.lock = threading.Lock()
+
+    def verifier(self):
+        with self.lock:
+            if self.ouvert_depuis is None:
+                return
+            if time.monotonic() - self.ouvert_depuis < self.delai:
+                raise CircuitOuvert(self.nom)
+            # Semi-ouvert : on laisse passer un appel d'essai
+            self.ouvert_depuis = time.monotonic()
+
+    def succes(self):
+        with self.lock:
+            self.echecs = 0
+            self.ouvert_depuis = None
+
+    def echec(self):
+        with self.lock:
+            self.echecs += 1
+            if self.echecs >= self.seuil:
+                self.ouvert_depuis = time.monotonic()
+
+    @property
+    def etat(self):
+        return "ouvert" if self.ouvert_depuis is not None else "ferme"
+
+
+class MetriquesPaiement:
+    """Latence des appels par fournisseur : nombre, erreurs, cumul, max et histogramme."""
+
+    BORNES = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.donnees = {}
+
+    def enregistrer(self, fournisseur, duree, succes):
+        with self.lock:
+            stats = self.donnees.setdefault(fournisseur, {
+                "appels": 0, "erreurs": 0, "duree_totale": 0.0, "duree_max": 0.0,
+                "histogramme": [0] * (len(self.BORNES) + 1),
+            })
+            stats["appels"] += 1
+            stats["erreurs"] += 0 if succes else 1
+            stats["duree_totale"] += duree
+            stats["duree_max"] = max(stats["duree_max"], duree)
+            index = next((i for i, borne in enumerate(self.BORNES) if duree <= borne), len(self.BORNES))
+            stats["histogramme"][index] += 1
+
+    def resume(self):
+        with self.lock:
+            return {nom: dict(stats, histogramme=list(stats["histogramme"])) for nom, stats in self.donnees.items()}
+
+
+metriques_paiement = MetriquesPaiement()
+
+
+def timeout_paiement():
+    return getattr(settings, "PAIEMENT_TIMEOUT", 5)
+
+
+class Passerelle(ABC):
+    nom = None
+    # Durée minimale d'une session qui expire chez le fournisseur (None : pas d'échéance)
+    duree_min_session = None
+
+    def __init__(self):
+        self.disjoncteur = Disjoncteur(
+            self.nom,
+            seuil=getattr(settings, "PAIEMENT_DISJONCTEUR_SEUIL", 5),
+            delai=getattr(settings, "PAIEMENT_DISJONCTEUR_DELAI", 30),
+        )
+        self._clients = weakref.WeakKeyDictionary()
+
+    def duree_reservation(self):
+        """
+        Durée minimale pendant laquelle le stock reste réservé une fois ce
+        moyen choisi (None : l'échéance de la commande est gardée).
+        """
+        return self.duree_min_session
+
+    def client(self):
+        """
+        Client HTTP de la boucle d'événements courante. Un client async httpx
+        est lié à la boucle de sa première requête : un pool par boucle.
+        """
+        boucle = asyncio.get_running_loop()
+        client = self._clients.get(boucle)
+        if client is None:
+            client = self._clients[boucle] = self.nouveau_client()
+        return client
+
+    def nouveau_client(self):
+        return None
+
+    @contextmanager
+    def appel(self):
+        """Disjoncteur + mesure de latence autour d'un appel au fournisseur."""
+        self.disjoncteur.verifier()
+        debut = time.perf_counter()
+        succes = False
+        try:
+            yield
+            succes = True
+        except ErreurPaiement:
+            raise
+        except Exception as e:
+            raise ErreurPaiement(f"Erreur {self.nom}: {e}") from e
+        finally:
+            duree = time.perf_counter() - debut
+            metriques_paiement.enregistrer(self.nom, duree, succes)
+            ajouter_metrique("paiement_secondes", duree)
+            if succes:
+                self.disjoncteur.succes()
+            else:
+                self.disjoncteur.echec()
+
+    @abstractmethod
+    async def acreer_session(self, commande, total, urls, expire_le=None):
+        """
+        Retourne l'URL où envoyer le client. `urls` : success, cancel, notify ;
+        `expire_le` : échéance de la session (réservations du stock).
+        """
+
+
+class PasserelleStripe(Passerelle):
+    nom = "stripe"
+    # expires_at : au moins 30 minutes après la création de la session
+    duree_min_session = timedelta(minutes=31)
+
+    def nouveau_client(self):
+        return stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=stripe.HTTPXClient(timeout=timeout_paiement()),
+            max_network_retries=0,
+            base_addresses={"api": getattr(settings, "STRIPE_API_BASE", "https://api.stripe.com")},
+        )
+
+    def parametres(self, commande, total, urls, expire_le=None):
+        parametres = {
+            'payment_method_types': ['card'],
+            'line_items': [{
+                'price_data': {
+                    'currency': commande.devise.lower(),
+                    'unit_amount': int(total),
+                    'product_data': {'name': f'Commande #{commande.id}'},
+                },
+                'quantity': 1,
+            }],
+            'mode': 'payment',
+            'success_url': urls['success'],
+            'cancel_url': urls['cancel'],
+            'metadata': {'commande_id': commande.id},
+        }
+        if expire_le is not None:
+            parametres['expires_at'] = int(expire_le.timestamp())
+        return parametres
+
+    async def acreer_session(self, commande, total, urls, expire_le=None):
+        with self.appel():
+            session = await self.client().v1.checkout.sessions.create_async(
+                params=self.parametres(commande, total, urls, expire_le),
+            )
+        return session.url
+
+
+class PasserelleCinetPay(Passerelle):
+    nom = "cinetpay"
+
+    def nouveau_client(self):
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout_paiement(), connect=2),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    def url(self):
+        return getattr(settings, "CINETPAY_API_URL", "https://sandbox.cinetpay.com/v1/payment")
+
+    def donnees(self, commande, total, urls):
+        return {
+            "apikey": settings.CINETPAY_API_KEY,
+            "site_id": settings.CINETPAY_SITE_ID,
+            "transaction_id": f"CMD{commande.id}",
+            "amount": total,
+            "currency": commande.devise,
+            "description": f"Paiement commande #{commande.id}",
+            "return_url": urls['success'],
+            "notify_url": urls['notify'],
+        }
+
+    def url_paiement(self, result):
+        payment_url = result.get("payment_url")
+        if not payment_url:
+            raise ErreurPaiement("Impossible de créer la session CinetPay. Réponse: " + str(result))
+        return payment_url
+
+    async def acreer_session(self, commande, total, urls, expire_le=None):
+        with self.appel():
+            response = await self.client().post(self.url(), json=self.donnees(commande, total, urls))
+            result = response.json()
+        return self.url_paiement(result)
+
+    def url_verification(self):
+        return getattr(settings, "CINETPAY_CHECK_URL", "https://api-checkout.cinetpay.com/v2/payment/check")
+
+    def client_verification(self):
+        return httpx.Client(timeout=httpx.Timeout(timeout_paiement(), connect=2))
+
+    def verifier_transaction(self, transaction_id):
+        """
+        État d'une transaction relu chez CinetPay (appel synchrone, fait par la
+        file des webhooks) : dict avec au moins status, amount et currency.
+        """
+        with self.appel():
+            with self.client_verification() as client:
+                response = client.post(self.url_verification(), json={
+                    "apikey": settings.CINETPAY_API_KEY,
+                    "site_id": settings.CINETPAY_SITE_ID,
+                    "transaction_id": transaction_id,
+                })
+                result = response.json()
+        if not isinstance(result.get("data"), dict):
+            raise ErreurPaiement("Vérification CinetPay impossible. Réponse: " + str(result))
+        return result["data"]
+
+
+class PasserelleWhatsApp(Passerelle):
+    """
+    Orange Money via WhatsApp : pas d'appel réseau. Le client nous écrit puis
+    paie ; la commande reste en attente jusqu'à ce que l'équipe confirme le
+    paiement dans l'admin (action « Confirmer le paiement Orange Money »).
+    """
+    nom = "whatsapp"
+
+    NUMEROS = ["+33 6 65 74 33 08", "+223 94 22 81 38"]
+
+    def duree_reservation(self):
+        # Confirmation manuelle : le stock attend l'équipe, au-delà de l'échéance de la commande
+        return timedelta(hours=getattr(settings, "PAIEMENT_MANUEL_RESERVATION_HEURES", 24))
+
+    def numeros(self):
+        return [num.replace(" ", "").replace("+", "") for num in self.NUMEROS]
+
+    def message(self, commande, total):
+        return f"Informer nous avant de payer par Orange Money. Merci 🙏.\nCommande #{commande.id}, Montant : {total} FCFA"
+
+    def liens(self, commande, total):
+        """(numéro, lien wa.me avec le message pré-rempli) pour chaque numéro."""
+        texte = quote(self.message(commande, total))
+        return [(numero, f"https://wa.me/{numero}?text={texte}") for numero in self.numeros()]
+
+    async def acreer_session(self, commande, total, urls, expire_le=None):
+        # Rien à créer chez un fournisseur : page de confirmation « en attente »
+        return urls["success"]
+
+
+PASSERELLES = {
+    "carte": PasserelleStripe(),
+    "cinetpay": PasserelleCinetPay(),
+    "whatsapp": PasserelleWhatsApp(),
+}
+
+
+def get_passerelle(methode):
+    return PASSERELLES.get(methode)
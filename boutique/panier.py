@@ -0,0 +1,261 @@
+# boutique/panier.py
+"""
+Modifications groupées du panier (endpoint JSON panier_api).
+
+Le front envoie un lot d'opérations, appliquées dans l'ordre :
+    {"operations": [
+        {"op": "ajouter",   "produit": 12, "quantite": 1},
+        {"op": "definir",   "produit": 7,  "quantite": 3},
+        {"op": "supprimer", "produit": 5}
+    ]}
+Le lot est d'abord replié en mémoire en une quantité finale par produit,
+puis écrit en une transaction : un DELETE, un INSERT (bulk_create) et un
+UPDATE ... CASE (bulk_update) au plus, quel que soit le nombre d'opérations.
+Les quantités sont plafonnées au stock disponible (avertissement renvoyé).
+
+Pour un visiteur anonyme, les mêmes opérations s'appliquent au panier du
+cookie signé (voir utils.lire_panier_invite), sans aucune écriture en base ;
+à la connexion, ce panier est fusionné dans le Panier persistant.
+
+Les lectures ont une variante async (aetat_panier...) pour les vues async ;
+l'écriture d'un lot (transaction + verrous) reste synchrone, la vue async
+l'appelle via sync_to_async.
+"""
+from django.db import connection, transaction
+
+from .models import LignePanier, Panier, Produit
+from .utils import (
+    MAX_LIGNES_INVITE, acalculer_resume_panier, acharger_lignes_invite, calculer_resume_panier,
+    charger_lignes_invite, charger_lignes_panier, get_or_create_panier, lire_panier_invite, panier_modifie,
+    resumer_lignes,
+)
+
+OPERATIONS = ("ajouter", "definir", "supprimer")
+
+# Garde-fou contre les lots démesurés
+MAX_OPERATIONS = 100
+
+
+class OperationInvalide(ValueError):
+    pass
+
+
+def lire_operations(donnees):
+    """Valide le corps JSON et retourne [(op, produit_id, quantite), ...]."""
+    operations = donnees.get("operations") if isinstance(donnees, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise OperationInvalide("Aucune opération")
+    if len(operations) > MAX_OPERATIONS:
+        raise OperationInvalide(f"{MAX_OPERATIONS} opérations au maximum par lot")
+
+    lues = []
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise OperationInvalide(f"Opération inconnue : {operation!r}")
+        try:
+            produit_id = int(operation.get("produit"))
+            quantite = int(operation.get("quantite", 1 if operation["op"] == "ajouter" else 0))
+        except (TypeError, ValueError):
+            raise OperationInvalide(f"Produit ou quantité invalide : {operation!r}")
+        if operation["op"] == "ajouter" and quantite < 1:
+            raise OperationInvalide(f"Quantité à ajouter invalide : {operation!r}")
+        lues.append((operation["op"], produit_id, quantite))
+    return lues
+
+
+def replier(quantites, operations):
+    """Applique les opérations à {produit_id: quantité} ; 0 signifie "à retirer"."""
+    quantites = dict(quantites)
+    for op, produit_id, quantite in operations:
+        if op == "ajouter":
+            quantites[produit_id] = quantites.get(produit_id, 0) + quantite
+        elif op == "definir":
+            quantites[produit_id] = max(quantite, 0)
+        else:
+            quantites[produit_id] = 0
+    return quantites
+
+
+def stocks(produit_ids):
+    """{produit_id: (stock, nom)} en une requête."""
+    return {pid: (stock, nom) for pid, stock, nom in requete_stocks(produit_ids)}
+
+
+async def astocks(produit_ids):
+    return {pid: (stock, nom) async for pid, stock, nom in requete_stocks(produit_ids)}
+
+
+def requete_stocks(produit_ids):
+    return Produit.objects.filter(id__in=list(produit_ids)).values_list("id", "stock", "nom")
+
+
+def plafonner(quantites, produits=None):
+    """
+    Ramène chaque quantité {produit_id: quantité} au stock disponible (en place,
+    une requête) ; 0 pour un produit introuvable. Retourne les avertissements.
+    `produits` : stocks déjà lus (voir stocks), sinon lus ici.
+    """
+    avertissements = []
+    if produits is None:
+        produits = stocks(quantites)
+    for produit_id, quantite in quantites.items():
+        if produit_id not in produits:
+            if quantite:
+                avertissements.append({"produit": produit_id, "message": "Produit introuvable"})
+            quantites[produit_id] = 0
+            continue
+        stock, nom = produits[produit_id]
+        if quantite > stock:
+            quantites[produit_id] = stock
+            avertissements.append({
+                "produit": produit_id,
+                "message": f"Stock insuffisant pour {nom} ({stock} disponible(s))",
+            })
+    return avertissements
+
+
+def appliquer_operations(user, operations):
+    """
+    Applique le lot au panier de l'utilisateur, atomiquement.
+    Retourne la liste des avertissements (quantités plafonnées, produits introuvables).
+    """
+    touches = {produit_id for _, produit_id, _ in operations}
+
+    with transaction.atomic():
+        panier, _ = Panier.objects.get_or_create(utilisateur=user)
+        # Verrou des lignes touchées : un ajout AJAX simultané attend la fin du lot
+        existantes = {
+            ligne.produit_id: ligne
+            for ligne in LignePanier.objects.select_for_update().filter(panier=panier, produit_id__in=touches)
+        }
+        finales = replier({pid: ligne.quantite for pid, ligne in existantes.items()}, operations)
+        avertissements = plafonner(finales)
+
+        a_supprimer = [pid for pid, quantite in finales.items() if quantite == 0 and pid in existantes]
+        a_creer = [
+            LignePanier(panier=panier, produit_id=pid, quantite=quantite)
+            for pid, quantite in finales.items() if quantite and pid not in existantes
+        ]
+        a_modifier = []
+        for pid, quantite in finales.items():
+            ligne = existantes.get(pid)
+            if quantite and ligne is not None and ligne.quantite != quantite:
+                ligne.quantite = quantite
+                a_modifier.append(ligne)
+
+        if a_supprimer:
+            LignePanier.objects.filter(panier=panier, produit_id__in=a_supprimer).delete()
+        if a_creer:
+            # Une ligne créée entre-temps par un ajout AJAX prend la quantité du lot
+            LignePanier.objects.bulk_create(
+                a_creer, update_conflicts=True, unique_fields=["panier", "produit"], update_fields=["quantite"],
+            )
+        if a_modifier:
+            LignePanier.objects.bulk_update(a_modifier, ["quantite"])
+        panier_modifie(user.id)
+    return avertissements
+
+
+def etat_panier(user):
+    """Panier complet recalculé, tel que renvoyé par l'API (lignes + totaux)."""
+    return serialiser(charger_lignes_panier(user), calculer_resume_panier(user))
+
+
+async def aetat_panier(user):
+    lignes = [ligne async for ligne in charger_lignes_panier(user)]
+    return serialiser(lignes, await acalculer_resume_panier(user))
+
+
+def serialiser(lignes, resume):
+    return {
+        "lignes": [
+            {
+                "id": ligne.id,
+                "produit": ligne.produit_id,
+                "nom": ligne.produit.nom,
+                "quantite": ligne.quantite,
+                "stock": ligne.produit.stock,
+                "prix_unitaire": str(ligne.prix_unitaire),
+                "total_ligne": str(ligne.total_ligne),
+            }
+            for ligne in lignes
+        ],
+        "nombre_articles": resume["nombre_articles"],
+        "total": str(resume["total"]),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Panier invité
+# ---------------------------------------------------------------------------
+
+def appliquer_operations_invite(request, operations):
+    """
+    Applique le lot au panier du cookie. Retourne (quantités, avertissements) :
+    la vue enregistre les quantités dans le cookie de sa réponse.
+    """
+    quantites = replier(lire_panier_invite(request), operations)
+    return limiter_invite(quantites, plafonner(quantites))
+
+
+async def aappliquer_operations_invite(request, operations):
+    quantites = replier(lire_panier_invite(request), operations)
+    return limiter_invite(quantites, plafonner(quantites, await astocks(quantites)))
+
+
+def limiter_invite(quantites, avertissements):
+    quantites = {pid: quantite for pid, quantite in quantites.items() if quantite > 0}
+    if len(quantites) > MAX_LIGNES_INVITE:
+        quantites = dict(list(quantites.items())[:MAX_LIGNES_INVITE])
+        avertissements.append({"produit": None, "message": f"{MAX_LIGNES_INVITE} produits au maximum dans le panier"})
+    return quantites, avertissements
+
+
+def etat_panier_invite(quantites):
+    lignes = charger_lignes_invite(quantites)
+    return serialiser(lignes, resumer_lignes(lignes))
+
+
+async def aetat_panier_invite(quantites):
+    lignes = await acharger_lignes_invite(quantites)
+    return serialiser(lignes, resumer_lignes(lignes))
+
+
+def sql_fusion_panier(nombre):
+    """
+    Fusion du panier invité en une instruction : les quantités s'ajoutent à
+    celles déjà présentes, plafonnées au stock ; les produits épuisés ou
+    supprimés sont ignorés. (VALUES nomme ses colonnes column1, column2 sous
+    PostgreSQL comme sous SQLite.)
+    """
+    q = connection.ops.quote_name
+    ligne, produit = q(LignePanier._meta.db_table), q(Produit._meta.db_table)
+    valeurs = ", ".join(["(%s, %s)"] * nombre)
+    return f"""
+        INSERT INTO {ligne} AS l (panier_id, produit_id, quantite)
+        SELECT %s, p.id, CASE WHEN v.column2 < p.stock THEN v.column2 ELSE p.stock END
+        FROM (VALUES {valeurs}) v JOIN {produit} p ON p.id = v.column1
+        WHERE p.stock > 0
+        ON CONFLICT (panier_id, produit_id) DO UPDATE
+        SET quantite = CASE
+            WHEN l.quantite + excluded.quantite < (SELECT stock FROM {produit} WHERE id = excluded.produit_id)
+            THEN l.quantite + excluded.quantite
+            ELSE (SELECT stock FROM {produit} WHERE id = excluded.produit_id)
+        END
+    """
+
+
+def fusionner_panier_invite(request, user):
+    """
+    À la connexion : le panier du cookie rejoint le Panier de l'utilisateur
+    en un seul upsert groupé. La vue supprime ensuite le cookie (oublier_panier_invite).
+    """
+    quantites = lire_panier_invite(request)
+    if not quantites:
+        return
+    panier = get_or_create_panier(user)
+    parametres = [valeur for produit_id, quantite in quantites.items() for valeur in (produit_id, quantite)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql_fusion_panier(len(quantites)), [panier.id, *parametres])
+    request._panier_invite = {}
+    panier_modifie(user.id)
@@ -0,0 +1,284 @@
+# boutique/recherche.py
+"""
+Recherche plein texte sur le catalogue.
+
+Chaque produit possède un document de recherche dénormalisé (ProduitRecherche)
+: texte sans accents, en minuscules, mots vides retirés et racinisé (français).
+Il est tenu à jour par les signaux de Produit (voir signals.py).
+
+- PostgreSQL : similarité trigramme (pg_trgm) sur un index GIN.
+- Autres bases (SQLite en dev) : index inversé en mémoire, mis à jour
+  incrémentalement, avec tolérance aux fautes de frappe (distance 1).
+  Chaque processus a le sien : il relit les documents modifiés (colonne
+  maj) et, quand le compteur "recherche" du cache partagé change (produit
+  supprimé), retire les produits qui n'ont plus de document.
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+
+from .cache_catalogue import invalider, version
+
+MOTS_VIDES = frozenset("""
+a au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma
+mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se
+ses son sur ta te tes toi ton tu un une vos votre vous c d j l m n s t y
+""".split())
+
+# Suffixes retirés par ordre de longueur décroissante (racinisation légère)
+SUFFIXES = (
+    "issements", "issement", "atrices", "ateurs", "ations", "atrice", "ateur",
+    "ation", "ements", "ement", "euses", "euse", "eux", "iques", "ique",
+    "ismes", "isme", "istes", "iste", "ables", "able", "ettes", "ette",
+    "elles", "elle", "ees", "ee", "es", "er", "e",
+)
+
+POIDS_NOM = 3  # un mot du nom compte plus qu'un mot de la description
+POIDS_FAUTE = 0.5  # pénalité d'un terme trouvé par correction de frappe
+TAILLE_CACHE = 256  # requêtes mémorisées par l'index en mémoire
+
+MOT_RE = re.compile(r"\w+")
+
+# Champs du produit qui composent son document de recherche
+CHAMPS_INDEXES = frozenset({"nom", "description"})
+
+
+def sans_accents(texte):
+    texte = unicodedata.normalize("NFKD", texte)
+    return "".join(c for c in texte if not unicodedata.combining(c))
+
+
+def raciniser(mot):
+    if len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    for suffixe in SUFFIXES:
+        if mot.endswith(suffixe) and len(mot) - len(suffixe) >= 3:
+            return mot[:-len(suffixe)]
+    return mot
+
+
+def termes(texte):
+    """Texte libre -> liste de racines normalisées."""
+    mots = MOT_RE.findall(sans_accents(texte or "").lower())
+    return [raciniser(mot) for mot in mots if mot not in MOTS_VIDES]
+
+
+def construire_document(nom, description):
+    """Document stocké : le nom est répété pour peser davantage dans le rang."""
+    racines_nom = termes(nom)
+    return " ".join(racines_nom * POIDS_NOM + termes(description))
+
+
+def max_resultats():
+    return getattr(settings, "RECHERCHE_MAX_RESULTATS", 500)
+
+
+# ---------------------------------------------------------------------------
+# Repli en mémoire : index inversé
+# ---------------------------------------------------------------------------
+
+def suppressions(terme):
+    """Variantes du terme avec une lettre en moins (style SymSpell)."""
+    return {terme[:i] + terme[i + 1:] for i in range(len(terme))}
+
+
+class IndexInverse:
+    """
+    Index inversé racine -> {produit_id: 1 + log(fréquence)}.
+    Construit paresseusement à la première recherche, puis complété
+    incrémentalement (signaux + relecture des documents modifiés).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}  # produit_id -> liste de racines
+        self.voisins = defaultdict(set)  # suppression -> racines du vocabulaire
+        self.derniere_maj = None
+        self.generation = None  # compteur "recherche" lors de la dernière synchronisation
+        self.construit = False
+        # Résultats récents ; vidé à chaque modification de l'index
+        self.cache = OrderedDict()
+
+    def _ajouter(self, produit_id, racines):
+        self._retirer(produit_id)
+        self.cache.clear()
+        self.documents[produit_id] = racines
+        for racine, frequence in Counter(racines).items():
+            posting = self.postings[racine]
+            if not posting:
+                for variante in suppressions(racine):
+                    self.voisins[variante].add(racine)
+            posting[produit_id] = 1 + math.log(frequence)
+
+    def _retirer(self, produit_id):
+        self.cache.clear()
+        for racine in set(self.documents.pop(produit_id, ())):
+            posting = self.postings.get(racine)
+            if posting is None:
+                continue
+            posting.pop(produit_id, None)
+            if not posting:
+                del self.postings[racine]
+                for variante in suppressions(racine):
+                    self.voisins[variante].discard(racine)
+
+    def indexer(self, produit_id, document):
+        with self.lock:
+            if self.construit:
+                self._ajouter(produit_id, document.split())
+
+    def retirer(self, produit_id):
+        with self.lock:
+            if self.construit:
+                self._retirer(produit_id)
+
+    def synchroniser(self):
+        """
+        Charge tout l'index au premier appel, sinon seulement les documents
+        modifiés, y compris par un autre processus ; retire les produits
+        supprimés quand le compteur "recherche" a changé.
+        """
+        from .models import ProduitRecherche
+
+        with self.lock:
+            generation = version("recherche")
+            if self.construit and generation != self.generation:
+                presents = set(ProduitRecherche.objects.values_list("produit_id", flat=True))
+                for produit_id in self.documents.keys() - presents:
+                    self._retirer(produit_id)
+            lignes = ProduitRecherche.objects.all()
+            if self.construit and self.derniere_maj is not None:
+                # >= : une écriture de la même microseconde n'est pas perdue
+                lignes = lignes.filter(maj__gte=self.derniere_maj)
+            for produit_id, document, maj in lignes.values_list("produit_id", "document", "maj").iterator():
+                racines = document.split()
+                if self.documents.get(produit_id) != racines:
+                    self._ajouter(produit_id, racines)
+                if self.derniere_maj is None or maj > self.derniere_maj:
+                    self.derniere_maj = maj
+            self.generation = generation
+            self.construit = True
+
+    def correspondances(self, racine):
+        """Racines du vocabulaire à distance d'édition <= 1 de `racine`."""
+        candidats = set(self.voisins.get(racine, ()))
+        for variante in suppressions(racine):
+            if variante in self.postings:
+                candidats.add(variante)
+            candidats |= self.voisins.get(variante, set())
+        candidats.discard(racine)
+        return candidats
+
+    def poids_terme(self, racine, total):
+        """Poids tf-idf par produit pour une racine (ou ses variantes à une faute près)."""
+        if racine in self.postings:
+            candidats = [(racine, 1.0)]
+        elif len(racine) >= 4:
+            # Les mots courts ont trop de voisins : pas de correction sous 4 lettres
+            candidats = [(terme, POIDS_FAUTE) for terme in self.correspondances(racine)]
+        else:
+            candidats = []
+
+        poids = {}
+        for terme, penalite in candidats:
+            posting = self.postings[terme]
+            idf = penalite * math.log(1 + total / len(posting))
+            if not poids:
+                poids = {pid: tf * idf for pid, tf in posting.items()}
+                continue
+            for pid, tf in posting.items():
+                poids[pid] = max(poids.get(pid, 0.0), tf * idf)
+        return poids
+
+    def chercher(self, texte, limite):
+        racines = termes(texte)
+        if not racines:
+            return []
+        self.synchroniser()
+        cle = (tuple(racines), limite)
+        with self.lock:
+            if cle in self.cache:
+                self.cache.move_to_end(cle)
+                return self.cache[cle]
+            total = len(self.documents) or 1
+            listes = [self.poids_terme(racine, total) for racine in dict.fromkeys(racines)]
+            # Un terme introuvable est ignoré, les autres doivent tous correspondre
+            listes = sorted((poids for poids in listes if poids), key=len)
+            resultat = []
+            if listes:
+                scores = listes[0]
+                for poids in listes[1:]:
+                    scores = {pid: score + poids[pid] for pid, score in scores.items() if pid in poids}
+                meilleurs = heapq.nlargest(limite, scores.items(), key=itemgetter(1))
+                resultat = [produit_id for produit_id, _ in meilleurs]
+            self.cache[cle] = resultat
+            if len(self.cache) > TAILLE_CACHE:
+                self.cache.popitem(last=False)
+            return resultat
+
+
+index_memoire = IndexInverse()
+
+
+# ---------------------------------------------------------------------------
+# API publique
+# ---------------------------------------------------------------------------
+
+def utilise_postgres():
+    return connection.vendor == "postgresql"
+
+
+def rechercher(texte, limite=None):
+    """Retourne les ids de produits classés par pertinence décroissante."""
+    limite = limite or max_resultats()
+    if utilise_postgres():
+        return _rechercher_postgres(texte, limite)
+    return index_memoire.chercher(texte, limite)
+
+
+def _rechercher_postgres(texte, limite):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    from .models import ProduitRecherche
+
+    requete = " ".join(termes(texte))
+    if not requete:
+        return []
+    return list(
+        ProduitRecherche.objects
+        .filter(document__trigram_word_similar=requete)
+        .annotate(rang=TrigramWordSimilarity(requete, "document"))
+        .order_by("-rang", "produit_id")
+        .values_list("produit_id", flat=True)[:limite]
+    )
+
+
+def indexer_produit(produit):
+    """Met à jour le document de recherche d'un produit (appelé sur post_save)."""
+    from .models import ProduitRecherche
+
+    document = construire_document(produit.nom, produit.description)
+    ProduitRecherche.objects.update_or_create(produit=produit, defaults={"document": document})
+    if not utilise_postgres():
+        index_memoire.indexer(produit.pk, document)
+
+
+def desindexer_produit(produit_id):
+    """
+    Retire un produit de l'index en mémoire (la ligne part en cascade) et
+    signale la suppression aux index des autres processus.
+    """
+    if not utilise_postgres():
+        index_memoire.retirer(produit_id)
+    invalider(("recherche", None))
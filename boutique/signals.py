@@ -0,0 +1,104 @@
+# boutique/signals.py
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .avis import invalider_notes, retirer_avis
+from .cache_catalogue import invalider
+from .images import planifier_derives
+from .metriques import installer_compteur_sql
+from .models import Avis, Categorie, LignePanier, Produit
+from .recherche import CHAMPS_INDEXES, desindexer_produit, indexer_produit
+from .temps_reel import diffuser_produit, etat_produit
+from .utils import panier_modifie
+
+
+def invalider_produit(instance):
+    """Nouvelle version de la carte, de sa catégorie (ancienne et nouvelle) et du catalogue."""
+    categories = {instance.categorie_id, getattr(instance, '_categorie_initiale', None)} - {None}
+    invalider(
+        ("produit", instance.pk),
+        *[("categorie", categorie_id) for categorie_id in categories],
+        ("catalogue", None),
+    )
+
+
+def nom_image(instance):
+    image = instance.__dict__.get('image')
+    return getattr(image, 'name', image)
+
+
+def texte_indexe(instance):
+    # __dict__ : un champ différé non chargé n'a pas pu être modifié
+    return tuple(instance.__dict__.get(champ) for champ in sorted(CHAMPS_INDEXES))
+
+
+def document_a_revoir(instance, created, update_fields):
+    """Vrai si le nom ou la description a pu changer (pas sur un save(update_fields=["stock"]))."""
+    if created:
+        return True
+    if update_fields is not None and not CHAMPS_INDEXES & set(update_fields):
+        return False
+    return texte_indexe(instance) != instance._texte_initial
+
+
+@receiver(post_init, sender=Produit)
+def produit_charge(sender, instance, **kwargs):
+    # __dict__ : ne déclenche pas de requête si le champ est différé
+    instance._categorie_initiale = instance.__dict__.get('categorie_id')
+    instance._image_initiale = nom_image(instance)
+    instance._etat_initial = etat_produit(instance)
+    instance._texte_initial = texte_indexe(instance)
+
+
+# Index de recherche et cache tenus à jour produit par produit
+@receiver(post_save, sender=Produit)
+def produit_enregistre(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        if document_a_revoir(instance, created, update_fields):
+            indexer_produit(instance)
+        # Nouvelle image : déclinaisons responsives générées en arrière-plan
+        if instance.image and (created or nom_image(instance) != instance._image_initiale):
+            planifier_derives(instance.pk)
+    invalider_produit(instance)
+    # Stock ou prix modifié : poussé aux pages qui affichent le produit
+    if not created and etat_produit(instance) != instance._etat_initial:
+        diffuser_produit(instance)
+    instance._categorie_initiale = instance.categorie_id
+    instance._image_initiale = nom_image(instance)
+    instance._etat_initial = etat_produit(instance)
+    instance._texte_initial = texte_indexe(instance)
+
+
+@receiver(post_delete, sender=Produit)
+def produit_supprime(sender, instance, **kwargs):
+    desindexer_produit(instance.pk)
+    invalider_produit(instance)
+    instance.stock = 0
+    diffuser_produit(instance)
+
+
+@receiver(post_save, sender=Categorie)
+@receiver(post_delete, sender=Categorie)
+def categorie_modifiee(sender, instance, **kwargs):
+    invalider(("categorie", instance.pk), ("catalogue", None))
+
+
+# Pas de post_delete sur LignePanier : il priverait les .delete() en masse du
+# chemin rapide de Django. Les suppressions appellent panier_modifie elles-mêmes.
+@receiver(post_save, sender=LignePanier)
+def ligne_panier_enregistree(sender, instance, raw=False, **kwargs):
+    if not raw:
+        panier_modifie(instance.panier.utilisateur_id)
+
+
+@receiver(post_delete, sender=Avis)
+def avis_supprime(sender, instance, **kwargs):
+    retirer_avis(instance)
+    invalider_notes(instance.produit)
+
+
+@receiver(connection_created)
+def connexion_ouverte(sender, connection, **kwargs):
+    # Requêtes SQL comptées par vue (voir metriques.py)
+    installer_compteur_sql(connection)
@@ -0,0 +1,17 @@
+from django import template
+
+from boutique import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_derivee(produit, taille, extension="jpeg"):
+    """{% image_derivee produit "carte" %} : URL de la déclinaison, ou de l'original."""
+    return images.url_derive(produit, taille, extension)
+
+
+@register.simple_tag
+def srcset(produit, extension="jpeg"):
+    """{% srcset produit "webp" %} : valeur de l'attribut srcset."""
+    return images.srcset(produit, extension)
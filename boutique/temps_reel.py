@@ -0,0 +1,70 @@
+# boutique/temps_reel.py
+"""
+Diffusion temps réel (Channels) vers les onglets ouverts (voir consumers.py).
+
+- Groupe panier.<utilisateur> : nouveau compteur du badge après chaque
+  modification du panier, pour les autres onglets / appareils du client.
+- Groupe produit.<id> : stock et prix d'un produit, pour les pages qui
+  l'affichent (le client choisit les produits suivis).
+
+Les messages partent au COMMIT : un client ne voit jamais un état annulé.
+Une couche indisponible (Redis en panne) n'empêche pas la requête d'aboutir.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def groupe_panier(utilisateur_id):
+    return f"panier.{utilisateur_id}"
+
+
+def groupe_produit(produit_id):
+    return f"produit.{produit_id}"
+
+
+def envoyer(groupe, message):
+    couche = get_channel_layer()
+    if couche is None:
+        return
+    try:
+        async_to_sync(couche.group_send)(groupe, message)
+    except Exception:
+        logger.exception("Diffusion impossible vers %s", groupe)
+
+
+def etat_produit(produit):
+    """Partie publique d'un produit (stock, prix) ; lue dans __dict__ pour ne rien charger."""
+    valeurs = produit.__dict__
+    prix_promo = valeurs.get("prix_promo")
+    return {
+        "id": produit.pk,
+        "stock": valeurs.get("stock"),
+        "prix": str(valeurs.get("prix")),
+        "prix_promo": str(prix_promo) if prix_promo else None,
+    }
+
+
+def diffuser_panier(utilisateur_id, nombre_articles):
+    """Nouveau compteur du badge (appelé au COMMIT par utils.panier_modifie)."""
+    envoyer(groupe_panier(utilisateur_id), {"type": "panier.maj", "total_items": nombre_articles})
+
+
+def diffuser_produit(produit):
+    etat = etat_produit(produit)
+    transaction.on_commit(lambda: envoyer(groupe_produit(etat["id"]), {"type": "produit.maj", **etat}))
+
+
+def diffuser_produits(produit_ids):
+    """Après un UPDATE en masse (réservation, expiration) : état relu en une requête au COMMIT."""
+    from .models import Produit
+
+    def envoyer_etats():
+        for produit in Produit.objects.filter(id__in=list(produit_ids)).only("id", "stock", "prix", "prix_promo"):
+            envoyer(groupe_produit(produit.pk), {"type": "produit.maj", **etat_produit(produit)})
+
+    transaction.on_commit(envoyer_etats)
@@ -1,3 +1,1640 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCacheClient
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.template import engines
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .avis import recalculer_statistiques
+from .banc import comparer, lire_metriques, peupler, requetes_sql, vider
+from .cache_catalogue import cle_version, incrementer_versions_produits, invalider, menu_categories, version
+from .cache_redis import CacheRedis, SerialiseurMsgpack, etat_serveur
+from .commandes import (
+    StockInsuffisant, TotauxIncoherents, creer_commande, enregistrer_paiement, expirer_reservations,
+    prolonger_reservations,
+)
+from .images import FORMATS, TAILLES, generer_derives, srcset, url_derive
+from .metriques import metriques_vues, texte_prometheus
+from .pagination import ORDRES, encoder_curseur, paginer, paginer_pertinence, requete_page
+from .paiements import (
+    CircuitOuvert, Disjoncteur, ErreurPaiement, MetriquesPaiement, PasserelleCinetPay, PasserelleStripe,
+    get_passerelle,
+)
+from .recherche import IndexInverse
+from .routing import websocket_urlpatterns
+from .utils import ajouter_ligne_panier, calculer_resume_invite, calculer_resume_panier, charger_lignes_panier
+from .ventes import cumuler_paiement, reconstruire
+from .webhooks import token_cinetpay
+from .models import (
+    AdresseLivraison, Avis, Categorie, Commande, EvenementPaiement, LigneCommande, LignePanier, Paiement, Panier,
+    Produit, ProduitRecherche, ReservationStock, VenteJour, VenteJourCategorie, VenteJourProduit,
+)
+
+
+class CatalogueMixin:
+    def creer_produits(self, nombre, **kwargs):
+        categorie, _ = Categorie.objects.get_or_create(nom="Accessoires")
+        valeurs = {"description": "Description", "prix": 1000, "stock": 50, "image": "produits/test.jpg"}
+        valeurs.update(kwargs)
+        return [
+            Produit.objects.create(nom=f"Produit {i}", categorie=categorie, **valeurs)
+            for i in range(nombre)
+        ]
+
+
+class PanierRequetesTests(CatalogueMixin, TestCase):
+    """Le nombre de requêtes des pages panier ne dépend pas de la taille du panier."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.panier = Panier.objects.create(utilisateur=self.user)
+        AdresseLivraison.objects.create(
+            utilisateur=self.user, adresse="Rue 1", ville="Bamako", code_postal="0000", pays="Mali"
+        )
+
+    def remplir_panier(self, nombre):
+        LignePanier.objects.filter(panier=self.panier).delete()
+        for produit in self.creer_produits(nombre, prix_promo=800):
+            LignePanier.objects.create(panier=self.panier, produit=produit, quantite=2)
+
+    def compter_requetes(self, url_name, nombre):
+        self.remplir_panier(nombre)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_panier_nombre_de_requetes_constant(self):
+        petit, _ = self.compter_requetes("panier", 1)
+        grand, response = self.compter_requetes("panier", 30)
+        self.assertEqual(petit, grand)
+        self.assertEqual(response.context["total"], 30 * 2 * 800)
+
+    def test_passer_commande_nombre_de_requetes_constant(self):
+        petit, _ = self.compter_requetes("passer_commande", 1)
+        grand, response = self.compter_requetes("passer_commande", 30)
+        self.assertEqual(petit, grand)
+        self.assertEqual(response.context["total"], 30 * 2 * 800)
+
+
+class ResumePanierTests(CatalogueMixin, TestCase):
+    """Un seul agrégat par requête pour la vue et le badge ; prix promo appliqués au total."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.panier = Panier.objects.create(utilisateur=self.user)
+        AdresseLivraison.objects.create(
+            utilisateur=self.user, adresse="Rue 1", ville="Bamako", code_postal="0000", pays="Mali"
+        )
+
+    def test_vue_et_badge_partagent_l_agregat(self):
+        for produit in self.creer_produits(3, prix_promo=800):
+            LignePanier.objects.create(panier=self.panier, produit=produit, quantite=2)
+        self.client.login(username="client", password="secret")
+        for url_name in ("panier", "passer_commande"):
+            with self.subTest(url_name):
+                invalider(("panier", self.user.id))  # compteur du badge absent du cache
+                with CaptureQueriesContext(connection) as requetes:
+                    reponse = self.client.get(reverse(url_name))
+                agregats = [
+                    q for q in requetes.captured_queries
+                    if "boutique_lignepanier" in q["sql"] and "SUM(" in q["sql"].upper()
+                ]
+                self.assertEqual(len(agregats), 1)
+                self.assertEqual((reponse.context["total"], reponse.context["panier_count"]), (4800, 6))
+
+    def test_prix_promo_dans_le_total(self):
+        promo, promo_nulle, sans_promo = (
+            self.creer_produits(1, prix_promo=prix_promo)[0] for prix_promo in (800, 0, None)
+        )
+        quantites = {promo.id: 2, promo_nulle.id: 1, sans_promo.id: 3}
+        for produit_id, quantite in quantites.items():
+            LignePanier.objects.create(panier=self.panier, produit_id=produit_id, quantite=quantite)
+        # 2 × 800 (promo) + 1 × 1000 (promo à 0 : prix normal) + 3 × 1000
+        attendu = 5600
+
+        self.assertEqual(calculer_resume_panier(self.user)["total"], attendu)
+        lignes = {ligne.produit_id: ligne.prix_unitaire for ligne in charger_lignes_panier(self.user)}
+        self.assertEqual(lignes, {promo.id: 800, promo_nulle.id: 1000, sans_promo.id: 1000})
+        self.assertEqual(calculer_resume_invite(quantites)["total"], attendu)
+
+        commande = creer_commande(self.user, AdresseLivraison.objects.get())
+        self.assertEqual(commande.sous_total, attendu)
+        self.assertEqual(
+            dict(commande.lignes.values_list("produit_id", "prix_unitaire")),
+            {promo.id: 800, promo_nulle.id: 1000, sans_promo.id: 1000},
+        )
+
+
+class ConfirmerCommandeTests(CatalogueMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.panier = Panier.objects.create(utilisateur=self.user)
+        self.adresse = AdresseLivraison.objects.create(
+            utilisateur=self.user, adresse="Rue 1", ville="Bamako", code_postal="0000", pays="Mali"
+        )
+
+    def test_commande_reserve_le_stock(self):
+        a, b = self.creer_produits(2, stock=5, prix_promo=800)
+        LignePanier.objects.create(panier=self.panier, produit=a, quantite=2)
+        LignePanier.objects.create(panier=self.panier, produit=b, quantite=5)
+
+        response = self.client.get(reverse("confirmer_commande", args=[self.adresse.id]))
+
+        commande = Commande.objects.get(utilisateur=self.user)
+        self.assertRedirects(response, reverse("paiement", args=[commande.id]), fetch_redirect_response=False)
+        self.assertEqual(commande.lignes.count(), 2)
+        self.assertEqual(sorted(commande.lignes.values_list("prix_unitaire", flat=True)), [800, 800])
+        self.assertEqual((commande.sous_total, commande.nombre_articles, commande.devise), (5600, 7, "XOF"))
+        self.assertEqual(list(Produit.objects.order_by("id").values_list("stock", flat=True)), [3, 0])
+
+    def test_stock_insuffisant_annule_tout(self):
+        a, b = self.creer_produits(2, stock=5)
+        LignePanier.objects.create(panier=self.panier, produit=a, quantite=2)
+        LignePanier.objects.create(panier=self.panier, produit=b, quantite=6)
+
+        response = self.client.get(reverse("confirmer_commande", args=[self.adresse.id]))
+
+        self.assertRedirects(response, reverse("panier"), fetch_redirect_response=False)
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(list(Produit.objects.order_by("id").values_list("stock", flat=True)), [5, 5])
+
+    def test_stock_insuffisant_designe_le_bon_produit(self):
+        # a est décrémenté par l'UPDATE partiel (5 -> 2 < 3) : il ne doit pas être désigné
+        a, b = self.creer_produits(2, stock=5)
+        Produit.objects.filter(pk=b.pk).update(stock=1)
+        LignePanier.objects.create(panier=self.panier, produit=a, quantite=3)
+        LignePanier.objects.create(panier=self.panier, produit=b, quantite=2)
+
+        with self.assertRaises(StockInsuffisant) as erreur:
+            creer_commande(self.user, self.adresse)
+        self.assertEqual(erreur.exception.produit, b)
+        self.assertEqual(str(erreur.exception), f"Stock insuffisant pour {b.nom} (1 disponible(s))")
+        self.assertEqual(list(Produit.objects.order_by("id").values_list("stock", flat=True)), [5, 1])
+
+    def test_reservation_expiree_rend_le_stock(self):
+        (produit,) = self.creer_produits(1, stock=5)
+        LignePanier.objects.create(panier=self.panier, produit=produit, quantite=3)
+        self.client.get(reverse("confirmer_commande", args=[self.adresse.id]))
+        produit.refresh_from_db()
+        self.assertEqual((produit.stock, produit.stock_reserve), (2, 3))
+
+        plus_tard = timezone.now() + timedelta(days=1)
+        self.assertEqual(expirer_reservations(maintenant=plus_tard), 1)
+        self.assertEqual(expirer_reservations(maintenant=plus_tard), 0)
+
+        produit.refresh_from_db()
+        self.assertEqual((produit.stock, produit.stock_reserve), (5, 0))
+        self.assertEqual(Commande.objects.get().statut, "annulee")
+
+    def commande_expiree(self, stock=5, quantite=3):
+        (produit,) = self.creer_produits(1, stock=stock)
+        LignePanier.objects.create(panier=self.panier, produit=produit, quantite=quantite)
+        commande = creer_commande(self.user, self.adresse)
+        expirer_reservations(maintenant=timezone.now() + timedelta(days=1))
+        return produit, commande
+
+    def test_paiement_apres_expiration_reprend_le_stock(self):
+        produit, commande = self.commande_expiree()
+        paiement, cree = enregistrer_paiement(commande, 3000, "carte")
+
+        self.assertTrue(cree)
+        self.assertEqual(paiement.statut, "réussi")
+        commande.refresh_from_db()
+        self.assertEqual((commande.est_payee, commande.statut), (True, "en_attente"))
+        produit.refresh_from_db()
+        self.assertEqual((produit.stock, produit.stock_reserve), (2, 0))
+        self.assertEqual(list(commande.reservations.values_list("statut", flat=True)), ["confirmee"])
+        self.assertEqual(VenteJour.objects.get().commandes, 1)
+
+    def test_paiement_apres_expiration_sans_stock_a_rembourser(self):
+        produit, commande = self.commande_expiree()
+        Produit.objects.filter(pk=produit.pk).update(stock=1)  # revendu entre-temps
+        with self.assertLogs("boutique.commandes", "WARNING"):
+            paiement, _ = enregistrer_paiement(commande, 3000, "carte")
+
+        self.assertEqual(paiement.statut, "a_rembourser")
+        commande.refresh_from_db()
+        self.assertEqual((commande.est_payee, commande.statut), (False, "annulee"))
+        self.assertEqual(Produit.objects.get(pk=produit.pk).stock, 1)
+        self.assertFalse(VenteJour.objects.exists())
+        # Le webhook rejoué ne change rien
+        self.assertFalse(enregistrer_paiement(commande, 3000, "carte")[1])
+
+    def test_session_stripe_calee_sur_les_reservations(self):
+        (produit,) = self.creer_produits(1, stock=5)
+        LignePanier.objects.create(panier=self.panier, produit=produit, quantite=1)
+        commande = creer_commande(self.user, self.adresse)
+        echeance = commande.reservations.get().expire_le
+        stripe = get_passerelle("carte")
+
+        # Réservation plus longue que le minimum Stripe : la session expire avec elle
+        self.assertEqual(prolonger_reservations(commande, timezone.now() + timedelta(minutes=1)), echeance)
+        # Plus courte : la réservation est prolongée jusqu'à la fin de la session
+        minimum = echeance + timedelta(minutes=10)
+        self.assertEqual(prolonger_reservations(commande, minimum), minimum)
+        self.assertEqual(commande.reservations.get().expire_le, minimum)
+        urls = {"success": "/ok", "cancel": "/ko", "notify": "/notif"}
+        self.assertEqual(stripe.parametres(commande, 1000, urls, minimum)["expires_at"], int(minimum.timestamp()))
+        self.assertNotIn("expires_at", stripe.parametres(commande, 1000, urls))
+
+    @override_settings(PAIEMENT_MANUEL_RESERVATION_HEURES=24)
+    def test_whatsapp_reserve_jusqu_a_la_confirmation(self):
+        (produit,) = self.creer_produits(1, stock=5)
+        LignePanier.objects.create(panier=self.panier, produit=produit, quantite=2)
+        commande = creer_commande(self.user, self.adresse)
+        self.assertContains(self.client.get(reverse("paiement", args=[commande.id])), "restent réservés 24 h")
+
+        avant = timezone.now()
+        self.client.post(reverse("paiement", args=[commande.id]), {"methode": "whatsapp", "confirme": "1"})
+        self.assertGreaterEqual(commande.reservations.get().expire_le, avant + timedelta(hours=24))
+        # Le balayeur n'annule pas la commande pendant que l'équipe vérifie le paiement
+        self.assertEqual(expirer_reservations(maintenant=timezone.now() + timedelta(hours=2)), 0)
+
+        paiement, _ = enregistrer_paiement(commande, commande.sous_total, "whatsapp")
+        self.assertEqual(paiement.statut, "réussi")
+        self.assertEqual(commande.reservations.get().statut, "confirmee")
+        self.assertEqual(Produit.objects.get(pk=produit.pk).stock, 3)
+
+
+class TotauxCommandeTests(CatalogueMixin, TestCase):
+    """Sous-total, nombre d'articles et devise stockés sur la commande."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.panier = Panier.objects.create(utilisateur=self.user)
+        self.adresse = AdresseLivraison.objects.create(
+            utilisateur=self.user, adresse="Rue 1", ville="Bamako", code_postal="0000", pays="Mali"
+        )
+        self.a, self.b = self.creer_produits(2, stock=5)
+
+    def commande_ancienne(self):
+        """Commande créée avant les totaux : lignes présentes, totaux à zéro."""
+        commande = Commande.objects.create(utilisateur=self.user, adresse_livraison=self.adresse)
+        commande.lignes.create(produit=self.a, quantite=2, prix_unitaire=1000)
+        commande.lignes.create(produit=self.b, quantite=1, prix_unitaire=500)
+        return commande
+
+    def test_paiement_sans_agreger_les_lignes(self):
+        LignePanier.objects.create(panier=self.panier, produit=self.a, quantite=3)
+        self.client.get(reverse("confirmer_commande", args=[self.adresse.id]))
+        commande = Commande.objects.get()
+        User.objects.create_superuser("equipe", password="secret")
+        equipe = Client()
+        equipe.login(username="equipe", password="secret")
+
+        with CaptureQueriesContext(connection) as requetes:
+            self.client.post(reverse("paiement", args=[commande.id]), {"methode": "whatsapp", "confirme": "1"})
+            equipe.post(reverse("admin:boutique_commande_changelist"), {
+                "action": "confirmer_orange_money", "_selected_action": [commande.id],
+            })
+        # Seuls les agrégats de ventes lisent les lignes de la commande payée
+        self.assertFalse([
+            q for q in requetes.captured_queries
+            if "boutique_lignecommande" in q["sql"] and "boutique_vente" not in q["sql"]
+        ])
+        self.assertEqual(Paiement.objects.get().montant, 3000)
+
+    def test_incoherence_annule_la_commande(self):
+        LignePanier.objects.create(panier=self.panier, produit=self.a, quantite=1)
+        LignePanier.objects.create(panier=self.panier, produit=self.b, quantite=1)
+        inserer = LigneCommande.objects.bulk_create
+        # Une ligne perdue à l'insertion : les totaux stockés ne correspondent plus
+        with mock.patch.object(LigneCommande.objects, "bulk_create", side_effect=lambda lignes: inserer(lignes[:-1])):
+            with self.assertRaises(TotauxIncoherents):
+                creer_commande(self.user, self.adresse)
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(list(Produit.objects.order_by("id").values_list("stock", flat=True)), [5, 5])
+
+    def test_commande_ancienne_completee_a_la_lecture(self):
+        commande = self.commande_ancienne()
+        response = self.client.get(reverse("confirmation_commande", args=[commande.id]))
+        self.assertContains(response, "2500")
+        commande.refresh_from_db()
+        self.assertEqual((commande.sous_total, commande.nombre_articles), (2500, 3))
+
+    def test_commande_calculer_totaux(self):
+        ancienne, autre = self.commande_ancienne(), self.commande_ancienne()
+        call_command("calculer_totaux_commandes", batch=1, stdout=StringIO())
+        self.assertEqual(
+            list(Commande.objects.order_by("id").values_list("sous_total", "nombre_articles")), [(2500, 3), (2500, 3)],
+        )
+
+        Commande.objects.filter(pk=autre.pk).update(sous_total=1)
+        sortie = StringIO()
+        call_command("calculer_totaux_commandes", verifier=True, stdout=sortie)
+        self.assertIn("1 commande(s) corrigée(s)", sortie.getvalue())
+        self.assertEqual(
+            dict(Commande.objects.values_list("pk", "sous_total")), {ancienne.pk: 2500, autre.pk: 2500},
+        )
+
+
+class FournisseurFactice:
+    """
+    Remplace Stripe et CinetPay : construit des notifications signées comme
+    les vrais fournisseurs et les rejoue en rafale, en double et dans le désordre.
+    """
+    STRIPE_SECRET = "whsec_test"
+    CINETPAY_SECRET = "cinetpay_test"
+
+    def __init__(self, client):
+        self.client = client
+
+    def stripe(self, evenement_id, type_evenement, commande, payment_status="paid", montant=1600):
+        return {
+            "id": evenement_id,
+            "type": type_evenement,
+            "data": {"object": {
+                "payment_status": payment_status,
+                "amount_total": montant,
+                "currency": "xof",
+                "metadata": {"commande_id": str(commande.id)},
+            }},
+        }
+
+    def cinetpay(self, commande, resultat):
+        return {
+            "cpm_site_id": "site", "cpm_trans_id": f"CMD{commande.id}", "cpm_amount": "1600",
+            "cpm_currency": "XOF", "cpm_result": resultat,
+        }
+
+    def verification_cinetpay(self, statut="ACCEPTED", montant="1600"):
+        """Remplace l'API de vérification CinetPay ; retourne (transactions relues, remplacement)."""
+        relues = []
+
+        def repondre(requete):
+            relues.append(json.loads(requete.content)["transaction_id"])
+            return httpx.Response(200, json={"code": "00", "data": {
+                "status": statut, "amount": montant, "currency": "XOF",
+            }})
+
+        client = httpx.Client(transport=httpx.MockTransport(repondre))
+        return relues, mock.patch.object(get_passerelle("cinetpay"), "client_verification", return_value=client)
+
+    def envoyer(self, fournisseur, evenement, signature=None):
+        if fournisseur == "stripe":
+            payload = json.dumps(evenement)
+            horodatage = int(time.time())
+            mac = hmac.new(self.STRIPE_SECRET.encode(), f"{horodatage}.{payload}".encode(), hashlib.sha256).hexdigest()
+            return self.client.post(
+                reverse("stripe_webhook"), payload, content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature or f"t={horodatage},v1={mac}",
+            )
+        return self.client.post(
+            reverse("cinetpay_webhook"), evenement,
+            HTTP_X_TOKEN=signature or token_cinetpay(evenement, self.CINETPAY_SECRET),
+        )
+
+    def rejouer(self, envois, repetitions=3):
+        rafale = [envoi for envoi in envois for _ in range(repetitions)]
+        random.Random(0).shuffle(rafale)
+        return [self.envoyer(fournisseur, evenement) for fournisseur, evenement in rafale]
+
+
+@override_settings(
+    PAIEMENT_WEBHOOK_FILE="synchrone",
+    STRIPE_WEBHOOK_SECRET=FournisseurFactice.STRIPE_SECRET,
+    CINETPAY_SECRET_KEY=FournisseurFactice.CINETPAY_SECRET,
+)
+class WebhookPaiementTests(CatalogueMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        (produit,) = self.creer_produits(1, stock=5, prix_promo=800)
+        panier = Panier.objects.create(utilisateur=self.user)
+        LignePanier.objects.create(panier=panier, produit=produit, quantite=2)
+        self.commande = Commande.objects.create(utilisateur=self.user, sous_total=1600, nombre_articles=2)
+        self.commande.lignes.create(produit=produit, quantite=2, prix_unitaire=800)
+        self.fournisseur = FournisseurFactice(self.client)
+
+    def test_rafale_stripe_dedupliquee_et_desordonnee(self):
+        f = self.fournisseur
+        with self.captureOnCommitCallbacks(execute=True):
+            reponses = f.rejouer([
+                ("stripe", f.stripe("evt_1", "checkout.session.completed", self.commande)),
+                ("stripe", f.stripe("evt_2", "checkout.session.expired", self.commande, "unpaid")),
+                ("stripe", f.stripe("evt_3", "checkout.session.completed", self.commande)),
+            ])
+
+        self.assertTrue(all(r.status_code == 200 for r in reponses))
+        self.assertEqual(EvenementPaiement.objects.count(), 3)
+        self.assertEqual(Paiement.objects.filter(commande=self.commande).count(), 1)
+        self.commande.refresh_from_db()
+        self.assertTrue(self.commande.est_payee)
+        self.assertFalse(LignePanier.objects.filter(panier__utilisateur=self.user).exists())
+
+    def test_rafale_cinetpay(self):
+        f = self.fournisseur
+        relues, verification = f.verification_cinetpay()
+        with verification, self.captureOnCommitCallbacks(execute=True):
+            f.rejouer([
+                ("cinetpay", f.cinetpay(self.commande, "00")),
+                ("cinetpay", f.cinetpay(self.commande, "623")),
+            ])
+
+        self.assertEqual(EvenementPaiement.objects.count(), 2)
+        self.assertEqual(relues, [f"CMD{self.commande.id}"])
+        self.assertEqual(Paiement.objects.get(commande=self.commande).methode, "cinetpay")
+
+    def test_cpm_result_falsifie_ignore(self):
+        # cpm_result n'est pas signé : un échec réémis en "00" garde un x-token valide
+        f = self.fournisseur
+        relues, verification = f.verification_cinetpay(statut="REFUSED")
+        with verification, self.captureOnCommitCallbacks(execute=True):
+            f.envoyer("cinetpay", f.cinetpay(self.commande, "623"))
+            reponse = f.envoyer("cinetpay", f.cinetpay(self.commande, "00"))
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(relues, [f"CMD{self.commande.id}"])
+        self.assertEqual(set(EvenementPaiement.objects.values_list("statut", flat=True)), {"ignore"})
+        self.commande.refresh_from_db()
+        self.assertFalse(self.commande.est_payee)
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_montant_ou_devise_differents_refuses(self):
+        f = self.fournisseur
+        evenement = f.stripe("evt_1", "checkout.session.completed", self.commande, montant=100)
+        autre_devise = f.stripe("evt_2", "checkout.session.completed", self.commande)
+        autre_devise["data"]["object"]["currency"] = "eur"
+        _, verification = f.verification_cinetpay(montant="100")
+        with self.assertLogs("boutique.webhooks", "WARNING") as journal, verification, \
+                self.captureOnCommitCallbacks(execute=True):
+            f.rejouer([
+                ("stripe", evenement), ("stripe", autre_devise),
+                ("cinetpay", f.cinetpay(self.commande, "00")),
+            ], repetitions=1)
+
+        self.assertEqual(len(journal.records), 3)
+        self.assertEqual(set(EvenementPaiement.objects.values_list("statut", flat=True)), {"erreur"})
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_verification_cinetpay_indisponible(self):
+        f = self.fournisseur
+        cinetpay = get_passerelle("cinetpay")
+        client = httpx.Client(transport=httpx.MockTransport(lambda requete: httpx.Response(503, text="indisponible")))
+        with self.assertLogs("boutique.webhooks", "WARNING"), \
+                mock.patch.object(cinetpay, "client_verification", return_value=client), \
+                self.captureOnCommitCallbacks(execute=True):
+            f.envoyer("cinetpay", f.cinetpay(self.commande, "00"))
+
+        # L'événement attend la prochaine passe du worker
+        self.assertEqual(EvenementPaiement.objects.get().statut, "recu")
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_signature_invalide_refusee(self):
+        f = self.fournisseur
+        evenement = f.stripe("evt_1", "checkout.session.completed", self.commande)
+        self.assertEqual(f.envoyer("stripe", evenement, signature="t=1,v1=faux").status_code, 400)
+        self.assertEqual(f.envoyer("cinetpay", f.cinetpay(self.commande, "00"), signature="faux").status_code, 400)
+        self.assertFalse(EvenementPaiement.objects.exists())
+
+    def test_retour_navigateur_n_enregistre_rien(self):
+        self.client.force_login(self.user)
+        reponse = self.client.get(reverse("paiement_success", args=[self.commande.id]), follow=True)
+        self.assertContains(reponse, "En attente de confirmation")
+        self.commande.refresh_from_db()
+        self.assertFalse(self.commande.est_payee)
+        self.assertFalse(Paiement.objects.exists())
+
+        f = self.fournisseur
+        with self.captureOnCommitCallbacks(execute=True):
+            f.rejouer([("stripe", f.stripe("evt_1", "checkout.session.completed", self.commande))])
+        reponse = self.client.get(reverse("paiement_success", args=[self.commande.id]), follow=True)
+        self.assertContains(reponse, "Confirmé")
+        self.assertContains(reponse, "Carte bancaire")
+
+
+class PaiementTests(CatalogueMixin, TestCase):
+    """Vue async de paiement, clients HTTP partagés, disjoncteur et métriques."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        (produit,) = self.creer_produits(1, stock=5)
+        self.commande = Commande.objects.create(utilisateur=self.user, sous_total=2000, nombre_articles=2)
+        self.commande.lignes.create(produit=produit, quantite=2, prix_unitaire=1000)
+
+    def payer(self, methode, **donnees):
+        return self.client.post(reverse("paiement", args=[self.commande.id]), {"methode": methode, **donnees})
+
+    def fournisseur_cinetpay(self, reponse):
+        """Remplace le client CinetPay par un transport httpx local qui répond `reponse`."""
+        requetes = []
+
+        def repondre(requete):
+            requetes.append(json.loads(requete.content))
+            return httpx.Response(200, json=reponse)
+
+        cinetpay = get_passerelle("cinetpay")
+        client = httpx.AsyncClient(transport=httpx.MockTransport(repondre))
+        return requetes, mock.patch.object(cinetpay, "nouveau_client", return_value=client)
+
+    def test_cinetpay_async(self):
+        requetes, remplacement = self.fournisseur_cinetpay({"payment_url": "https://paiement.test/CMD"})
+        with remplacement:
+            reponse = self.payer("cinetpay")
+        self.assertRedirects(reponse, "https://paiement.test/CMD", fetch_redirect_response=False)
+        self.assertEqual((requetes[0]["transaction_id"], requetes[0]["amount"]), (f"CMD{self.commande.id}", 2000))
+
+        _, remplacement = self.fournisseur_cinetpay({"code": "608"})
+        with remplacement:
+            reponse = self.payer("cinetpay")
+        self.assertContains(reponse, "Impossible de créer la session CinetPay")
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_whatsapp_confirme_dans_l_admin(self):
+        reponse = self.client.get(reverse("paiement", args=[self.commande.id]))
+        self.assertContains(reponse, "https://wa.me/33665743308?text=")
+        self.assertContains(self.payer("whatsapp"), "Vous devez d’abord discuter sur WhatsApp")
+
+        reponse = self.payer("whatsapp", confirme="1")
+        self.assertRedirects(reponse, "http://testserver" + reverse("paiement_success", args=[self.commande.id]),
+                             fetch_redirect_response=False)
+        self.assertFalse(Paiement.objects.exists())
+
+        User.objects.create_superuser("equipe", password="secret")
+        self.client.login(username="equipe", password="secret")
+        for _ in range(2):
+            self.client.post(reverse("admin:boutique_commande_changelist"), {
+                "action": "confirmer_orange_money", "_selected_action": [self.commande.id],
+            })
+        paiement = Paiement.objects.get()
+        self.assertEqual((paiement.methode, paiement.montant), ("whatsapp", 2000))
+        self.commande.refresh_from_db()
+        self.assertTrue(self.commande.est_payee)
+
+    def test_client_partage_par_boucle(self):
+        for passerelle in (PasserelleCinetPay(), PasserelleStripe()):
+            async def deux_appels():
+                return passerelle.client(), passerelle.client()
+
+            premier, meme = asyncio.run(deux_appels())
+            self.assertIs(premier, meme)
+            autre, _ = asyncio.run(deux_appels())
+            self.assertIsNot(premier, autre)
+
+    def test_disjoncteur(self):
+        disjoncteur = Disjoncteur("test", seuil=2, delai=30)
+        horloge = mock.patch("boutique.paiements.time.monotonic")
+        with horloge as maintenant:
+            maintenant.return_value = 100
+            disjoncteur.echec()
+            disjoncteur.verifier()  # sous le seuil : fermé
+            disjoncteur.echec()
+            self.assertEqual(disjoncteur.etat, "ouvert")
+            with self.assertRaises(CircuitOuvert):
+                disjoncteur.verifier()
+
+            # Semi-ouvert après le délai : un seul appel d'essai passe
+            maintenant.return_value = 131
+            disjoncteur.verifier()
+            with self.assertRaises(CircuitOuvert):
+                disjoncteur.verifier()
+            # L'essai échoue : ouvert pour un nouveau délai
+            disjoncteur.echec()
+            maintenant.return_value = 150
+            with self.assertRaises(CircuitOuvert):
+                disjoncteur.verifier()
+
+            # L'essai suivant réussit : fermé
+            maintenant.return_value = 162
+            disjoncteur.verifier()
+            disjoncteur.succes()
+            self.assertEqual(disjoncteur.etat, "ferme")
+            disjoncteur.verifier()
+
+    @override_settings(PAIEMENT_DISJONCTEUR_SEUIL=2)
+    def test_appel_mesure_et_disjoncte(self):
+        metriques = MetriquesPaiement()
+        passerelle = PasserelleCinetPay()
+        with mock.patch("boutique.paiements.metriques_paiement", metriques):
+            with passerelle.appel():
+                pass
+            for _ in range(2):
+                with self.assertRaises(ErreurPaiement):
+                    with passerelle.appel():
+                        raise httpx.ConnectError("refusé")
+            with self.assertRaises(CircuitOuvert):
+                with passerelle.appel():
+                    pass
+
+        stats = metriques.resume()["cinetpay"]
+        self.assertEqual((stats["appels"], stats["erreurs"]), (3, 2))
+        self.assertEqual(sum(stats["histogramme"]), 3)
+
+    def test_metriques_histogramme(self):
+        metriques = MetriquesPaiement()
+        for duree in (0.05, 0.3, 0.3, 20):
+            metriques.enregistrer("stripe", duree, succes=duree < 10)
+        stats = metriques.resume()["stripe"]
+        self.assertEqual((stats["appels"], stats["erreurs"], stats["duree_max"]), (4, 1, 20))
+        self.assertAlmostEqual(stats["duree_totale"], 20.65)
+        self.assertEqual(stats["histogramme"], [1, 0, 2, 0, 0, 0, 0, 1])
+
+
+class PaginationTests(CatalogueMixin, TestCase):
+    """Pagination par curseur : ordre total malgré les égalités, curseurs invalides ignorés."""
+
+    def setUp(self):
+        self.creer_produits(7)
+        # Prix, notes et nombres d'avis en double : l'id seul départage
+        for i, produit in enumerate(Produit.objects.order_by("id")):
+            Produit.objects.filter(pk=produit.pk).update(
+                prix=1000 + 500 * (i % 2), note_moyenne=3.5 if i % 3 else 4.0, avis_nombre=i % 2,
+            )
+
+    def parcourir(self, sort, taille):
+        ids, curseur = [], None
+        while True:
+            page, curseur = paginer(Produit.objects.all(), sort, curseur, taille)
+            ids += [produit.id for produit in page]
+            if curseur is None:
+                return ids
+
+    def test_egalites_sur_chaque_cle(self):
+        for sort, ordre in ORDRES.items():
+            attendu = list(Produit.objects.order_by(*ordre).values_list("id", flat=True))
+            for taille in (1, 2, 3, 7):
+                with self.subTest(sort=sort, taille=taille):
+                    self.assertEqual(self.parcourir(sort, taille), attendu)
+
+    @override_settings(CATALOGUE_PAGE_SIZE=2)
+    def test_curseur_invalide_repart_du_debut(self):
+        premiere, curseur = paginer(Produit.objects.all(), "prix_asc")
+        autre_tri = paginer(Produit.objects.all(), "note")[1]
+        falsifie = curseur[:-1] + ("A" if curseur[-1] != "A" else "B")
+        for invalide in (falsifie, autre_tri, "n'importe quoi", "a:b:c", curseur.split(":")[0]):
+            with self.subTest(curseur=invalide):
+                page, _ = paginer(Produit.objects.all(), "prix_asc", invalide)
+                self.assertEqual(page, premiere)
+                reponse = self.client.get(reverse("catalogue_page"), {"sort": "prix_asc", "curseur": invalide})
+                self.assertEqual(reponse.status_code, 200)
+                self.assertEqual([p["id"] for p in reponse.json()["produits"]], [p.id for p in premiere])
+
+        classement = list(Produit.objects.order_by("-id").values_list("id", flat=True))
+        page, _ = paginer_pertinence(Produit.objects.all(), classement, falsifie)
+        self.assertEqual([p.id for p in page], classement[:2])
+
+    @override_settings(CATALOGUE_PAGE_SIZE=2)
+    def test_page_apres_la_derniere(self):
+        ordre = ORDRES["prix_desc"]
+        dernier = Produit.objects.order_by(*ordre).last()
+        curseur = encoder_curseur("prix_desc", dernier, ordre)
+        self.assertEqual(paginer(Produit.objects.all(), "prix_desc", curseur), ([], None))
+        reponse = self.client.get(reverse("catalogue_page"), {"sort": "prix_desc", "curseur": curseur})
+        self.assertEqual(reponse.json(), {"produits": [], "html": "", "curseur_suivant": None})
+
+        # Dernière page pleine : pas de curseur vers une page vide
+        self.assertIsNone(paginer(Produit.objects.all(), "prix_desc", taille=7)[1])
+
+        classement = list(Produit.objects.values_list("id", flat=True))
+        curseur = paginer_pertinence(Produit.objects.all(), classement, taille=6)[1]
+        page, suivant = paginer_pertinence(Produit.objects.all(), classement, curseur)
+        self.assertEqual(([p.id for p in page], suivant), (classement[6:], None))
+
+
+class RechercheTests(TestCase):
+    """Index inversé en mémoire : fautes de frappe, rang, et index d'un autre processus tenu à jour."""
+
+    def setUp(self):
+        categorie = Categorie.objects.create(nom="Audio")
+        self.casque, self.enceinte, self.cable = [
+            Produit.objects.create(
+                nom=nom, description=description, categorie=categorie, prix=1000, stock=5, image="produits/test.jpg",
+            )
+            for nom, description in (
+                ("Casque Bluetooth", "Casque sans fil, réduction de bruit"),
+                ("Enceinte portable", "Enceinte Bluetooth étanche"),
+                ("Câble USB", "Compatible avec le casque et l'enceinte"),
+            )
+        ]
+
+    def test_fautes_de_frappe(self):
+        index = IndexInverse()
+        self.assertEqual(index.chercher("casqe", 10), index.chercher("casque", 10))
+        self.assertEqual(set(index.chercher("bluetoth", 10)), {self.casque.id, self.enceinte.id})
+        self.assertEqual(index.chercher("cable usb", 10), [self.cable.id])
+        self.assertEqual(index.chercher("xylophone", 10), [])
+
+    def test_rang(self):
+        index = IndexInverse()
+        # Le nom compte plus que la description
+        self.assertEqual(index.chercher("bluetooth", 10), [self.casque.id, self.enceinte.id])
+        self.assertEqual(index.chercher("casque", 10), [self.casque.id, self.cable.id])
+        self.assertEqual(index.chercher("casque", 1), [self.casque.id])
+
+    def test_autre_processus_voit_suppression_et_renommage(self):
+        autre = IndexInverse()  # index d'un autre worker, construit avant les modifications
+        self.assertIn(self.casque.id, autre.chercher("casque", 10))
+
+        self.casque.delete()
+        self.assertEqual(autre.chercher("casque", 10), [self.cable.id])
+
+        self.enceinte.nom = "Baffle portable"
+        self.enceinte.save()
+        self.assertEqual(autre.chercher("baffle", 10), [self.enceinte.id])
+
+    def test_sauvegarde_sans_texte_ne_reindexe_pas(self):
+        with CaptureQueriesContext(connection) as requetes:
+            self.casque.stock = 3
+            self.casque.save(update_fields=["stock"])
+            self.casque.prix = 900
+            self.casque.save()
+        self.assertFalse([q for q in requetes.captured_queries if "boutique_produitrecherche" in q["sql"]])
+
+        self.casque.description = "Nouveau modèle"
+        self.casque.save(update_fields=["description"])
+        self.assertIn("nouveau", ProduitRecherche.objects.get(produit=self.casque).document.split())
+
+
+class AvisTests(CatalogueMixin, TestCase):
+    """Statistiques d'avis tenues à jour sans agrégat, et pagination par curseur."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.produit, self.autre = self.creer_produits(2)
+
+    def poster(self, note, produit=None):
+        produit = produit or self.produit
+        return self.client.post(reverse("poster_avis", args=[produit.id]), {"note": note, "commentaire": "ok"})
+
+    def test_statistiques_incrementales(self):
+        for note in (5, 4, 4, 1):
+            self.poster(note)
+        self.poster(9)  # note invalide, ignorée
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.avis_nombre, 4)
+        self.assertEqual(self.produit.avis_somme, 14)
+        self.assertEqual([self.produit.avis_1, self.produit.avis_4, self.produit.avis_5], [1, 2, 1])
+        self.assertAlmostEqual(self.produit.note_moyenne, 3.5)
+
+        Avis.objects.filter(note=1).delete()
+        self.produit.refresh_from_db()
+        self.assertAlmostEqual(self.produit.note_moyenne, 13 / 3)
+
+    def test_reconciliation(self):
+        self.poster(5)
+        self.poster(3, self.autre)
+        Produit.objects.update(avis_nombre=0, avis_somme=0, avis_5=7, note_moyenne=0)
+        self.assertEqual(recalculer_statistiques(), 2)
+        self.assertEqual(recalculer_statistiques(), 0)
+        self.autre.refresh_from_db()
+        self.assertEqual((self.autre.avis_nombre, self.autre.avis_3, self.autre.note_moyenne), (1, 1, 3.0))
+
+    @override_settings(AVIS_PAGE_SIZE=2)
+    def test_pagination_avis(self):
+        for note in (1, 2, 3, 4, 5):
+            self.poster(note)
+        response = self.client.get(reverse("detail_produit", args=[self.produit.id]))
+        self.assertEqual([a.note for a in response.context["avis"]], [5, 4])
+        pages = []
+        curseur = response.context["avis_curseur"]
+        while curseur:
+            donnees = self.client.get(reverse("avis_page", args=[self.produit.id]), {"curseur": curseur}).json()
+            pages.append(donnees["html"].count("review-box"))
+            curseur = donnees["curseur_suivant"]
+        self.assertEqual(pages, [2, 1])
+
+    def test_tri_par_note(self):
+        self.poster(2)
+        self.poster(5, self.autre)
+        response = self.client.get(reverse("accueil"), {"sort": "note"})
+        ids = [carte["donnees"]["id"] for carte in response.context["cartes"]]
+        self.assertEqual(ids[:2], [self.autre.id, self.produit.id])
+        response = self.client.get(reverse("accueil"), {"note_min": 4})
+        self.assertEqual([carte["donnees"]["id"] for carte in response.context["cartes"]], [self.autre.id])
+
+
+@skipUnless(connection.vendor == "postgresql", "Plans d'exécution PostgreSQL")
+class IndexRequetesTests(CatalogueMixin, TestCase):
+    """
+    Chaque requête fréquente doit pouvoir être servie par un index.
+    Avec enable_seqscan = off, PostgreSQL ne choisit un parcours séquentiel
+    que s'il n'a aucun index utilisable : sa présence dans le plan signale
+    un index manquant (ou une requête qui ne peut plus s'en servir).
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.produit = self.creer_produits(1)[0]
+        self.panier = Panier.objects.create(utilisateur=self.user)
+
+    def assertIndexe(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan, f"{queryset.query}\n{plan}")
+        return plan
+
+    def test_requetes_frequentes(self):
+        categorie = self.produit.categorie_id
+        requetes = {
+            "catalogue par catégorie et prix": Produit.objects.filter(categorie_id=categorie).order_by("prix", "id")[:25],
+            "catalogue par prix": Produit.objects.order_by("-prix", "-id")[:25],
+            "catalogue en stock": Produit.objects.filter(categorie_id=categorie, stock__gt=0).order_by("id")[:25],
+            # Requête réelle de ?sort=note après la première page : tri et filtre du curseur
+            "catalogue par note": requete_page(
+                Produit.objects.all(), "note", encoder_curseur("note", self.produit, ORDRES["note"]), 24,
+            ),
+            "avis d'un produit": Avis.objects.filter(produit=self.produit).order_by("-date", "-id")[:5],
+            "commandes d'un client": Commande.objects.filter(utilisateur=self.user, statut="en_attente"),
+            "ligne de panier": LignePanier.objects.filter(panier=self.panier, produit=self.produit),
+            "réservations expirées": ReservationStock.objects.filter(statut="active", expire_le__lte=timezone.now()),
+            "webhooks à traiter": EvenementPaiement.objects.filter(statut="recu").order_by("recu_le"),
+        }
+        for nom, queryset in requetes.items():
+            with self.subTest(nom):
+                self.assertIndexe(queryset)
+        # Tri et filtre du curseur servis par l'index composite, pas seulement par note_moyenne
+        self.assertIn("produit_note_idx", self.assertIndexe(requetes["catalogue par note"]))
+
+
+class AjoutPanierTests(CatalogueMixin, TestCase):
+    """Ajout AJAX : une requête SQL, plafonné au stock disponible."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.produit, self.autre = self.creer_produits(2, stock=2)
+
+    def ajouter(self, produit):
+        return self.client.post(reverse("ajouter_au_panier_ajax", args=[produit.id]))
+
+    def test_ajout_et_plafond(self):
+        self.assertEqual(self.ajouter(self.produit).json()["total_items"], 1)  # crée le panier
+        self.assertEqual(self.ajouter(self.autre).json()["total_items"], 2)
+        with CaptureQueriesContext(connection) as requetes:
+            donnees = self.ajouter(self.produit).json()
+        self.assertEqual((donnees["quantite"], donnees["total_items"]), (2, 3))
+        # Session + utilisateur + l'upsert
+        self.assertEqual(len([q for q in requetes if "boutique_lignepanier" in q["sql"]]), 1)
+
+        reponse = self.ajouter(self.produit)
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse.json()["total_items"], 3)
+        self.assertEqual(LignePanier.objects.get(produit=self.produit).quantite, 2)
+
+    def test_rupture_et_produit_inconnu(self):
+        Produit.objects.filter(id=self.produit.id).update(stock=0)
+        self.assertEqual(self.ajouter(self.produit).status_code, 409)
+        self.assertEqual(self.client.post(reverse("ajouter_au_panier_ajax", args=[9999])).status_code, 404)
+        self.assertFalse(LignePanier.objects.exists())
+
+
+class PanierApiTests(CatalogueMixin, TestCase):
+    """Lot d'opérations appliqué en une transaction, panier recalculé en retour."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.a, self.b, self.c = self.creer_produits(3, stock=5)
+        panier = Panier.objects.create(utilisateur=self.user)
+        LignePanier.objects.create(panier=panier, produit=self.a, quantite=1)
+        LignePanier.objects.create(panier=panier, produit=self.b, quantite=2)
+
+    def envoyer(self, *operations):
+        return self.client.post(
+            reverse("panier_api"), json.dumps({"operations": list(operations)}), content_type="application/json",
+        )
+
+    def test_lot(self):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.envoyer(
+                {"op": "ajouter", "produit": self.a.id, "quantite": 2},
+                {"op": "definir", "produit": self.a.id, "quantite": 4},
+                {"op": "supprimer", "produit": self.b.id},
+                {"op": "ajouter", "produit": self.c.id, "quantite": 9},
+            )
+        donnees = reponse.json()
+        self.assertEqual({l["produit"]: l["quantite"] for l in donnees["lignes"]}, {self.a.id: 4, self.c.id: 5})
+        self.assertEqual(donnees["nombre_articles"], 9)
+        self.assertEqual(len(donnees["avertissements"]), 1)  # c plafonné au stock
+        ecritures = [q for q in requetes if q["sql"].startswith(("INSERT INTO \"boutique_lignepanier", "UPDATE \"boutique_lignepanier", "DELETE FROM \"boutique_lignepanier"))]
+        self.assertEqual(len(ecritures), 3)
+
+    def test_lot_invalide(self):
+        reponse = self.envoyer({"op": "vider", "produit": self.a.id})
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(LignePanier.objects.count(), 2)
+
+
+class PanierInviteTests(CatalogueMixin, TestCase):
+    """Panier anonyme dans un cookie signé, fusionné au panier du compte à la connexion."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.a, self.b = self.creer_produits(2, stock=3)
+
+    def test_ajout_sans_ecriture(self):
+        with CaptureQueriesContext(connection) as requetes:
+            self.client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))
+            reponse = self.client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))
+        self.assertEqual(reponse.json()["total_items"], 2)
+        self.assertFalse([q for q in requetes if not q["sql"].startswith("SELECT")])
+
+        for _ in range(2):
+            reponse = self.client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))
+        self.assertEqual(reponse.status_code, 409)  # stock de 3 atteint
+        reponse = self.client.get(reverse("panier"))
+        self.assertEqual([(i.produit_id, i.quantite) for i in reponse.context["items"]], [(self.a.id, 3)])
+        self.assertEqual(reponse.context["total"], 3000)
+
+    def test_fusion_a_la_connexion(self):
+        panier = Panier.objects.create(utilisateur=self.user)
+        LignePanier.objects.create(panier=panier, produit=self.a, quantite=2)
+        self.client.post(
+            reverse("panier_api"),
+            json.dumps({"operations": [{"op": "definir", "produit": self.a.id, "quantite": 2},
+                                       {"op": "ajouter", "produit": self.b.id}]}),
+            content_type="application/json",
+        )
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.post(reverse("login"), {"username": "client", "password": "secret"})
+        self.assertEqual(len([q for q in requetes if "boutique_lignepanier" in q["sql"]]), 1)
+        self.assertEqual(reponse.cookies["panier"].value, "")
+        quantites = dict(LignePanier.objects.values_list("produit_id", "quantite"))
+        self.assertEqual(quantites, {self.a.id: 3, self.b.id: 1})  # 2 + 2 plafonné au stock
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite sérialise les écritures")
+class AjoutPanierConcurrentTests(CatalogueMixin, TransactionTestCase):
+    """Des centaines d'ajouts simultanés : aucun incrément perdu, jamais au-delà du stock."""
+
+    AJOUTS = 300
+    THREADS = 20
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+
+    def ajouts_paralleles(self, produit):
+        def ajouter(_):
+            client = Client()
+            client.force_login(self.user)
+            try:
+                return client.post(reverse("ajouter_au_panier_ajax", args=[produit.id])).status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            return list(pool.map(ajouter, range(self.AJOUTS)))
+
+    def test_aucun_increment_perdu(self):
+        produit = self.creer_produits(1, stock=1000)[0]
+        statuts = self.ajouts_paralleles(produit)
+        self.assertEqual(statuts.count(200), self.AJOUTS)
+        self.assertEqual(LignePanier.objects.get().quantite, self.AJOUTS)
+
+    def test_plafond_de_stock(self):
+        produit = self.creer_produits(1, stock=120)[0]
+        statuts = self.ajouts_paralleles(produit)
+        self.assertEqual((statuts.count(200), statuts.count(409)), (120, self.AJOUTS - 120))
+        self.assertEqual(LignePanier.objects.get().quantite, 120)
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite sérialise les écritures")
+class CommandeConcurrenteTests(CatalogueMixin, TransactionTestCase):
+    """Des centaines de commandes simultanées sur un même produit : jamais de survente."""
+
+    CLIENTS = 300
+    THREADS = 20
+    STOCK = 250
+
+    def setUp(self):
+        self.produit, = self.creer_produits(1, stock=self.STOCK)
+        User.objects.bulk_create([User(username=f"client-{i}") for i in range(self.CLIENTS)])
+        self.clients = list(User.objects.order_by("id"))
+        paniers = Panier.objects.bulk_create([Panier(utilisateur=u) for u in self.clients])
+        LignePanier.objects.bulk_create([LignePanier(panier=p, produit=self.produit, quantite=1) for p in paniers])
+
+    def test_aucune_survente(self):
+        def commander(utilisateur):
+            try:
+                creer_commande(utilisateur, None)
+                return "commande"
+            except StockInsuffisant:
+                return "refus"
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            resultats = list(pool.map(commander, self.clients))
+
+        self.assertEqual((resultats.count("commande"), resultats.count("refus")), (self.STOCK, self.CLIENTS - self.STOCK))
+        self.produit.refresh_from_db()
+        self.assertEqual((self.produit.stock, self.produit.stock_reserve), (0, self.STOCK))
+        self.assertEqual(Commande.objects.count(), self.STOCK)
+        self.assertEqual(ReservationStock.objects.count(), self.STOCK)
+
+
+class VuesAsyncTests(CatalogueMixin, TestCase):
+    """
+    Vues async servies par le client ASGI : une lecture synchrone oubliée
+    (vue ou context processor) lèverait SynchronousOnlyOperation.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.a, self.b = self.creer_produits(2, stock=3)
+        panier = Panier.objects.create(utilisateur=self.user)
+        LignePanier.objects.create(panier=panier, produit=self.a, quantite=2)
+
+    async def test_pages_invite(self):
+        reponse = await self.async_client.get(reverse("accueil"))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.context["cartes"]), 2)
+        self.assertEqual(reponse.context["panier_count"], 0)
+        reponse = await self.async_client.get(reverse("detail_produit", args=[self.a.id]))
+        self.assertContains(reponse, self.a.nom)
+        self.assertEqual((await self.async_client.get(reverse("detail_produit", args=[999]))).status_code, 404)
+
+        reponse = await self.async_client.post(reverse("ajouter_au_panier_ajax", args=[self.b.id]))
+        self.assertEqual(reponse.json()["total_items"], 1)
+        reponse = await self.async_client.get(reverse("panier"))
+        self.assertEqual([item.produit_id for item in reponse.context["items"]], [self.b.id])
+
+    async def test_pages_connecte(self):
+        await self.async_client.aforce_login(self.user)
+        reponse = await self.async_client.get(reverse("panier"))
+        self.assertEqual(reponse.context["total"], 2000)
+        self.assertEqual(reponse.context["panier_count"], 2)
+
+        reponse = await self.async_client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))
+        self.assertEqual((reponse.json()["quantite"], reponse.json()["total_items"]), (3, 3))
+        reponse = await self.async_client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))
+        self.assertEqual(reponse.status_code, 409)  # stock atteint
+
+        reponse = await self.async_client.post(
+            reverse("panier_api"), json.dumps({"operations": [{"op": "supprimer", "produit": self.a.id}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(reponse.json()["nombre_articles"], 0)
+
+    async def test_confirmation_commande(self):
+        commande = await Commande.objects.acreate(utilisateur=self.user)
+        await commande.lignes.acreate(produit=self.a, quantite=2, prix_unitaire=1000)
+        url = reverse("confirmation_commande", args=[commande.id])
+        self.assertEqual((await self.async_client.get(url)).status_code, 302)  # connexion requise
+
+        await self.async_client.aforce_login(self.user)
+        reponse = await self.async_client.get(url)
+        self.assertEqual(reponse.context["total"], 2000)
+
+
+class TempsReelTests(CatalogueMixin, TestCase):
+    """Badge et stock poussés par WebSocket (couche Channels en mémoire)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.produit = self.creer_produits(1, stock=5)[0]
+        # Comme channels.testing (qui exige daphne) : le consumer ne doit pas
+        # fermer la connexion, et donc la transaction, du test
+        fermeture = mock.patch("channels.db.close_old_connections", lambda: None)
+        fermeture.start()
+        self.addCleanup(fermeture.stop)
+
+    async def connecter(self, user=None):
+        scope = {"type": "websocket", "path": "/ws/boutique/", "headers": [], "user": user}
+        client = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await client.send_input({"type": "websocket.connect"})
+        self.assertEqual((await client.receive_output())["type"], "websocket.accept")
+        return client
+
+    async def recevoir(self, client):
+        return json.loads((await client.receive_output())["text"])
+
+    async def fermer(self, *clients):
+        for client in clients:
+            await client.send_input({"type": "websocket.disconnect", "code": 1000})
+            await client.wait()
+
+    def valider(self, fonction, *args):
+        """Exécute une modification et ses callbacks on_commit (TestCase ne valide jamais)."""
+        with self.captureOnCommitCallbacks(execute=True):
+            fonction(*args)
+
+    async def test_badge_du_panier(self):
+        client = await self.connecter(self.user)
+        await sync_to_async(self.valider)(ajouter_ligne_panier, self.user, self.produit.id)
+        self.assertEqual(await self.recevoir(client), {"type": "panier", "total_items": 1})
+        await self.fermer(client)
+
+    async def test_stock_des_produits_suivis(self):
+        suiveur, autre = await self.connecter(), await self.connecter()
+        await suiveur.send_input({"type": "websocket.receive", "text": json.dumps({"suivre": [self.produit.id]})})
+        await suiveur.receive_nothing()  # abonnement traité
+
+        def vendre():
+            self.produit.stock = 0
+            self.produit.save()
+
+        await sync_to_async(self.valider)(vendre)
+        message = await self.recevoir(suiveur)
+        self.assertEqual((message["type"], message["id"], message["stock"]), ("produit", self.produit.id, 0))
+        self.assertTrue(await autre.receive_nothing())
+        await self.fermer(suiveur, autre)
+
+
+class BadgePanierTests(CatalogueMixin, TestCase):
+    """Compteur du badge : cache par utilisateur, tenu à jour par les modifications, ETag / 304."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.client.login(username="client", password="secret")
+        self.a, self.b = self.creer_produits(2, stock=5)
+        panier = Panier.objects.create(utilisateur=self.user)
+        LignePanier.objects.create(panier=panier, produit=self.a, quantite=2)
+
+    def test_etag_et_invalidation(self):
+        url = reverse("panier_badge")
+        reponse = self.client.get(url)
+        self.assertEqual(reponse.json(), {"total_items": 2})
+        etag = reponse["ETag"]
+
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((reponse.status_code, reponse.content), (304, b""))
+        self.assertFalse([q for q in requetes if "lignepanier" in q["sql"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("ajouter_au_panier_ajax", args=[self.b.id]))
+        reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.json(), {"total_items": 3})
+        self.assertNotEqual(reponse["ETag"], etag)
+
+        # L'ancien appel AJAX de l'accueil passe par le même chemin
+        reponse = self.client.get(reverse("accueil"), HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(reponse.json(), {"total_items": 3})
+
+    def test_invite(self):
+        self.client.logout()
+        reponse = self.client.get(reverse("panier_badge"))
+        self.assertEqual(reponse.json(), {"total_items": 0})
+        self.assertEqual(self.client.get(reverse("panier_badge"), HTTP_IF_NONE_MATCH=reponse["ETag"]).status_code, 304)
+
+
+class ContextProcessorsTests(CatalogueMixin, TestCase):
+    """categories et panier_count paresseux ; aucune visite en lecture ne crée de panier."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.a, self.b = self.creer_produits(2, stock=3)
+
+    def rendre(self, gabarit):
+        requete = RequestFactory().get("/")
+        requete.user = self.user
+        requete.session = {}
+        # Menu et compteur absents du cache : toute lecture irait en base
+        invalider(("catalogue", None), ("panier", self.user.id))
+        return engines.all()[0].from_string(gabarit).render(request=requete)
+
+    def test_valeurs_lues_seulement_si_utilisees(self):
+        with self.assertNumQueries(0):
+            self.rendre("{{ user.username }}")
+        with CaptureQueriesContext(connection) as requetes:
+            html = self.rendre("{{ panier_count }} {% for c in categories %}{{ c.nom }}{% endfor %}")
+        self.assertEqual(html, "0 Accessoires")
+        self.assertEqual(len(requetes), 2)
+
+    def test_aucun_panier_cree_en_lecture(self):
+        urls = [
+            reverse("accueil"), reverse("catalogue_page"), reverse("detail_produit", args=[self.a.id]),
+            reverse("panier"), reverse("panier_badge"),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(reverse("ajouter_au_panier_ajax", args=[self.a.id]))  # invité : cookie seulement
+        self.assertFalse(Panier.objects.exists())
+
+        self.client.login(username="client", password="secret")
+        for url in [*urls, reverse("passer_commande")]:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(Panier.objects.exists())
+
+        self.client.post(reverse("ajouter_au_panier_ajax", args=[self.b.id]))
+        self.assertEqual(Panier.objects.get().utilisateur, self.user)
+
+
+class CacheHttpTests(CatalogueMixin, TestCase):
+    """Pages du catalogue : ETag / Last-Modified tirés des versions, cache public pour les anonymes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.a, self.b = self.creer_produits(2, stock=5)
+
+    def test_accueil_anonyme(self):
+        url = reverse("accueil")
+        reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn("public", reponse["Cache-Control"])
+        self.assertIn("s-maxage=60", reponse["Cache-Control"])
+        self.assertIn("Cookie", reponse["Vary"])
+        # Même HTML pour tous les anonymes : ni jeton CSRF ni cookie posé
+        self.assertFalse(reponse.cookies)
+        etag = reponse["ETag"]
+
+        with self.assertNumQueries(0):
+            reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((reponse.status_code, reponse["ETag"]), (304, etag))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=reponse["Last-Modified"]).status_code, 304)
+
+        # Stock modifié en masse : seule la version de la carte change
+        Produit.objects.filter(id=self.a.id).update(stock=0)
+        incrementer_versions_produits([self.a.id])
+        reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse["ETag"], etag)
+
+    def test_detail_connecte(self):
+        url = reverse("detail_produit", args=[self.a.id])
+        etag_anonyme = self.client.get(url)["ETag"]
+
+        self.client.login(username="client", password="secret")
+        reponse = self.client.get(url)
+        self.assertIn("private", reponse["Cache-Control"])
+        etag = reponse["ETag"]
+        self.assertNotEqual(etag, etag_anonyme)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse("poster_avis", args=[self.a.id]), {"note": 4})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_jeton_csrf_fiche_produit(self):
+        client = Client(enforce_csrf_checks=True)
+        url = reverse("detail_produit", args=[self.a.id])
+        # Anonyme : page en cache public, jeton différé et aucun cookie posé
+        reponse = client.get(url)
+        self.assertContains(reponse, 'name="csrfmiddlewaretoken" value="" data-differe')
+        self.assertFalse(reponse.cookies)
+
+        # Connecté : page privée avec le vrai jeton, formulaires utilisables sans JavaScript
+        client.force_login(self.user)
+        reponse = client.get(url)
+        self.assertNotContains(reponse, "data-differe>")
+        jeton = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', reponse.content.decode())[1]
+        self.assertEqual(client.post(reverse("ajouter_au_panier", args=[self.a.id])).status_code, 403)
+        reponse = client.post(reverse("ajouter_au_panier", args=[self.a.id]), {"csrfmiddlewaretoken": jeton})
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(LignePanier.objects.get(panier__utilisateur=self.user).quantite, 1)
+
+    def test_messages_et_csrf_via_badge(self):
+        self.client.login(username="client", password="secret")
+        self.client.post(reverse("poster_avis", args=[self.a.id]), {"note": 9})
+
+        reponse = self.client.get(reverse("panier_badge"))
+        self.assertEqual(reponse.json()["messages"], [{"niveau": "error", "texte": "Veuillez choisir une note entre 1 et 5."}])
+        self.assertIn("csrftoken", reponse.cookies)
+        self.assertNotIn("messages", self.client.get(reverse("panier_badge")).json())
+
+
+class CacheCatalogueTests(CatalogueMixin, TestCase):
+    """Pages du listing, cartes et menu servis depuis le cache versionné."""
+
+    def setUp(self):
+        self.a, self.b = self.creer_produits(2)
+
+    def test_page_chaude_sans_requete(self):
+        for url in (reverse("accueil"), reverse("catalogue_page")):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                reponse = self.client.get(url)
+            self.assertContains(reponse, self.a.nom)
+
+    def test_categorie_invalide_ignoree(self):
+        url = reverse("accueil")
+        self.client.get(url)
+        # Même clé que le listing complet : aucune requête, aucun compteur créé
+        for valeur in ("abc", "-3", "0", ""):
+            with self.assertNumQueries(0):
+                reponse = self.client.get(url, {"categorie": valeur})
+            self.assertEqual(len(reponse.context["cartes"]), 2)
+            self.assertIsNone(cache.get(cle_version("categorie", valeur)))
+
+        reponse = self.client.get(url, {"categorie": self.a.categorie_id})
+        self.assertEqual(reponse.context["categorie_active"], self.a.categorie_id)
+
+    @override_settings(CATALOGUE_VERSION_TIMEOUT=60)
+    def test_compteurs_expirent(self):
+        with mock.patch.object(cache, "set_many", wraps=cache.set_many) as ecriture:
+            version("categorie", 10 ** 9)
+        self.assertEqual(ecriture.call_args.kwargs["timeout"], 60)
+
+    def test_menu_sans_produits(self):
+        autre = Categorie.objects.create(nom="Livres")
+        self.assertEqual(menu_categories(), [
+            {"id": self.a.categorie_id, "nom": "Accessoires"}, {"id": autre.id, "nom": "Livres"},
+        ])
+        with self.assertNumQueries(0):
+            menu_categories()
+        # Le tiroir ne liste que les catégories
+        reponse = self.client.get(reverse("accueil"))
+        self.assertContains(reponse, f'?categorie={autre.id}"')
+        self.assertNotContains(reponse, 'class="prod-link"')
+
+
+class CacheRedisTests(SimpleTestCase):
+    """Backend Redis : sérialisation msgpack et repli local quand Redis ne répond pas."""
+
+    def setUp(self):
+        self.serveur = f"redis://127.0.0.1:1/{random.randint(0, 10 ** 6)}"  # port fermé : connexion refusée
+        self.cache = CacheRedis(self.serveur, {"OPTIONS": {"serializer": SerialiseurMsgpack, "socket_connect_timeout": 0.5}})
+
+    def test_serialisation(self):
+        serialiseur = SerialiseurMsgpack()
+        self.assertEqual(serialiseur.dumps(12), 12)  # brut, pour incr()
+        for valeur in ({"ids": [1, 2], 3: None}, "texte", Decimal("12.50"), [1.5, True]):
+            self.assertEqual(serialiseur.loads(serialiseur.dumps(valeur)), valeur)
+        self.assertEqual(serialiseur.loads(serialiseur.dumps(([1], "curseur"))), [[1], "curseur"])
+
+    def test_repli_puis_purge(self):
+        with self.assertLogs("boutique.cache_redis", "WARNING"):
+            self.cache.set("version", 5, None)
+        self.assertEqual(self.cache.get("version"), 5)
+        self.assertEqual(self.cache.get_many(["version", "absente"]), {"version": 5})
+
+        # Redis revenu : la clé écrite pendant la panne est purgée avant la première lecture
+        etat = etat_serveur(self.serveur)
+        etat.indisponible_jusqua = 0
+        with mock.patch.object(RedisCacheClient, "delete_many") as purge, \
+                mock.patch.object(RedisCacheClient, "get", return_value=4) as lecture:
+            self.assertEqual(self.cache.get("version"), 4)
+        purge.assert_called_once_with([self.cache.make_key("version")])
+        lecture.assert_called_once()
+        self.assertFalse(etat.cles_a_purger)
+
+
+class MetriquesTests(CatalogueMixin, TestCase):
+    """Compteurs par vue (SQL, gabarits, cache) et export Prometheus."""
+
+    def setUp(self):
+        metriques_vues.donnees.clear()
+        self.a, = self.creer_produits(1)
+
+    def test_compteurs_par_vue(self):
+        self.client.get(reverse("detail_produit", args=[self.a.id]))
+        self.client.get(reverse("accueil"))
+        self.client.get(reverse("accueil"))
+        vues = metriques_vues.resume()
+
+        detail = vues["detail_produit"]
+        self.assertEqual(detail["requetes"], 1)
+        self.assertGreater(detail["sql_requetes"], 0)  # ORM async : compté dans le thread de sync_to_async
+        self.assertGreater(detail["gabarits_secondes"], 0)
+        self.assertEqual(vues["accueil"]["requetes"], 2)
+        self.assertGreater(vues["accueil"]["cache_succes"], 0)  # seconde visite : page et cartes en cache
+
+    def test_export_prometheus(self):
+        url = reverse("metriques")
+        self.client.get(reverse("accueil"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        with override_settings(METRIQUES_JETON="secret"):
+            reponse = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, 'boutique_requetes_total{vue="accueil"} 1')
+        self.assertContains(reponse, 'boutique_requete_duree_secondes_bucket{vue="accueil",le="+Inf"} 1')
+
+    @override_settings(METRIQUES_BUDGET_SQL=0)
+    def test_budget_sql(self):
+        with self.assertLogs("boutique.metriques", "WARNING") as logs:
+            self.client.get(reverse("detail_produit", args=[self.a.id]))
+        self.assertIn("detail_produit", logs.output[0])
+        self.assertEqual(metriques_vues.resume()["detail_produit"]["budget_depasse"], 1)
+
+
+class BancTests(CatalogueMixin, TestCase):
+    """Jeu de données, relevé des requêtes SQL et comparaison du banc d'essai."""
+
+    def test_peupler_puis_vider(self):
+        autre, = self.creer_produits(1)
+        crees = peupler(categories=2, produits=30, clients=4, commandes=6, avis=40, taille_lot=7)
+
+        self.assertEqual(crees, {"categories": 2, "produits": 30, "clients": 4, "commandes": 6, "avis": 40})
+        self.assertEqual(recalculer_statistiques(), 0)  # statistiques d'avis posées à la création
+        commande = Commande.objects.exclude(paiement=None).first()
+        self.assertEqual(commande.paiement.montant, sum(ligne.get_total() for ligne in commande.lignes.all()))
+        self.assertLess(commande.date_commande, timezone.now() - timedelta(minutes=30))  # historique
+        self.assertTrue(self.client.login(username="banc-0", password="banc-essai"))
+
+        vider()
+        self.assertEqual(list(Produit.objects.all()), [autre])
+        self.assertFalse(User.objects.filter(username__startswith="banc-").exists())
+        self.assertFalse(Avis.objects.exists())
+
+    def test_requetes_sql_par_etape(self):
+        metriques_vues.donnees.clear()
+        a, = self.creer_produits(1)
+        self.client.get(reverse("accueil"))
+        avant = lire_metriques(texte_prometheus())
+        self.client.get(reverse("detail_produit", args=[a.id]))
+        self.client.get(reverse("accueil"))
+        total, par_etape = requetes_sql(avant, lire_metriques(texte_prometheus()))
+
+        self.assertEqual(avant["accueil"]["requetes"], 1)
+        self.assertGreater(par_etape["detail_produit"], 0)
+        self.assertIsNone(par_etape["panier"])  # étape non visitée
+        self.assertEqual(total, round((par_etape["accueil"] + par_etape["detail_produit"]) / 2, 2))
+
+    def test_comparer(self):
+        resume = {"requetes": 100, "erreurs": 0, "rps": 50.0, "p50_ms": 10.0, "p95_ms": 40.0, "p99_ms": 80.0, "requetes_sql": 4.0}
+        reference = {"global": resume, "etapes": {"accueil": resume, "panier": resume}}
+        self.assertFalse(any(regression for *_, regression in comparer(reference, reference)))
+
+        mesure = {
+            "global": dict(resume, rps=48.0, p95_ms=45.0),  # dans les tolérances
+            "etapes": {"accueil": dict(resume, p99_ms=120.0, requetes_sql=5.0)},
+        }
+        regressions = {(etape, indicateur) for etape, indicateur, *_, regression in comparer(reference, mesure) if regression}
+        self.assertEqual(regressions, {("accueil", "p99_ms"), ("accueil", "requetes_sql"), ("panier", "absente")})
+
+
+class ImagesDeriveesTests(CatalogueMixin, TestCase):
+    """Déclinaisons WebP/JPEG d'une image produit, calculées une seule fois."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(MEDIA_ROOT=dossier.name, IMAGES_DERIVEES_FILE="synchrone")
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        (self.produit,) = self.creer_produits(1, image=self.enregistrer_image("rouge.png", (200, 30, 30, 128)))
+
+    def enregistrer_image(self, nom, couleur):
+        # Paysage 1200 × 800 avec transparence : réduit à chaque taille, aplati en JPEG
+        tampon = BytesIO()
+        Image.new("RGBA", (1200, 800), couleur).save(tampon, "PNG")
+        return default_storage.save(f"produits/{nom}", ContentFile(tampon.getvalue()))
+
+    def test_declinaisons(self):
+        derives = generer_derives(self.produit.id)
+        self.assertEqual(set(derives), {"source", *(f"{t}_{e}" for t in TAILLES for e in FORMATS)})
+        for taille, largeur in TAILLES.items():
+            for extension, format_pil, mode in (("webp", "WEBP", "RGBA"), ("jpeg", "JPEG", "RGB")):
+                with default_storage.open(derives[f"{taille}_{extension}"]) as fichier:
+                    image = Image.open(fichier)
+                    self.assertEqual((image.format, image.mode, image.width), (format_pil, mode, largeur))
+                    self.assertEqual(image.height, round(largeur * 2 / 3))
+
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.images_derivees, derives)
+        self.assertEqual(url_derive(self.produit, "carte", "webp"), default_storage.url(derives["carte_webp"]))
+        self.assertEqual(
+            srcset(self.produit),
+            ", ".join(f"{default_storage.url(derives[f'{t}_jpeg'])} {largeur}w" for t, largeur in TAILLES.items()),
+        )
+
+    def test_relance_idempotente(self):
+        derives = generer_derives(self.produit.id)
+        with mock.patch.object(default_storage, "save") as ecriture:
+            with self.assertNumQueries(1):
+                self.assertEqual(generer_derives(self.produit.id), derives)
+            # Même contenu sur un autre produit : fichiers partagés, rien n'est réencodé
+            (copie,) = self.creer_produits(1, image=self.produit.image.name)
+            self.assertEqual(generer_derives(copie.id), derives)
+        ecriture.assert_not_called()
+
+    def test_nouvel_upload(self):
+        ancien = generer_derives(self.produit.id)
+        self.produit.image = self.enregistrer_image("bleu.png", (30, 30, 200, 255))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit.save()
+        self.produit.refresh_from_db()
+        self.assertNotEqual(self.produit.images_derivees["source"], ancien["source"])
+        self.assertTrue(default_storage.exists(self.produit.images_derivees["detail_webp"]))
+
+    def test_commande(self):
+        sortie = StringIO()
+        call_command("generer_images_derivees", "--processus=1", stdout=sortie)
+        self.assertIn("1 produit(s) traité(s), 0 erreur(s)", sortie.getvalue())
+        self.produit.refresh_from_db()
+        derives = self.produit.images_derivees
+
+        sortie = StringIO()
+        with mock.patch.object(default_storage, "save") as ecriture:
+            call_command("generer_images_derivees", "--processus=1", stdout=sortie)
+            self.assertEqual(sortie.getvalue(), "")  # plus rien sans déclinaisons
+            call_command("generer_images_derivees", "--processus=1", "--tous", stdout=sortie)
+        ecriture.assert_not_called()
+        self.assertIn("1 produit(s) traité(s)", sortie.getvalue())
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.images_derivees, derives)
+
+
+class VentesTests(CatalogueMixin, TestCase):
+    """Agrégats de ventes par jour : au fil des paiements, reconstruction, tableau de bord."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("client", password="secret")
+        self.a, self.b = self.creer_produits(2)
+        self.c = Produit.objects.create(
+            nom="Montre", categorie=Categorie.objects.create(nom="Montres"), description="Description",
+            prix=5000, stock=10, image="produits/test.jpg",
+        )
+
+    def payer(self, methode, *lignes):
+        commande = Commande.objects.create(utilisateur=self.user)
+        for produit, quantite in lignes:
+            commande.lignes.create(produit=produit, quantite=quantite, prix_unitaire=produit.prix)
+        return enregistrer_paiement(commande, 0, methode)[0]
+
+    def agregats(self):
+        champs = ("chiffre_affaires", "unites", "commandes")
+        return (
+            sorted(VenteJour.objects.values_list("jour", "methode", *champs)),
+            sorted(VenteJourCategorie.objects.values_list("jour", "categorie_id", "methode", *champs)),
+            sorted(VenteJourProduit.objects.values_list("jour", "produit_id", "categorie_id", "methode", *champs)),
+        )
+
+    def test_paiement_cumule_une_seule_fois(self):
+        paiement = self.payer("carte", (self.a, 2), (self.c, 1))
+        self.payer("carte", (self.a, 1))
+        enregistrer_paiement(paiement.commande, 0, "carte")  # webhook en double : sans effet
+
+        jour = timezone.localdate()
+        self.assertEqual(VenteJour.objects.values_list("jour", "chiffre_affaires", "unites", "commandes").get(),
+                         (jour, 8000, 4, 2))
+        self.assertEqual(
+            dict(VenteJourCategorie.objects.values_list("categorie_id", "commandes")),
+            {self.a.categorie_id: 2, self.c.categorie_id: 1},
+        )
+        self.assertEqual(VenteJourProduit.objects.get(produit=self.a).unites, 3)
+
+    def test_reconstruction_identique(self):
+        self.payer("carte", (self.a, 2), (self.b, 1))
+        self.payer("cinetpay", (self.a, 1), (self.c, 3))
+        ancien = self.payer("carte", (self.b, 4))
+        # Paiement arrivé après l'expiration d'une commande dont le stock est revendu : jamais cumulé
+        epuisee = Commande.objects.create(utilisateur=self.user, statut="annulee")
+        epuisee.lignes.create(produit=self.c, quantite=20, prix_unitaire=self.c.prix)
+        epuisee.reservations.create(produit=self.c, quantite=20, statut="expiree", expire_le=timezone.now())
+        with self.assertLogs("boutique.commandes", "WARNING"):
+            self.assertEqual(enregistrer_paiement(epuisee, 0, "carte")[0].statut, "a_rembourser")
+        # Paiement d'avant-hier : cumulé aujourd'hui, puis déplacé
+        avant_hier = timezone.now() - timedelta(days=2)
+        Paiement.objects.filter(pk=ancien.pk).update(date_paiement=avant_hier)
+        VenteJourProduit.objects.filter(produit=self.b, unites=4).delete()
+        VenteJourCategorie.objects.all().delete()
+        VenteJour.objects.all().delete()
+
+        aujourdhui = timezone.localdate()
+        reconstruire(aujourdhui, aujourdhui)
+        call_command(
+            "reconstruire_ventes", f"--debut={aujourdhui - timedelta(days=3)}", f"--fin={aujourdhui - timedelta(days=1)}",
+            "--jours-par-lot=1", "--processus=1", stdout=StringIO(),  # les threads ne verraient pas la transaction du test
+        )
+        jours, categories, produits = self.agregats()
+        self.assertEqual(jours, [
+            (timezone.localdate(avant_hier), "carte", 4000, 4, 1),
+            (aujourdhui, "carte", 3000, 3, 1),
+            (aujourdhui, "cinetpay", 16000, 4, 1),
+        ])
+
+        # Même résultat qu'au fil des paiements
+        Paiement.objects.filter(pk=ancien.pk).update(date_paiement=timezone.now())
+        reconstruire(aujourdhui - timedelta(days=2), aujourdhui)
+        reconstruits = self.agregats()
+        for modele in (VenteJour, VenteJourCategorie, VenteJourProduit):
+            modele.objects.all().delete()
+        for paiement in Paiement.objects.exclude(statut="a_rembourser"):
+            cumuler_paiement(paiement)
+        self.assertEqual(self.agregats(), reconstruits)
+
+    def test_tableau_de_bord_ne_lit_que_les_agregats(self):
+        self.payer("carte", (self.c, 2))
+        self.payer("cinetpay", (self.a, 1))
+        User.objects.create_superuser("admin", password="secret")
+        self.client.login(username="admin", password="secret")
+
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(reverse("admin:boutique_ventejour_changelist"), {"jours": 7})
+        self.assertContains(response, "Montre")
+        self.assertContains(response, "11")  # 11 000 XOF
+        tables = ("boutique_commande", "boutique_lignecommande", "boutique_paiement")
+        self.assertFalse([q["sql"] for q in requetes.captured_queries if any(t in q["sql"] for t in tables)])
@@ -4,14 +4,18 @@ from . import views
 
 urlpatterns = [
     path('', views.accueil, name='accueil'),
+    path('catalogue/page/', views.catalogue_page, name='catalogue_page'),  # scroll infini (JSON)
     path('produit/<int:produit_id>/', views.detail_produit, name='detail_produit'),
     path('produit/<int:produit_id>/poster-avis/', views.poster_avis, name='poster_avis'),  # poster un avis
+    path('produit/<int:produit_id>/avis/', views.avis_page, name='avis_page'),
     
     path("panier/", views.panier_view, name="panier"), # affichage du panier
     path('ajouter_au_panier/<int:produit_id>/', views.ajouter_au_panier, name='ajouter_au_panier'),
     path("ajouter-au-panier/<int:produit_id>/ajax/", views.ajouter_au_panier_ajax, name="ajouter_au_panier_ajax"),
     path("panier/supprimer/<int:ligne_id>/", views.supprimer_du_panier, name="supprimer_du_panier"),
     path("panier/maj/<int:ligne_id>/", views.maj_quantite, name="maj_quantite"),
+    path("panier/api/", views.panier_api, name="panier_api"),  # modifications groupées (JSON)
+    path("panier/badge/", views.panier_badge, name="panier_badge"),  # compteur du badge (ETag)
 
     path('passer_commande/', views.passer_commande, name='passer_commande'),
     path('confirmer_commande/<int:adresse_id>/', views.confirmer_commande, name='confirmer_commande'),
@@ -19,7 +23,10 @@ urlpatterns = [
     path('confirmation_commande/<int:commande_id>/', views.confirmation_commande, name='confirmation_commande'),
     path('paiement-success/<int:commande_id>/', views.paiement_success, name='paiement_success'),
     #path('paiement-whatsapp/<int:commande_id>/', views.paiement_whatsapp, name='paiement_whatsapp'),
+    path('stripe-webhook/', views.stripe_webhook, name='stripe_webhook'),
+    path('cinetpay-webhook/', views.cinetpay_webhook, name='cinetpay_webhook'),
     path('contact/', views.contact, name='contact'),
+    path('metriques/', views.metriques, name='metriques'),  # Prometheus
 
     
     
@@ -1,6 +1,324 @@
 # boutique/utils.py
-from .models import Panier
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from .cache_catalogue import PREFIXE, aversion, invalider, timeout, version
+from .metriques import compter_cache
+from .models import LignePanier, Panier, Produit
+from .temps_reel import diffuser_panier
+
+# Prix effectif d'une ligne : prix promo s'il est renseigné (et non nul), sinon prix
+PRIX_EFFECTIF = Coalesce(NullIf('produit__prix_promo', Value(Decimal('0'))), 'produit__prix')
+
+RESUME_VIDE = {'nombre_articles': 0, 'total': 0, 'nombre_lignes': 0}
+
+# Panier invité : cookie signé "produit:quantité,produit:quantité" (aucune écriture en base)
+COOKIE_PANIER = "panier"
+COOKIE_PANIER_SALT = "boutique.panier.invite"
+DUREE_COOKIE_PANIER = 60 * 60 * 24 * 30
+MAX_LIGNES_INVITE = 50
+
 
 def get_or_create_panier(user):
+    """À n'utiliser qu'au moment d'ajouter un produit : le panier n'existe qu'à partir de là."""
     panier, created = Panier.objects.get_or_create(utilisateur=user)
     return panier
+
+
+def sql_ajout_panier():
+    """
+    Ajout d'une unité en une seule instruction (PostgreSQL et SQLite >= 3.35) :
+    - la ligne est créée (quantité 1) ou incrémentée grâce à la contrainte
+      unique (panier, produit), sans lecture préalable ni perte d'incrément
+      entre deux clics simultanés ;
+    - l'incrément n'a lieu que si la quantité reste sous le stock disponible ;
+    - RETURNING renvoie la quantité, le nouveau nombre d'articles du panier et
+      le nom du produit. Les autres lignes sont sommées à part : une
+      sous-requête du RETURNING ne voit pas la ligne qu'on vient d'écrire.
+    Aucune ligne renvoyée : produit introuvable, stock atteint ou pas de panier.
+    """
+    q = connection.ops.quote_name
+    ligne, panier, produit = (q(m._meta.db_table) for m in (LignePanier, Panier, Produit))
+    return f"""
+        INSERT INTO {ligne} AS l (panier_id, produit_id, quantite)
+        SELECT pa.id, p.id, 1
+        FROM {panier} pa, {produit} p
+        WHERE pa.utilisateur_id = %(utilisateur)s AND p.id = %(produit)s AND p.stock > 0
+        ON CONFLICT (panier_id, produit_id) DO UPDATE
+        SET quantite = l.quantite + 1
+        WHERE l.quantite < (SELECT stock FROM {produit} WHERE id = excluded.produit_id)
+        RETURNING
+            quantite,
+            quantite + (
+                SELECT COALESCE(SUM(autre.quantite), 0)
+                FROM {ligne} autre JOIN {panier} pa ON pa.id = autre.panier_id
+                WHERE pa.utilisateur_id = %(utilisateur)s AND autre.produit_id <> %(produit)s
+            ),
+            (SELECT nom FROM {produit} WHERE id = %(produit)s)
+    """
+
+
+def ajouter_ligne_panier(user, produit_id):
+    """
+    Ajoute une unité du produit au panier de l'utilisateur (voir sql_ajout_panier).
+    Retourne (quantite, nombre_articles, nom_produit), ou None si l'ajout est
+    refusé (produit introuvable ou stock atteint).
+    """
+    parametres = {'utilisateur': user.id, 'produit': produit_id}
+    with connection.cursor() as cursor:
+        cursor.execute(sql_ajout_panier(), parametres)
+        resultat = cursor.fetchone()
+        if resultat is None:
+            # Peut-être le premier ajout : le panier est créé si besoin, puis on réessaie
+            get_or_create_panier(user)
+            cursor.execute(sql_ajout_panier(), parametres)
+            resultat = cursor.fetchone()
+    if resultat is not None:
+        panier_modifie(user.id, resultat[1])
+    return resultat
+
+
+def vider_panier(user):
+    LignePanier.objects.filter(panier__utilisateur=user).delete()
+    panier_modifie(getattr(user, 'pk', user), 0)
+
+
+def charger_lignes_panier(user):
+    """
+    Lignes du panier avec leur produit (une seule requête) et les montants
+    calculés en base : prix_unitaire et total_ligne sont prêts pour le template.
+    """
+    return (
+        LignePanier.objects
+        .filter(panier__utilisateur=user)
+        .select_related('produit')
+        .annotate(prix_unitaire=PRIX_EFFECTIF, total_ligne=PRIX_EFFECTIF * F('quantite'))
+        .order_by('id')
+    )
+
+
+AGREGATS_RESUME = {
+    'nombre_articles': Coalesce(Sum('quantite'), 0),
+    'total': Coalesce(Sum(PRIX_EFFECTIF * F('quantite')), Decimal('0')),
+    'nombre_lignes': Count('id'),
+}
+
+
+def calculer_resume_panier(user):
+    """Nombre d'articles, total et nombre de lignes du panier en une seule requête."""
+    return LignePanier.objects.filter(panier__utilisateur=user).aggregate(**AGREGATS_RESUME)
+
+
+async def acalculer_resume_panier(user):
+    return await LignePanier.objects.filter(panier__utilisateur=user).aaggregate(**AGREGATS_RESUME)
+
+
+def resume_panier(request):
+    """
+    Résumé du panier de l'utilisateur courant, mémorisé sur la requête :
+    vues, context processor et endpoints AJAX partagent la même requête SQL.
+    """
+    if not hasattr(request, '_resume_panier'):
+        if request.user.is_authenticated:
+            request._resume_panier = calculer_resume_panier(request.user)
+        else:
+            request._resume_panier = calculer_resume_invite(lire_panier_invite(request))
+    return request._resume_panier
+
+
+async def aresume_panier(request):
+    if not hasattr(request, '_resume_panier'):
+        user = await request.auser()
+        if user.is_authenticated:
+            request._resume_panier = await acalculer_resume_panier(user)
+        else:
+            request._resume_panier = await acalculer_resume_invite(lire_panier_invite(request))
+    return request._resume_panier
+
+
+def nombre_articles_panier(request):
+    """
+    Compteur du badge : résumé du panier s'il est déjà calculé, sinon compteur
+    en cache (voir compteur_panier) ; pour un invité, lu dans le cookie.
+    """
+    if request.user.is_authenticated:
+        if hasattr(request, '_resume_panier'):
+            return request._resume_panier['nombre_articles']
+        if not hasattr(request, '_compteur_panier'):
+            request._compteur_panier = compteur_panier(request.user.pk)
+        return request._compteur_panier
+    return sum(lire_panier_invite(request).values())
+
+
+async def anombre_articles_panier(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        if hasattr(request, '_resume_panier'):
+            return request._resume_panier['nombre_articles']
+        if not hasattr(request, '_compteur_panier'):
+            request._compteur_panier = await acompteur_panier(user.pk)
+        return request._compteur_panier
+    return sum(lire_panier_invite(request).values())
+
+
+def invalider_resume_panier(request):
+    """À appeler après une modification du panier dans la requête en cours."""
+    request.__dict__.pop('_resume_panier', None)
+    request.__dict__.pop('_compteur_panier', None)
+
+
+# ---------------------------------------------------------------------------
+# Compteur du badge (cache par utilisateur)
+# ---------------------------------------------------------------------------
+
+# Le compteur est rangé sous une clé versionnée (version "panier:<id>", comme
+# le catalogue) : une modification incrémente la version au lieu d'écrire la
+# valeur, donc un lecteur en retard ne peut pas remettre en cache un ancien
+# compteur. La version sert aussi d'ETag au badge.
+
+def cle_compteur_panier(utilisateur_id, generation):
+    return f"{PREFIXE}:badge:{utilisateur_id}:{generation}"
+
+
+def compter_articles(utilisateur_id):
+    return LignePanier.objects.filter(panier__utilisateur_id=utilisateur_id).aggregate(
+        n=Coalesce(Sum('quantite'), 0)
+    )['n']
+
+
+def compteur_panier(utilisateur_id, generation=None):
+    """Nombre d'articles du panier, depuis le cache (une requête au plus après une modification)."""
+    cle = cle_compteur_panier(utilisateur_id, generation or version("panier", utilisateur_id))
+    nombre = cache.get(cle)
+    compter_cache(nombre is not None, nombre is None)
+    if nombre is None:
+        nombre = compter_articles(utilisateur_id)
+        cache.set(cle, nombre, timeout=timeout())
+    return nombre
+
+
+async def acompteur_panier(utilisateur_id, generation=None):
+    cle = cle_compteur_panier(utilisateur_id, generation or await aversion("panier", utilisateur_id))
+    nombre = await cache.aget(cle)
+    compter_cache(nombre is not None, nombre is None)
+    if nombre is None:
+        nombre = (await LignePanier.objects.filter(panier__utilisateur_id=utilisateur_id).aaggregate(
+            n=Coalesce(Sum('quantite'), 0)
+        ))['n']
+        await cache.aset(cle, nombre, timeout=timeout())
+    return nombre
+
+
+def panier_modifie(utilisateur_id, nombre_articles=None):
+    """
+    À appeler après toute modification du panier d'un utilisateur : le
+    compteur en cache est périmé (tout de suite et au COMMIT), puis le nouveau
+    compteur est recalculé et poussé aux onglets ouverts (temps_reel).
+    `nombre_articles` : compteur déjà connu (RETURNING), diffusé tel quel.
+    """
+    invalider(("panier", utilisateur_id))
+
+    def publier():
+        nombre = nombre_articles
+        if nombre is None:
+            nombre = compteur_panier(utilisateur_id)
+        diffuser_panier(utilisateur_id, nombre)
+
+    transaction.on_commit(publier)
+
+
+# ---------------------------------------------------------------------------
+# Panier invité (cookie signé)
+# ---------------------------------------------------------------------------
+
+def decoder_panier_invite(valeur):
+    quantites = {}
+    for element in (valeur or "").split(","):
+        produit_id, _, quantite = element.partition(":")
+        if produit_id.isdigit() and quantite.isdigit() and int(quantite) > 0:
+            quantites[int(produit_id)] = int(quantite)
+        if len(quantites) >= MAX_LIGNES_INVITE:
+            break
+    return quantites
+
+
+def encoder_panier_invite(quantites):
+    return ",".join(f"{produit_id}:{quantite}" for produit_id, quantite in quantites.items() if quantite > 0)
+
+
+def lire_panier_invite(request):
+    """{produit_id: quantité} du visiteur anonyme, mémorisé sur la requête."""
+    if not hasattr(request, '_panier_invite'):
+        valeur = request.get_signed_cookie(COOKIE_PANIER, default="", salt=COOKIE_PANIER_SALT)
+        request._panier_invite = decoder_panier_invite(valeur)
+    return request._panier_invite
+
+
+def enregistrer_panier_invite(request, response, quantites):
+    """Mémorise le nouveau panier invité sur la requête et dans le cookie de la réponse."""
+    quantites = {pid: q for pid, q in quantites.items() if q > 0}
+    request._panier_invite = quantites
+    invalider_resume_panier(request)
+    if quantites:
+        response.set_signed_cookie(
+            COOKIE_PANIER, encoder_panier_invite(quantites), salt=COOKIE_PANIER_SALT,
+            max_age=DUREE_COOKIE_PANIER, httponly=True, samesite="Lax",
+        )
+    else:
+        oublier_panier_invite(response)
+    return response
+
+
+def oublier_panier_invite(response):
+    response.delete_cookie(COOKIE_PANIER, samesite="Lax")
+    return response
+
+
+def charger_lignes_invite(quantites):
+    """
+    Lignes du panier invité sous forme de LignePanier non enregistrées, avec
+    prix_unitaire et total_ligne comme charger_lignes_panier (une requête).
+    """
+    return construire_lignes_invite(quantites, Produit.objects.in_bulk(list(quantites)))
+
+
+async def acharger_lignes_invite(quantites):
+    return construire_lignes_invite(quantites, await Produit.objects.ain_bulk(list(quantites)))
+
+
+def construire_lignes_invite(quantites, produits):
+    lignes = []
+    for produit_id, quantite in quantites.items():
+        produit = produits.get(produit_id)
+        if produit is None:
+            continue
+        ligne = LignePanier(produit=produit, quantite=quantite)
+        ligne.prix_unitaire = produit.prix_promo or produit.prix
+        ligne.total_ligne = ligne.prix_unitaire * quantite
+        lignes.append(ligne)
+    return lignes
+
+
+def calculer_resume_invite(quantites):
+    if not quantites:
+        return dict(RESUME_VIDE)
+    return resumer_lignes(charger_lignes_invite(quantites))
+
+
+async def acalculer_resume_invite(quantites):
+    if not quantites:
+        return dict(RESUME_VIDE)
+    return resumer_lignes(await acharger_lignes_invite(quantites))
+
+
+def resumer_lignes(lignes):
+    """Résumé (comme calculer_resume_panier) de lignes déjà chargées."""
+    return {
+        'nombre_articles': sum(ligne.quantite for ligne in lignes),
+        'total': sum((ligne.total_ligne for ligne in lignes), Decimal('0')),
+        'nombre_lignes': len(lignes),
+    }
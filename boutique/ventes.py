@@ -0,0 +1,216 @@
+# boutique/ventes.py
+"""
+Agrégats de ventes par jour : chiffre d'affaires, unités et commandes, par
+méthode de paiement, au total (VenteJour), par catégorie (VenteJourCategorie)
+et par produit (VenteJourProduit).
+
+- cumuler_paiement() les incrémente dans la transaction qui enregistre le
+  paiement (commandes.enregistrer_paiement) : trois INSERT ... ON CONFLICT
+  DO UPDATE qui agrègent les lignes de cette seule commande ;
+- reconstruire() recalcule une plage de jours depuis les paiements (commande
+  reconstruire_ventes, par tranches en parallèle) ;
+- tableau() fournit au tableau de bord de l'admin ses séries, sans toucher
+  aux commandes ni aux paiements.
+
+Le jour est la date locale (TIME_ZONE) du paiement. Les lignes dont le
+produit a été supprimé ne comptent que dans VenteJour. La catégorie retenue
+est celle du produit au paiement ; une reconstruction reprend la catégorie
+actuelle.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Categorie, LigneCommande, Paiement, Produit, VenteJour, VenteJourCategorie, VenteJourProduit
+
+AGREGATS = (VenteJour, VenteJourCategorie, VenteJourProduit)
+
+CUMULS = ("chiffre_affaires", "unites", "commandes")
+
+MONTANT = DecimalField(max_digits=14, decimal_places=2)
+
+
+# ---------------------------------------------------------------------------
+# Mise à jour au fil des paiements
+# ---------------------------------------------------------------------------
+
+def sql_cumul(modele, cles, selection, autres=()):
+    """
+    INSERT ... SELECT qui ajoute la sélection aux compteurs de la ligne
+    existante (contrainte unique sur cles). La sélection renvoie cles, autres
+    puis les cumuls, dans cet ordre.
+    """
+    q = connection.ops.quote_name
+    colonnes = ", ".join([*cles, *autres, *CUMULS])
+    cumuls = ", ".join(f"{c} = v.{c} + excluded.{c}" for c in CUMULS)
+    return f"""
+        INSERT INTO {q(modele._meta.db_table)} AS v ({colonnes})
+        {selection}
+        ON CONFLICT ({", ".join(cles)}) DO UPDATE SET {cumuls}
+    """
+
+
+def requetes_cumul():
+    q = connection.ops.quote_name
+    lignes, produits = (q(m._meta.db_table) for m in (LigneCommande, Produit))
+    montant = "SUM(l.quantite * l.prix_unitaire)"
+    return (
+        sql_cumul(VenteJour, ("jour", "methode"), f"""
+            SELECT %(jour)s, %(methode)s, COALESCE({montant}, 0), COALESCE(SUM(l.quantite), 0), 1
+            FROM {lignes} l WHERE l.commande_id = %(commande)s
+        """),
+        sql_cumul(VenteJourCategorie, ("jour", "categorie_id", "methode"), f"""
+            SELECT %(jour)s, p.categorie_id, %(methode)s, {montant}, SUM(l.quantite), 1
+            FROM {lignes} l JOIN {produits} p ON p.id = l.produit_id
+            WHERE l.commande_id = %(commande)s
+            GROUP BY p.categorie_id
+        """),
+        sql_cumul(VenteJourProduit, ("jour", "produit_id", "methode"), f"""
+            SELECT %(jour)s, l.produit_id, %(methode)s, p.categorie_id, {montant}, SUM(l.quantite), 1
+            FROM {lignes} l JOIN {produits} p ON p.id = l.produit_id
+            WHERE l.commande_id = %(commande)s
+            GROUP BY l.produit_id, p.categorie_id
+        """, autres=("categorie_id",)),
+    )
+
+
+def cumuler_paiement(paiement):
+    """Ajoute la commande payée aux agrégats de son jour. À appeler une seule fois par paiement."""
+    parametres = {
+        "jour": timezone.localdate(paiement.date_paiement),
+        "methode": paiement.methode,
+        "commande": paiement.commande_id,
+    }
+    with connection.cursor() as cursor:
+        for sql in requetes_cumul():
+            cursor.execute(sql, parametres)
+
+
+# ---------------------------------------------------------------------------
+# Reconstruction
+# ---------------------------------------------------------------------------
+
+def decouper(debut, fin, jours):
+    """Tranches (début, fin) de `jours` jours au plus, bornes incluses."""
+    while debut <= fin:
+        tranche = min(debut + timedelta(days=jours - 1), fin)
+        yield debut, tranche
+        debut = tranche + timedelta(days=1)
+
+
+def periode_paiements():
+    """Jours (locaux) du premier et du dernier paiement, (None, None) sans paiement."""
+    dates = Paiement.objects.order_by("date_paiement").values_list("date_paiement", flat=True)
+    premier, dernier = dates.first(), dates.last()
+    if premier is None:
+        return None, None
+    return timezone.localdate(premier), timezone.localdate(dernier)
+
+
+def inserer(modele, colonnes, requete):
+    """INSERT ... SELECT : l'agrégation reste dans la base, aucune ligne ne transite par Python."""
+    sql, parametres = requete.values_list(*colonnes).query.sql_with_params()
+    q = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {q(modele._meta.db_table)} ({', '.join(map(q, colonnes))}) {sql}", parametres,
+        )
+        return cursor.rowcount
+
+
+def reconstruire(debut, fin):
+    """
+    Recalcule les agrégats des jours debut..fin (inclus) depuis les paiements,
+    en une transaction. Retourne le nombre de lignes écrites.
+    """
+    depuis = timezone.make_aware(datetime.combine(debut, time.min))
+    jusqua = timezone.make_aware(datetime.combine(fin + timedelta(days=1), time.min))
+    montant = Sum(F("quantite") * F("prix_unitaire"), output_field=MONTANT)
+
+    # Comme cumuler_paiement, on écarte les paiements reçus trop tard (à rembourser)
+    paiements = (
+        Paiement.objects.filter(date_paiement__gte=depuis, date_paiement__lt=jusqua)
+        .exclude(statut="a_rembourser")
+        .annotate(jour=TruncDate("date_paiement"))
+        .values("jour", "methode")
+        .annotate(
+            chiffre_affaires=Coalesce(
+                Sum(F("commande__lignes__quantite") * F("commande__lignes__prix_unitaire"), output_field=MONTANT),
+                Value(0, output_field=MONTANT),
+            ),
+            unites=Coalesce(Sum("commande__lignes__quantite"), 0),
+            commandes=Count("id", distinct=True),
+        )
+    )
+    lignes = (
+        LigneCommande.objects.filter(
+            commande__paiement__date_paiement__gte=depuis,
+            commande__paiement__date_paiement__lt=jusqua,
+            produit__isnull=False,
+        )
+        .exclude(commande__paiement__statut="a_rembourser")
+        .annotate(
+            jour=TruncDate("commande__paiement__date_paiement"),
+            methode=F("commande__paiement__methode"),
+            categorie_id=F("produit__categorie_id"),
+        )
+    )
+    cumuls = {"chiffre_affaires": montant, "unites": Sum("quantite"), "commandes": Count("commande", distinct=True)}
+    categories = lignes.values("jour", "methode", "categorie_id").annotate(**cumuls)
+    produits = lignes.values("jour", "methode", "produit_id", "categorie_id").annotate(**cumuls)
+
+    with transaction.atomic():
+        for modele in AGREGATS:
+            modele.objects.filter(jour__range=(debut, fin)).delete()
+        return (
+            inserer(VenteJour, ("jour", "methode", *CUMULS), paiements)
+            + inserer(VenteJourCategorie, ("jour", "categorie_id", "methode", *CUMULS), categories)
+            + inserer(VenteJourProduit, ("jour", "produit_id", "categorie_id", "methode", *CUMULS), produits)
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tableau de bord
+# ---------------------------------------------------------------------------
+
+def tableau(debut, fin, nombre=10):
+    """Séries du tableau de bord sur debut..fin, lues dans les seuls agrégats."""
+    cumuls = {c: Sum(c) for c in CUMULS}
+    ventes = VenteJour.objects.filter(jour__range=(debut, fin))
+    par_jour = list(ventes.values("jour").annotate(**cumuls).order_by("jour"))
+    par_methode = list(ventes.values("methode").annotate(**cumuls).order_by("-chiffre_affaires", "methode"))
+    totaux = ventes.aggregate(**cumuls)
+
+    categories = list(
+        VenteJourCategorie.objects.filter(jour__range=(debut, fin))
+        .values("categorie_id").annotate(**cumuls).order_by("-chiffre_affaires", "categorie_id")[:nombre]
+    )
+    produits = list(
+        VenteJourProduit.objects.filter(jour__range=(debut, fin))
+        .values("produit_id").annotate(**cumuls).order_by("-chiffre_affaires", "produit_id")[:nombre]
+    )
+    # Noms des seules lignes affichées (recherche par clé primaire)
+    noms = dict(Categorie.objects.filter(pk__in=[c["categorie_id"] for c in categories]).values_list("id", "nom"))
+    for categorie in categories:
+        categorie["nom"] = noms.get(categorie["categorie_id"], f"Catégorie supprimée #{categorie['categorie_id']}")
+    noms = dict(Produit.objects.filter(pk__in=[p["produit_id"] for p in produits]).values_list("id", "nom"))
+    for produit in produits:
+        produit["nom"] = noms.get(produit["produit_id"], f"Produit supprimé #{produit['produit_id']}")
+
+    # Largeur des barres (%) par rapport au meilleur jour
+    maximum = max((j["chiffre_affaires"] for j in par_jour), default=0)
+    for jour in par_jour:
+        jour["part"] = round(jour["chiffre_affaires"] * 100 / maximum) if maximum else 0
+
+    return {
+        "debut": debut,
+        "fin": fin,
+        "totaux": {c: totaux[c] or 0 for c in CUMULS},
+        "par_jour": par_jour,
+        "par_methode": par_methode,
+        "categories": categories,
+        "produits": produits,
+    }
@@ -1,111 +1,238 @@
-from django.http import Http404, JsonResponse
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, F, Sum
 from django.urls import reverse
-
-import requests
-import stripe
-
-from ecommerce import settings
-from .models import (
-    AdresseLivraison, Avis, Commande, LigneCommande, Paiement,
-    Produit, Panier, LignePanier, Categorie
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .models import AdresseLivraison, Commande, Paiement, Produit, LignePanier
+from .avis import NoteInvalide, ajouter_avis, apaginer_avis, lire_note, paginer_avis, statistiques
+from .cache_catalogue import acartes_produits, apage_catalogue, aversion, lire_categorie
+from .cache_http import avalidateurs, mettre_en_cache, non_modifiee
+from .commandes import (
+    PanierVide, StockInsuffisant, aassurer_totaux, commande_expiree, creer_commande, prolonger_reservations,
 )
+from .context_processors import aprecharger
 from .forms import AdresseLivraisonForm, ContactForm, InscriptionForm
-from .utils import get_or_create_panier
+from .metriques import acces_autorise, texte_prometheus
+from .paiements import ErreurPaiement, get_passerelle
+from .panier import (
+    OperationInvalide, aappliquer_operations_invite, aetat_panier, aetat_panier_invite, appliquer_operations,
+    appliquer_operations_invite, fusionner_panier_invite, lire_operations,
+)
+from .pagination import apaginer, apaginer_pertinence
+from .recherche import rechercher
+from .webhooks import SignatureInvalide, recevoir_cinetpay, recevoir_stripe
+from .utils import (
+    acalculer_resume_panier, acharger_lignes_invite, acompteur_panier, ajouter_ligne_panier, anombre_articles_panier,
+    aresume_panier, charger_lignes_panier, enregistrer_panier_invite, get_or_create_panier,
+    lire_panier_invite, oublier_panier_invite, panier_modifie, resume_panier,
+)
 
-from boutique import models
+# Vues async (accueil, fiche produit, panier, confirmation, endpoints AJAX du
+# panier) : lectures par l'ORM async, puis aprecharger() avant le rendu pour
+# que les context processors ne retombent pas sur des requêtes synchrones.
+# Les écritures transactionnelles (upsert, lot du panier) et la recherche
+# restent synchrones, appelées via sync_to_async.
 
-def accueil(request):
-    produits = Produit.objects.select_related('categorie').all()
+def filtrer_catalogue(request, classement=None):
+    """
+    Applique les filtres ?categorie= et ?q= communs à l'accueil et au scroll infini.
+    Retourne (produits, categorie_id, q, classement) où classement est la liste
+    d'ids triée par pertinence quand une recherche est faite, sinon None.
+    `classement` : résultat de rechercher(q) déjà calculé par l'appelant.
+    """
+    produits = Produit.objects.select_related('categorie')
 
-    # Filtre par catégorie
-    categorie_id = request.GET.get('categorie')
+    # Filtre par catégorie (ignoré si invalide, comme la clé du cache des pages)
+    categorie_id = lire_categorie(request.GET.get('categorie'))
     if categorie_id:
-        try:
-            categorie_id = int(categorie_id)
-            produits = produits.filter(categorie_id=categorie_id)
-        except ValueError:
-            pass  # ignore si catégorie invalide
+        produits = produits.filter(categorie_id=categorie_id)
 
-    # Recherche par mot-clé
+    # Recherche par mot-clé (index plein texte, voir recherche.py)
     q = request.GET.get('q')
     if q:
-        produits = produits.filter(
-            Q(nom__icontains=q) |
-            Q(description__icontains=q)
-        )
+        if classement is None:
+            classement = rechercher(q)
+        produits = produits.filter(id__in=classement)
+    else:
+        classement = None
+
+    # "En stock" (index partiel produit_en_stock_idx)
+    if request.GET.get('sort') == 'stock':
+        produits = produits.filter(stock__gt=0)
+
+    # Note minimale (?note_min=4) : colonne dénormalisée, sans jointure sur Avis
+    try:
+        produits = produits.filter(note_moyenne__gte=lire_note(request.GET.get('note_min')))
+    except NoteInvalide:
+        pass
+
+    return produits, categorie_id, q, classement
+
 
-    # Tri des produits
+async def afiltrer_catalogue(request):
+    q = request.GET.get('q')
+    # Le moteur de recherche (index en mémoire ou SQL brut) est synchrone
+    classement = await sync_to_async(rechercher)(q) if q else None
+    return filtrer_catalogue(request, classement)
+
+
+async def apaginer_catalogue(produits, sort, curseur, classement):
+    # Sans tri explicite, une recherche est servie par ordre de pertinence
+    if classement is not None and not sort:
+        return await apaginer_pertinence(produits, classement, curseur)
+    return await apaginer(produits, sort, curseur)
+
+
+async def accueil(request):
+    # Ancien rafraîchissement du badge (AJAX sur l'accueil) : voir panier_badge
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return await panier_badge(request)
+
+    # Validateurs calculés avant le rendu : menu (catalogue) et cartes de la page
+    user = await request.auser()
+    ids, curseur_suivant, produits = await page_demandee(request)
+    etag, last_modified = await avalidateurs(
+        user, [("catalogue", None), *[("produit", pid) for pid in ids]], ids, curseur_suivant,
+    )
+    response = non_modifiee(request, etag, last_modified)
+    if response is None:
+        response = await rendre_accueil(request, ids, curseur_suivant, produits)
+    return mettre_en_cache(response, user, etag, last_modified)
+
+
+async def rendre_accueil(request, ids, curseur_suivant, produits):
+    # Badge chargé par le navigateur (panier_badge) : la page reste la même pour tous les anonymes
+    await aprecharger(request, badge=False)
+    cartes = await acartes_produits(ids, produits)
     sort = request.GET.get('sort')
-    if sort == "prix_asc":
-        produits = produits.order_by('prix')
-    elif sort == "prix_desc":
-        produits = produits.order_by('-prix')
-    elif sort == "nouveaux":
-        produits = produits.order_by('-id')
-
-    # Total items pour badge (corrigé pour éviter None)
-    total_items = 0
-    if request.user.is_authenticated:
-        panier = get_or_create_panier(request.user)
-        total_items = panier.lignes.aggregate(total=Sum('quantite'))['total']
-        if total_items is None:
-            total_items = 0
+    q = request.GET.get('q')
 
     context = {
-        'produits': produits,
-        'categories': Categorie.objects.all(),
-        'categorie_active': int(categorie_id) if categorie_id else None,
+        'cartes': cartes,
+        'curseur_suivant': curseur_suivant,
+        'categories': request._menu_categories,
+        'categorie_active': lire_categorie(request.GET.get('categorie')),
         'tri_actif': sort or '',
         'q': q or '',
-        'total_items': total_items,  # pour badge initial
+        'note_min': request.GET.get('note_min', ''),
+        'badge_differe': True,
     }
 
-    # Si requête AJAX pour le badge uniquement
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({'total_items': total_items})
-
     return render(request, 'accueil.html', context)
 
 
+async def page_cartes(request):
+    """
+    Cartes produits (données + HTML) de la page demandée et curseur suivant.
+    Page et cartes viennent du cache versionné ; la base n'est lue qu'en cas d'absence.
+    """
+    ids, curseur_suivant, produits = await page_demandee(request)
+    return await acartes_produits(ids, produits), curseur_suivant
+
+
+async def page_demandee(request):
+    """(ids, curseur_suivant, produits) de la page demandée, via le cache des pages."""
+    params = {cle: request.GET.get(cle, '') for cle in ('categorie', 'q', 'sort', 'note_min', 'curseur')}
+
+    async def calculer():
+        produits, categorie_id, q, classement = await afiltrer_catalogue(request)
+        return await apaginer_catalogue(produits, params['sort'], params['curseur'], classement)
+
+    return await apage_catalogue(params, calculer)
+
+
+async def catalogue_page(request):
+    """
+    Page suivante du catalogue en JSON pour le scroll infini.
+    GET ?categorie=&q=&sort=&note_min=&curseur=<curseur opaque>
+    """
+    cartes, curseur_suivant = await page_cartes(request)
+    return JsonResponse({
+        'produits': [carte['donnees'] for carte in cartes],
+        'html': ''.join(carte['html'] for carte in cartes),
+        'curseur_suivant': curseur_suivant,
+    })
+
 
-def detail_produit(request, produit_id):
-    produit = get_object_or_404(Produit, id=produit_id)
-    produits_similaires = Produit.objects.filter(categorie=produit.categorie).exclude(id=produit.id)[:4]
-    avis = Avis.objects.filter(produit=produit).order_by('-date')[:5]  # les 5 derniers avis
+
+async def detail_produit(request, produit_id):
+    # Produit (stock, avis) et catalogue (menu, prix des produits similaires)
+    user = await request.auser()
+    etag, last_modified = await avalidateurs(user, [("produit", produit_id), ("catalogue", None)])
+    response = non_modifiee(request, etag, last_modified)
+    if response is None:
+        response = await rendre_detail_produit(request, produit_id)
+    return mettre_en_cache(response, user, etag, last_modified)
+
+
+async def rendre_detail_produit(request, produit_id):
+    produit = await aget_object_or_404(Produit, id=produit_id)
+    produits_similaires = [
+        p async for p in Produit.objects.filter(categorie_id=produit.categorie_id).exclude(id=produit.id)[:4]
+    ]
+    # Première page des avis (les plus récents), la suite est chargée par avis_page
+    avis, avis_curseur = await apaginer_avis(produit.id)
+    await aprecharger(request, badge=False)
 
     return render(request, 'boutique/detail_produit.html', {
         'produit': produit,
         'produits_similaires': produits_similaires,
-        'avis': avis
+        'avis': avis,
+        'avis_curseur': avis_curseur,
+        'notes': statistiques(produit),
+        'badge_differe': True,
     })
 
 
+def avis_page(request, produit_id):
+    """
+    Avis suivants d'un produit en JSON ("Voir plus d'avis").
+    GET ?curseur=<curseur opaque>
+    """
+    avis, curseur_suivant = paginer_avis(produit_id, request.GET.get('curseur'))
+    return JsonResponse({
+        'html': render_to_string('boutique/_avis.html', {'avis': avis}),
+        'curseur_suivant': curseur_suivant,
+    })
+
 
 def poster_avis(request, produit_id):
     produit = get_object_or_404(Produit, id=produit_id)
     if request.method == "POST" and request.user.is_authenticated:
-        note = int(request.POST.get('note'))
-        commentaire = request.POST.get('commentaire')
-        Avis.objects.create(utilisateur=request.user, produit=produit, note=note, commentaire=commentaire)
+        try:
+            note = lire_note(request.POST.get('note'))
+        except NoteInvalide:
+            messages.error(request, "Veuillez choisir une note entre 1 et 5.")
+        else:
+            ajouter_avis(request.user, produit, note, request.POST.get('commentaire', ''))
     return redirect('detail_produit', produit_id=produit.id)
 
 #>>>>>>>>>>>>>>>>>>>>>>>>>>>>A REVOIR AVEC PRECISION>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
-# ✅ Fonction pour récupérer ou créer un panier lié à l'utilisateur
-def get_or_create_panier(user):
-    panier, created = Panier.objects.get_or_create(utilisateur=user)
-    return panier
 
-
-
-@login_required(login_url='login')
 def ajouter_au_panier(request, produit_id):
     produit = get_object_or_404(Produit, id=produit_id)
+
+    if not request.user.is_authenticated:
+        # Visiteur anonyme : panier du cookie, même règle (pas d'incrémentation)
+        if produit.id in lire_panier_invite(request):
+            return redirect('panier')
+        quantites, avertissements = appliquer_operations_invite(request, [("ajouter", produit.id, 1)])
+        for avertissement in avertissements:
+            messages.error(request, avertissement["message"])
+        return enregistrer_panier_invite(request, redirect('panier'), quantites)
+
     panier = get_or_create_panier(request.user)
 
     # On ajoute sans incrémentation
@@ -115,38 +242,140 @@ def ajouter_au_panier(request, produit_id):
     return redirect('panier')
 
 
+async def ajouter_au_panier_invite(request, produit_id):
+    """Ajout AJAX d'un visiteur anonyme : panier du cookie signé, aucune écriture en base."""
+    produit = await aget_object_or_404(Produit, id=produit_id)
+    avant = lire_panier_invite(request).get(produit.id, 0)
+    quantites, avertissements = await aappliquer_operations_invite(request, [("ajouter", produit.id, 1)])
 
-# ✅ Ajouter un produit au panier
-@login_required(login_url='login')
-def ajouter_au_panier_ajax(request, produit_id):
-    if request.method == "POST":
-        produit = get_object_or_404(Produit, id=produit_id)
-        panier = get_or_create_panier(request.user)
-
-        ligne, created = LignePanier.objects.get_or_create(panier=panier, produit=produit)
-
-        if not created:
-            ligne.quantite += 1
-            ligne.save()
+    if quantites.get(produit.id, 0) <= avant:
+        return JsonResponse({
+            "success": False,
+            "message": avertissements[0]["message"] if avertissements else "Ajout impossible",
+            "total_items": sum(lire_panier_invite(request).values()),
+        }, status=409)
+
+    response = JsonResponse({
+        "success": True,
+        "message": f"{produit.nom} ajouté au panier !",
+        "quantite": quantites[produit.id],
+        "total_items": sum(quantites.values()),
+    })
+    return enregistrer_panier_invite(request, response, quantites)
 
-        # Compteur total du panier
-        total_items = sum(l.quantite for l in panier.lignes.all())
 
+# ✅ Ajouter un produit au panier
+async def ajouter_au_panier_ajax(request, produit_id):
+    if request.method == "POST":
+        user = await request.auser()
+        if not user.is_authenticated:
+            return await ajouter_au_panier_invite(request, produit_id)
+
+        # Une seule requête : upsert plafonné au stock + nouveau compteur du panier
+        # (SQL brut sur un curseur : pas d'équivalent async, d'où sync_to_async)
+        resultat = await sync_to_async(ajouter_ligne_panier)(user, produit_id)
+
+        if resultat is None:
+            produit = await aget_object_or_404(Produit, id=produit_id)
+            return JsonResponse({
+                "success": False,
+                "message": f"Stock insuffisant pour {produit.nom} ({produit.stock} disponible(s))",
+                "total_items": (await acalculer_resume_panier(user))['nombre_articles'],
+            }, status=409)
+
+        quantite, total_items, nom = resultat
         return JsonResponse({
             "success": True,
-            "message": f"{produit.nom} ajouté au panier !",
+            "message": f"{nom} ajouté au panier !",
+            "quantite": quantite,
             "total_items": total_items,
         })
     return JsonResponse({"success": False}, status=400)
 
 
+async def panier_api(request):
+    """
+    Panier en JSON. GET : état courant.
+    POST {"operations": [...]} : lot d'ajouts / quantités / suppressions appliqué
+    en une transaction (voir panier.py), puis état recalculé.
+    Pour un visiteur anonyme, le lot s'applique au panier du cookie.
+    """
+    operations = None
+    if request.method == "POST":
+        try:
+            operations = lire_operations(json.loads(request.body or b"{}"))
+        except (ValueError, OperationInvalide) as e:
+            return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        quantites, avertissements = lire_panier_invite(request), []
+        if operations:
+            quantites, avertissements = await aappliquer_operations_invite(request, operations)
+        response = JsonResponse({"success": True, "avertissements": avertissements, **await aetat_panier_invite(quantites)})
+        return enregistrer_panier_invite(request, response, quantites) if operations else response
+
+    avertissements = []
+    if operations:
+        # Transaction + verrous de lignes : l'ORM async ne gère pas les transactions
+        avertissements = await sync_to_async(appliquer_operations)(user, operations)
+    return JsonResponse({"success": True, "avertissements": avertissements, **await aetat_panier(user)})
+
+
+@require_GET
+async def panier_badge(request):
+    """
+    Compteur du badge en JSON, sans template ni context processors.
+    Utilisateur connecté : compteur en cache, ETag = version du compteur, donc
+    un badge inchangé est confirmé (304 sans corps) sans même lire le compteur.
+    Invité : compteur du cookie, sans requête.
+    C'est aussi la partie personnelle des pages en cache public (voir cache_http) :
+    messages en attente et cookie CSRF des formulaires.
+    """
+    user = await request.auser()
+    if "CSRF_COOKIE" not in request.META:
+        get_token(request)
+
+    en_attente = messages.get_messages(request)
+    if len(en_attente):
+        response = JsonResponse({
+            'total_items': await anombre_articles_panier(request),
+            'messages': [{'niveau': message.level_tag, 'texte': str(message)} for message in en_attente],
+        })
+        patch_cache_control(response, private=True, no_store=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    if user.is_authenticated:
+        generation = await aversion("panier", user.pk)
+        etag = f'"{generation}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse({'total_items': await acompteur_panier(user.pk, generation)})
+    else:
+        total_items = sum(lire_panier_invite(request).values())
+        etag = f'"i{total_items}"'
+        response = get_conditional_response(request, etag=etag) or JsonResponse({'total_items': total_items})
+
+    response['ETag'] = etag
+    # Toujours revalider (le 304 est quasi gratuit), jamais en cache partagé
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
 #>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>A REVOIR AVEC PRECISION###############
 # ✅ Afficher le panier
-@login_required(login_url='login')
-def panier_view(request):
-    panier = get_or_create_panier(request.user)
-    items = panier.lignes.all()
-    total = panier.get_total()
+async def panier_view(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        items = [item async for item in charger_lignes_panier(user)]
+        total = (await aresume_panier(request))['total']
+    else:
+        items = await acharger_lignes_invite(lire_panier_invite(request))
+        total = sum(item.total_ligne for item in items)
+    # Après le résumé : le badge reprend son nombre d'articles, sans second agrégat
+    await aprecharger(request)
 
     context = {
         "items": items,
@@ -162,8 +391,10 @@ def register_view(request):
             user = form.save()
             # Connexion automatique de l'utilisateur
             login(request, user)
+            # Le panier constitué avant l'inscription est conservé
+            fusionner_panier_invite(request, user)
             messages.success(request, f"Bienvenue {user.username}, votre compte a été créé et vous êtes connecté 🎉.")
-            return redirect('accueil')  # Redirige vers accueil ou panier directement
+            return oublier_panier_invite(redirect('accueil'))  # Redirige vers accueil ou panier directement
     else:
         form = InscriptionForm()
     return render(request, 'register.html', {'form': form})
@@ -177,8 +408,10 @@ def login_view(request):
         user = authenticate(request, username=username, password=password)
         if user:
             login(request, user)
+            # Panier invité fusionné dans le panier du compte, puis cookie supprimé
+            fusionner_panier_invite(request, user)
             messages.success(request, "Connexion réussie ✅.")
-            return redirect('accueil')  # Redirige vers accueil ou panier
+            return oublier_panier_invite(redirect('accueil'))  # Redirige vers accueil ou panier
         else:
             messages.error(request, "Nom d'utilisateur ou mot de passe incorrect ❌.")
 
@@ -199,8 +432,7 @@ def maj_quantite(request, ligne_id):
     Met à jour la quantité d'une ligne de panier identifiée par ligne_id.
     Reçoit POST {'quantite': <int>} et redirige vers la page panier.
     """
-    panier = get_or_create_panier(request.user)
-    ligne = get_object_or_404(LignePanier, id=ligne_id, panier=panier)
+    ligne = get_object_or_404(LignePanier, id=ligne_id, panier__utilisateur=request.user)
 
     if request.method == 'POST':
         q = request.POST.get('quantite', '')
@@ -213,6 +445,7 @@ def maj_quantite(request, ligne_id):
         # si quantité <= 0 => on supprime la ligne
         if quantite <= 0:
             ligne.delete()
+            panier_modifie(request.user.id)
             messages.info(request, "Produit supprimé du panier.")
             return redirect('panier')
 
@@ -236,12 +469,12 @@ def supprimer_du_panier(request, ligne_id):
     Option : on accepte POST pour supprimer (plus sûr), mais on peut accepter GET aussi.
     Ici on accepte POST et GET pour compatibilité.
     """
-    panier = get_or_create_panier(request.user)
-    ligne = get_object_or_404(LignePanier, id=ligne_id, panier=panier)
+    ligne = get_object_or_404(LignePanier, id=ligne_id, panier__utilisateur=request.user)
 
     # Si POST demandé, supprimer. Si GET (lien), on peut aussi supprimer après confirmation.
     if request.method == 'POST' or request.method == 'GET':
         ligne.delete()
+        panier_modifie(request.user.id)
         messages.success(request, "Produit supprimé du panier.")
 
     return redirect('panier')
@@ -251,9 +484,8 @@ def supprimer_du_panier(request, ligne_id):
 
 @login_required
 def passer_commande(request):
-    panier = get_object_or_404(Panier, utilisateur=request.user)
-    items = panier.lignes.all()
-    total = panier.get_total()
+    items = charger_lignes_panier(request.user)
+    total = resume_panier(request)['total']
 
     # Gestion ajout adresse
     if request.method == "POST" and "add_adresse" in request.POST:
@@ -279,23 +511,16 @@ def passer_commande(request):
 
 @login_required
 def confirmer_commande(request, adresse_id):
-    panier = get_object_or_404(Panier, utilisateur=request.user)
     adresse = get_object_or_404(AdresseLivraison, id=adresse_id, utilisateur=request.user)
-    items = panier.lignes.all()
-    if not items:
-        return redirect("panier")
 
-    # Création commande
-    commande = Commande.objects.create(
-        utilisateur=request.user,
-        adresse_livraison=adresse
-    )
-    for item in items:
-        commande.lignes.create(
-            produit=item.produit,
-            quantite=item.quantite,
-            prix_unitaire=item.produit.prix_promo if item.produit.prix_promo else item.produit.prix
-        )
+    # Création commande + réservation du stock (transaction unique, voir commandes.py)
+    try:
+        commande = creer_commande(request.user, adresse)
+    except PanierVide:
+        return redirect("panier")
+    except StockInsuffisant as e:
+        messages.error(request, f"{e}.")
+        return redirect("panier")
 
     # 👉 on NE vide PAS encore le panier
     return redirect('paiement', commande_id=commande.id)
@@ -303,169 +528,111 @@ def confirmer_commande(request, adresse_id):
 
 
 
-stripe.api_key = settings.STRIPE_SECRET_KEY  # Clé secrète Stripe
 
 @login_required
-def paiement(request, commande_id):
-    commande = get_object_or_404(Commande, id=commande_id, utilisateur=request.user)
-    total = int(sum([ligne.get_total() for ligne in commande.lignes.all()]))
+async def paiement(request, commande_id):
+    """
+    Choix du mode de paiement puis redirection vers le fournisseur. Async : la
+    création de la session (Stripe, CinetPay) n'immobilise pas de worker.
+    """
+    user = await aprecharger(request)
+    commande = await aget_object_or_404(Commande, id=commande_id, utilisateur=user)
+    if commande_expiree(commande):
+        messages.error(request, "Le délai de paiement de cette commande est dépassé, le stock a été libéré.")
+        return redirect("panier")
+    total = int((await aassurer_totaux(commande)).sous_total)
+
+    whatsapp = get_passerelle("whatsapp")
+
+    async def afficher(error=None):
+        # Lignes lues (ORM async) seulement quand la page est affichée
+        return render(request, "boutique/paiement.html", {
+            "commande": commande,
+            "lignes": [ligne async for ligne in commande.lignes.select_related("produit")],
+            "total": total,
+            # 🔥 Liens WhatsApp avec message pré-rempli
+            "whatsapp_liens": whatsapp.liens(commande, total),
+            "whatsapp_reservation_heures": int(whatsapp.duree_reservation().total_seconds() // 3600),
+            "error": error,
+        })
 
-    # 🔥 Numéros WhatsApp + message pré-rempli
-    raw_numbers = ["+33 6 65 74 33 08", "+223 94 22 81 38"]
-    whatsapp_numbers = [num.replace(" ", "").replace("+", "") for num in raw_numbers]
-    whatsapp_message = f"Informer nous avant de payer par Orange Money. Merci 🙏.\nCommande #{commande.id}, Montant : {total} FCFA"
+    passerelle = get_passerelle(request.POST.get("methode")) if request.method == "POST" else None
+    if passerelle is None:
+        return await afficher()
 
-    if request.method == "POST":
-        methode = request.POST.get("methode")
-
-        # 🚀 Stripe → paiement direct
-        if methode == "carte":
-            try:
-                session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
-                        'price_data': {
-                            'currency': 'xof',
-                            'unit_amount': int(total),
-                            'product_data': {'name': f'Commande #{commande.id}'},
-                        },
-                        'quantity': 1,
-                    }],
-                    mode='payment',
-                    success_url=request.build_absolute_uri(
-                        reverse("paiement_success", args=[commande.id])
-                    ),
-                    cancel_url=request.build_absolute_uri(
-                        reverse("confirmation_commande", args=[commande.id])
-                    ),
-                    metadata={'commande_id': commande.id}
-                )
-                return redirect(session.url, code=303)
-
-            except Exception as e:
-                return render(request, "boutique/paiement.html", {
-                    "commande": commande,
-                    "total": total,
-                    "error": f"Erreur Stripe: {str(e)}",
-                    "whatsapp_numbers": whatsapp_numbers,
-                    "whatsapp_message": whatsapp_message
-                })
-
-        # 🚀 CinetPay → paiement direct
-        elif methode == "cinetpay":
-            url = "https://sandbox.cinetpay.com/v1/payment"
-            data = {
-                "apikey": settings.CINETPAY_API_KEY,
-                "site_id": settings.CINETPAY_SITE_ID,
-                "transaction_id": f"CMD{commande.id}",
-                "amount": total,
-                "currency": "XOF",
-                "description": f"Paiement commande #{commande.id}",
-                "return_url": request.build_absolute_uri(
-                    reverse("paiement_success", args=[commande.id])
-                ),
-                "notify_url": request.build_absolute_uri('/cinetpay-webhook/')
-            }
-            try:
-                response = requests.post(url, json=data, timeout=10)
-                result = response.json()
-                payment_url = result.get("payment_url")
-                if payment_url:
-                    return redirect(payment_url)
-                else:
-                    return render(request, "boutique/paiement.html", {
-                        "commande": commande,
-                        "total": total,
-                        "error": "Impossible de créer la session CinetPay. Réponse: " + str(result),
-                        "whatsapp_numbers": whatsapp_numbers,
-                        "whatsapp_message": whatsapp_message
-                    })
-            except Exception as e:
-                return render(request, "boutique/paiement.html", {
-                    "commande": commande,
-                    "total": total,
-                    "error": f"Erreur CinetPay: {str(e)}",
-                    "whatsapp_numbers": whatsapp_numbers,
-                    "whatsapp_message": whatsapp_message
-                })
-
-        # 🚀 WhatsApp (confirmation obligatoire)
-        elif methode == "whatsapp":
-            confirme = request.POST.get("confirme")
-            if not confirme:
-                return render(request, "boutique/paiement.html", {
-                    "commande": commande,
-                    "total": total,
-                    "error": "⚠️ Vous devez d’abord discuter sur WhatsApp puis cocher la case.",
-                    "whatsapp_numbers": whatsapp_numbers,
-                    "whatsapp_message": whatsapp_message
-                })
-
-            # Créer un paiement WhatsApp
-            Paiement.objects.create(
-                commande=commande,
-                montant=total,
-                methode="orange_money_whatsapp"
-            )
-            commande.est_payee = True
-            commande.statut = "en_attente"
-            commande.save()
-
-            # Vider le panier
-            panier = get_object_or_404(Panier, utilisateur=request.user)
-            panier.lignes.all().delete()
-
-            return redirect("confirmation_commande", commande_id=commande.id)
-
-    # GET → affichage du template
-    return render(request, "boutique/paiement.html", {
-        "commande": commande,
-        "total": total,
-        "whatsapp_numbers": whatsapp_numbers,
-        "whatsapp_message": whatsapp_message
-    })
+    # 🚀 WhatsApp : confirmation obligatoire, le paiement est validé ensuite dans l'admin
+    if passerelle.nom == "whatsapp" and not request.POST.get("confirme"):
+        return await afficher("⚠️ Vous devez d’abord discuter sur WhatsApp puis cocher la case.")
+
+    urls = {
+        "success": request.build_absolute_uri(reverse("paiement_success", args=[commande.id])),
+        "cancel": request.build_absolute_uri(reverse("confirmation_commande", args=[commande.id])),
+        "notify": request.build_absolute_uri(reverse("cinetpay_webhook")),
+    }
+    # Réservations prolongées selon le moyen choisi : une session qui expire (Stripe)
+    # ne survit pas au stock qu'elle vend, une confirmation manuelle (WhatsApp) a le temps d'arriver
+    expire_le = None
+    duree = passerelle.duree_reservation()
+    if duree is not None:
+        expire_le = await sync_to_async(prolonger_reservations)(commande, timezone.now() + duree)
+    try:
+        payment_url = await passerelle.acreer_session(commande, total, urls, expire_le=expire_le)
+    except ErreurPaiement as e:
+        return await afficher(str(e))
+    return redirect(payment_url, code=303) if passerelle.nom == "stripe" else redirect(payment_url)
 
 
 @login_required
 def paiement_success(request, commande_id):
     """
-    Vue appelée après succès Stripe ou CinetPay
+    Retour du navigateur après Stripe ou CinetPay. N'enregistre rien : seul le
+    webhook signé du fournisseur confirme le paiement ; la page de
+    confirmation l'affiche « en attente » jusque-là.
     """
     commande = get_object_or_404(Commande, id=commande_id, utilisateur=request.user)
-    total = sum([ligne.get_total() for ligne in commande.lignes.all()])
+    return redirect("confirmation_commande", commande_id=commande.id)
+
 
-    Paiement.objects.create(
-        commande=commande,
-        montant=total,
-        methode="en_ligne"
-    )
 
-    commande.est_payee = True
-    commande.statut = "en_attente"
-    commande.save()
 
-    panier = get_object_or_404(Panier, utilisateur=request.user)
-    panier.lignes.all().delete()
 
-    return redirect("confirmation_commande", commande_id=commande.id)
 
 
 
+# Webhooks : signature vérifiée, événement enregistré, traitement en arrière-plan
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    try:
+        recevoir_stripe(request.body, request.headers.get("Stripe-Signature"))
+    except (SignatureInvalide, ValueError):
+        return HttpResponse(status=400)
+    return HttpResponse(status=200)
 
 
+@csrf_exempt
+@require_POST
+def cinetpay_webhook(request):
+    try:
+        recevoir_cinetpay(request.POST, request.headers.get("x-token"))
+    except SignatureInvalide:
+        return HttpResponse(status=400)
+    return HttpResponse(status=200)
+
 
 
 
 @login_required
-def confirmation_commande(request, commande_id=None, id=None, pk=None):
+async def confirmation_commande(request, commande_id=None, id=None, pk=None):
     cid = commande_id or id or pk
     if cid is None:
         raise Http404("Commande introuvable")
-    commande = get_object_or_404(Commande, id=cid, utilisateur=request.user)
-    total = sum(l.get_total() for l in commande.lignes.all())
+    user = await aprecharger(request)
+    commande = await aassurer_totaux(await aget_object_or_404(Commande, id=cid, utilisateur=user))
     return render(request, "boutique/confirmation_commande.html", {
         "commande": commande,
-        "total": total,
+        "paiement": await Paiement.objects.filter(commande=commande).afirst() if commande.est_payee else None,
+        "total": commande.sous_total,
     })
 
 
@@ -486,4 +653,10 @@ def contact(request):
             return redirect('contact')
     else:
         form = ContactForm()
-    return render(request, 'contact.html', {'form': form})
\ No newline at end of file
+    return render(request, 'contact.html', {'form': form})
+
+# Métriques par vue, format texte de Prometheus (voir metriques.py)
+def metriques(request):
+    if not acces_autorise(request):
+        return HttpResponse(status=403)
+    return HttpResponse(texte_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
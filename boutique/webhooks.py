@@ -0,0 +1,249 @@
+# boutique/webhooks.py
+"""
+Notifications de paiement Stripe et CinetPay.
+
+La vue ne fait que le strict minimum avant de répondre : vérification de la
+signature puis un INSERT dans EvenementPaiement, dont la contrainte unique
+(fournisseur, evenement_id) écarte les doublons. Le traitement (paiement,
+commande payée, panier vidé) est fait ensuite par la file :
+- "thread"    : un thread d'arrière-plan du processus web (par défaut) ;
+- "worker"    : la commande traiter_evenements_paiement --boucle ;
+- "synchrone" : immédiatement, dans la requête (tests).
+Le traitement est idempotent et monotone : un événement en double, en retard
+ou dans le désordre ne peut ni payer deux fois ni "dé-payer" une commande.
+Un paiement n'est enregistré que si son montant et sa devise sont ceux de la
+commande ; côté CinetPay, dont le x-token ne signe pas cpm_result, le statut
+et le montant sont relus auprès de l'API de vérification.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .commandes import enregistrer_paiement
+from .models import Commande, EvenementPaiement
+from .paiements import ErreurPaiement, get_passerelle
+
+logger = logging.getLogger(__name__)
+
+# Ordre des champs signés par CinetPay dans l'en-tête x-token (HMAC SHA256)
+CHAMPS_TOKEN_CINETPAY = (
+    "cpm_site_id", "cpm_trans_id", "cpm_trans_date", "cpm_amount", "cpm_currency",
+    "signature", "payment_method", "cel_phone_prefix", "cel_phone_num",
+    "cpm_phone_prefixe", "cpm_language", "cpm_version", "cpm_payment_config",
+    "cpm_page_action", "cpm_custom", "cpm_designation", "cpm_error_message",
+)
+
+TYPES_STRIPE_PAYES = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+
+
+class SignatureInvalide(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Vérification des signatures
+# ---------------------------------------------------------------------------
+
+def verifier_stripe(payload, signature):
+    """Vérifie l'en-tête Stripe-Signature et retourne l'événement décodé."""
+    secret = getattr(settings, "STRIPE_WEBHOOK_SECRET", "")
+    if not secret or not signature:
+        raise SignatureInvalide("Signature Stripe absente")
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8")
+    try:
+        stripe.WebhookSignature.verify_header(payload, signature, secret, tolerance=300)
+    except stripe.SignatureVerificationError as e:
+        raise SignatureInvalide(str(e))
+    return json.loads(payload)
+
+
+def token_cinetpay(donnees, secret):
+    message = "".join(str(donnees.get(champ, "")) for champ in CHAMPS_TOKEN_CINETPAY)
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+def verifier_cinetpay(donnees, token):
+    """Vérifie l'en-tête x-token d'une notification CinetPay."""
+    secret = getattr(settings, "CINETPAY_SECRET_KEY", "")
+    if not secret or not token:
+        raise SignatureInvalide("Signature CinetPay absente")
+    if not hmac.compare_digest(token_cinetpay(donnees, secret), token):
+        raise SignatureInvalide("Signature CinetPay invalide")
+    return dict(donnees.items())
+
+
+# ---------------------------------------------------------------------------
+# Réception
+# ---------------------------------------------------------------------------
+
+def recevoir(fournisseur, evenement_id, type_evenement, payload):
+    """
+    Enregistre l'événement s'il est nouveau et le confie à la file.
+    Retourne False pour un doublon (à acquitter quand même).
+    """
+    try:
+        with transaction.atomic():
+            evenement = EvenementPaiement.objects.create(
+                fournisseur=fournisseur,
+                evenement_id=evenement_id,
+                type=type_evenement,
+                payload=payload,
+            )
+    except IntegrityError:
+        return False
+    transaction.on_commit(lambda: file_evenements.soumettre(evenement.id))
+    return True
+
+
+def recevoir_stripe(payload, signature):
+    evenement = verifier_stripe(payload, signature)
+    return recevoir("stripe", evenement["id"], evenement.get("type", ""), evenement)
+
+
+def recevoir_cinetpay(donnees, token):
+    donnees = verifier_cinetpay(donnees, token)
+    # CinetPay renotifie la même transaction à chaque changement d'état :
+    # on déduplique sur (transaction, résultat) pour garder chaque transition.
+    evenement_id = f"{donnees.get('cpm_trans_id', '')}:{donnees.get('cpm_result', '')}"
+    return recevoir("cinetpay", evenement_id, donnees.get("cpm_result", ""), donnees)
+
+
+# ---------------------------------------------------------------------------
+# Traitement
+# ---------------------------------------------------------------------------
+
+def commande_id_stripe(payload):
+    session = payload.get("data", {}).get("object", {})
+    return (session.get("metadata") or {}).get("commande_id")
+
+
+def commande_id_cinetpay(payload):
+    transaction_id = payload.get("cpm_trans_id", "")
+    return transaction_id[3:] if transaction_id.startswith("CMD") else None
+
+
+def analyser(evenement):
+    """
+    Retourne (commande_id, montant, devise, méthode) si l'événement confirme un
+    paiement, sinon None. Une notification CinetPay "00" n'est crue qu'une fois
+    la transaction relue chez CinetPay (ErreurPaiement si l'API ne répond pas).
+    """
+    payload = evenement.payload
+    if evenement.fournisseur == "stripe":
+        session = payload.get("data", {}).get("object", {})
+        if evenement.type in TYPES_STRIPE_PAYES and session.get("payment_status") == "paid":
+            return commande_id_stripe(payload), session.get("amount_total"), session.get("currency"), "carte"
+    elif evenement.fournisseur == "cinetpay":
+        if payload.get("cpm_result") == "00":
+            etat = get_passerelle("cinetpay").verifier_transaction(payload.get("cpm_trans_id", ""))
+            if etat.get("status") == "ACCEPTED":
+                return commande_id_cinetpay(payload), etat.get("amount"), etat.get("currency"), "cinetpay"
+    return None
+
+
+def montant_conforme(commande, montant, devise):
+    """Le paiement porte-t-il exactement sur le total de la commande, dans sa devise ?"""
+    try:
+        montant = Decimal(str(montant))
+    except (InvalidOperation, TypeError):
+        return False
+    return montant == commande.sous_total and str(devise or "").upper() == commande.devise
+
+
+def traiter_evenement(evenement_id):
+    """Traite un événement reçu ; sans effet s'il l'a déjà été."""
+    evenement = EvenementPaiement.objects.filter(id=evenement_id, statut="recu").first()
+    if evenement is None:
+        return
+    # Hors transaction : la vérification CinetPay est un appel réseau
+    try:
+        resultat = analyser(evenement)
+    except ErreurPaiement as e:
+        # L'événement reste "reçu" : le worker le reprendra
+        logger.warning("Paiement %s %s : vérification impossible (%s)",
+                       evenement.fournisseur, evenement.evenement_id, e)
+        return
+
+    with transaction.atomic():
+        evenement = (
+            EvenementPaiement.objects
+            .select_for_update()
+            .filter(id=evenement_id, statut="recu")
+            .first()
+        )
+        if evenement is None:
+            return
+
+        evenement.statut = "ignore"
+        if resultat is not None:
+            commande_id, montant, devise, methode = resultat
+            commande = Commande.objects.filter(id=commande_id).first() if str(commande_id or "").isdigit() else None
+            if commande is None:
+                evenement.statut = "erreur"
+                logger.warning("Paiement %s %s : commande %r introuvable",
+                               evenement.fournisseur, evenement.evenement_id, commande_id)
+            elif not montant_conforme(commande, montant, devise):
+                evenement.statut = "erreur"
+                logger.warning("Paiement %s %s : %s %s reçus pour la commande %s (%s %s attendus)",
+                               evenement.fournisseur, evenement.evenement_id, montant, devise,
+                               commande.id, commande.sous_total, commande.devise)
+            else:
+                enregistrer_paiement(commande, Decimal(str(montant)), methode)
+                evenement.commande = commande
+                evenement.statut = "traite"
+        evenement.traite_le = timezone.now()
+        evenement.save(update_fields=["statut", "commande", "traite_le"])
+
+
+def traiter_en_attente(limite=100):
+    """Traite les événements encore "reçus" (worker ou rattrapage). Retourne leur nombre."""
+    ids = list(
+        EvenementPaiement.objects
+        .filter(statut="recu")
+        .order_by("recu_le", "id")
+        .values_list("id", flat=True)[:limite]
+    )
+    for evenement_id in ids:
+        traiter_evenement(evenement_id)
+    return len(ids)
+
+
+class FileEvenements:
+    """Confie le traitement des événements selon PAIEMENT_WEBHOOK_FILE."""
+
+    def __init__(self):
+        self.executor = None
+
+    def mode(self):
+        return getattr(settings, "PAIEMENT_WEBHOOK_FILE", "thread")
+
+    def soumettre(self, evenement_id):
+        mode = self.mode()
+        if mode == "synchrone":
+            traiter_evenement(evenement_id)
+        elif mode == "thread":
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhooks")
+            self.executor.submit(self.traiter_en_arriere_plan, evenement_id)
+        # mode "worker" : la commande traiter_evenements_paiement s'en charge
+
+    def traiter_en_arriere_plan(self, evenement_id):
+        try:
+            traiter_evenement(evenement_id)
+        except Exception:
+            # L'événement reste "reçu" : le worker le reprendra
+            logger.exception("Échec du traitement de l'événement de paiement %s", evenement_id)
+        finally:
+            close_old_connections()
+
+
+file_evenements = FileEvenements()
@@ -0,0 +1,49 @@
+"""
+Lancement ASGI avec uvicorn : python -m ecommerce.serveur
+
+Les vues async (catalogue, fiche produit, panier, confirmation) tournent dans
+la boucle d'événements ; les autres vues passent par les threads d'asgiref.
+Réglages par variables d'environnement, comme settings.py.
+"""
+import os
+
+from decouple import config
+
+
+def options():
+    return {
+        "host": config("UVICORN_HOST", default="0.0.0.0"),
+        "port": config("PORT", default=8000, cast=int),
+        # Un processus par cœur, chacun avec sa boucle d'événements
+        "workers": config("UVICORN_WORKERS", default=os.cpu_count() or 1, cast=int),
+        # uvloop et httptools s'ils sont installés
+        "loop": "auto",
+        "http": "auto",
+        # Django ne gère pas le protocole lifespan
+        "lifespan": "off",
+        # Au-delà, 503 immédiat plutôt qu'une file d'attente sans fin. Les
+        # WebSockets inactifs comptent : prévoir ~10 000 connexions par nœud
+        # (et un `ulimit -n` en conséquence)
+        "limit_concurrency": config("UVICORN_LIMIT_CONCURRENCY", default=12000, cast=int),
+        "backlog": config("UVICORN_BACKLOG", default=2048, cast=int),
+        "timeout_keep_alive": config("UVICORN_KEEP_ALIVE", default=5, cast=int),
+        # WebSockets (voir boutique/consumers.py) : messages clients minuscules,
+        # ping espacé, et pas de compression (un contexte deflate par connexion
+        # coûte plus que tout le reste d'une connexion inactive)
+        "ws": "websockets",
+        "ws_max_size": 16 * 1024,
+        "ws_ping_interval": config("UVICORN_WS_PING", default=30, cast=float),
+        "ws_ping_timeout": config("UVICORN_WS_PING", default=30, cast=float),
+        "ws_per_message_deflate": False,
+        # Derrière le proxy de l'hébergeur : IP et schéma réels du client
+        "proxy_headers": True,
+        "forwarded_allow_ips": config("FORWARDED_ALLOW_IPS", default="*"),
+        "access_log": config("UVICORN_ACCESS_LOG", default=False, cast=bool),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecommerce.settings")
+    uvicorn.run("ecommerce.asgi:application", **options())
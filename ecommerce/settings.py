@@ -29,11 +29,14 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # recherche trigramme (pg_trgm)
     "boutique",  # ton application
 ]
 
 # Middleware
 MIDDLEWARE = [
+    # En tête : la durée mesurée couvre tout le traitement de la requête
+    "boutique.metriques.metriques_middleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -48,7 +51,8 @@ ROOT_URLCONF = "ecommerce.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates, avec le temps de rendu compté par vue (boutique/metriques.py)
+        "BACKEND": "boutique.metriques.DjangoTemplatesMesures",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -65,6 +69,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "ecommerce.wsgi.application"
+# Déploiement ASGI (uvicorn, voir ecommerce/serveur.py) : vues async du catalogue et du panier
+ASGI_APPLICATION = "ecommerce.asgi.application"
 
 
 
@@ -117,6 +123,118 @@ else:
 # Default primary key
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Nombre de produits par page du catalogue (pagination par curseur)
+CATALOGUE_PAGE_SIZE = config("CATALOGUE_PAGE_SIZE", default=24, cast=int)
+
+# Nombre d'avis par page sur la fiche produit
+AVIS_PAGE_SIZE = config("AVIS_PAGE_SIZE", default=5, cast=int)
+
+# Nombre maximum de résultats classés renvoyés par la recherche
+RECHERCHE_MAX_RESULTATS = config("RECHERCHE_MAX_RESULTATS", default=500, cast=int)
+
+# Durée de réservation du stock entre la commande et le paiement
+RESERVATION_TTL_MINUTES = config("RESERVATION_TTL_MINUTES", default=30, cast=int)
+
+# Réservation prolongée quand le paiement est confirmé à la main (Orange Money via WhatsApp)
+PAIEMENT_MANUEL_RESERVATION_HEURES = config("PAIEMENT_MANUEL_RESERVATION_HEURES", default=24, cast=int)
+
+# Devise des commandes (code ISO 4217), enregistrée sur chaque commande
+DEVISE = config("DEVISE", default="XOF")
+
+# Cache : Redis si REDIS_URL est défini (boutique/cache_redis.py : pool partagé
+# par le processus, msgpack, repli en mémoire locale si Redis tombe), sinon
+# mémoire locale du processus
+REDIS_URL = config("REDIS_URL", default="")
+
+# Connexions Redis au plus par processus ; au-delà, une requête attend une connexion libre
+REDIS_MAX_CONNEXIONS = config("REDIS_MAX_CONNEXIONS", default=50, cast=int)
+
+# Après une erreur de connexion, Redis n'est retenté qu'au bout de ce délai (s)
+REDIS_REPLI_SECONDES = config("REDIS_REPLI_SECONDES", default=10, cast=int)
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "boutique.cache_redis.CacheRedis",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {
+                "serializer": "boutique.cache_redis.SerialiseurMsgpack",
+                "pool_class": "redis.BlockingConnectionPool",
+                "max_connections": REDIS_MAX_CONNEXIONS,
+                "timeout": 2,  # attente d'une connexion libre du pool
+                # Redis absent : échec rapide, puis repli local
+                "socket_connect_timeout": 0.5,
+                "socket_timeout": 0.5,
+                "health_check_interval": 30,
+            },
+        }
+    }
+    # Sessions lues dans Redis (plus de SELECT sur django_session par requête),
+    # toujours écrites en base : rien n'est perdu si Redis est vidé
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Channels (WebSockets temps réel) : Redis en pub/sub si REDIS_URL est défini
+# (une souscription par groupe et par nœud, quel que soit le nombre de
+# connexions), sinon couche en mémoire (un seul processus, tests)
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        }
+    }
+
+# Durée de vie des fragments du catalogue (les versions les invalident avant)
+CATALOGUE_CACHE_TIMEOUT = config("CATALOGUE_CACHE_TIMEOUT", default=3600, cast=int)
+
+# Durée de vie des compteurs de version (un compteur expiré repart d'une valeur neuve)
+CATALOGUE_VERSION_TIMEOUT = config("CATALOGUE_VERSION_TIMEOUT", default=7 * 24 * 3600, cast=int)
+
+# Métriques par vue (/metriques/, format Prometheus) : jeton attendu dans
+# "Authorization: Bearer <jeton>" ; sans jeton, réservées aux comptes staff
+METRIQUES_JETON = config("METRIQUES_JETON", default="")
+
+# Au-delà de ce nombre de requêtes SQL, une requête HTTP est signalée dans les logs
+METRIQUES_BUDGET_SQL = config("METRIQUES_BUDGET_SQL", default=15, cast=int)
+
+# Durée (s) pendant laquelle un proxy / CDN peut resservir une page anonyme du catalogue
+CATALOGUE_HTTP_MAX_AGE = config("CATALOGUE_HTTP_MAX_AGE", default=60, cast=int)
+
+# Identifiant du déploiement, inclus dans les ETags : un nouveau gabarit invalide les pages en cache
+VERSION_DEPLOIEMENT = config("VERSION_DEPLOIEMENT", default=os.environ.get("RAILWAY_GIT_COMMIT_SHA", ""))
+
+# Génération des déclinaisons d'images : "thread", "worker" ou "synchrone"
+IMAGES_DERIVEES_FILE = config("IMAGES_DERIVEES_FILE", default="thread")
+
 
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY")
-STRIPE_PUBLISHABLE_KEY = config("STRIPE_PUBLISHABLE_KEY")
\ No newline at end of file
+STRIPE_PUBLISHABLE_KEY = config("STRIPE_PUBLISHABLE_KEY")
+STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET", default="")
+# Adresse de l'API Stripe (le banc d'essai la remplace par un fournisseur factice)
+STRIPE_API_BASE = config("STRIPE_API_BASE", default="https://api.stripe.com")
+
+CINETPAY_API_KEY = config("CINETPAY_API_KEY", default="")
+CINETPAY_SITE_ID = config("CINETPAY_SITE_ID", default="")
+CINETPAY_SECRET_KEY = config("CINETPAY_SECRET_KEY", default="")  # signature x-token des notifications
+CINETPAY_API_URL = config("CINETPAY_API_URL", default="https://sandbox.cinetpay.com/v1/payment")
+CINETPAY_CHECK_URL = config("CINETPAY_CHECK_URL", default="https://api-checkout.cinetpay.com/v2/payment/check")  # statut relu avant d'enregistrer
+
+# Appels aux fournisseurs de paiement : délai (s) et disjoncteur
+PAIEMENT_TIMEOUT = config("PAIEMENT_TIMEOUT", default=5, cast=float)
+PAIEMENT_DISJONCTEUR_SEUIL = config("PAIEMENT_DISJONCTEUR_SEUIL", default=5, cast=int)
+PAIEMENT_DISJONCTEUR_DELAI = config("PAIEMENT_DISJONCTEUR_DELAI", default=30, cast=int)
+
+# Traitement des webhooks de paiement : "thread", "worker" ou "synchrone"
+PAIEMENT_WEBHOOK_FILE = config("PAIEMENT_WEBHOOK_FILE", default="thread")
\ No newline at end of file